@@ -115,7 +115,7 @@ class CLI:
             
 
     def _get_summary(self) -> None:
-        accts = self._bank.accounts
+        accts = self._bank.snapshot().accounts
         for acct in accts:
             print(acct)
 
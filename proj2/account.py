@@ -14,6 +14,8 @@ from decimal import Decimal
 from datetime import date
 from calendar import monthrange
 from transaction import Transaction
+from snapshot import VersionClock
+from merkle import AccountHashes
 
 class OverdrawError(Exception):
     """Custom exception to handle overdrawn balance errors"""
@@ -31,15 +33,29 @@ class TransactionSequenceError(Exception):
 class Account:
     """Abstract class for account subclasses"""
 
-    def __init__(self, num: int) -> None:
+    def __init__(self, num: int, clock: VersionClock = None) -> None:
         self._num = num
         self._transactions = []
+        self._versions = []
+        self._clock = clock if clock is not None else VersionClock()
+        self._hashes = AccountHashes()
         self._interest_rate = Decimal(0)
         self._exempt_allowed = 1
 
+    def __setstate__(self, state: dict) -> None:
+        """Rebuilds the hash trees of accounts pickled without them"""
+        self.__dict__.update(state)
+        if "_hashes" not in state:
+            self._hashes = AccountHashes()
+            for trans in self._transactions:
+                self._hashes.add(trans.date, trans._amt, trans.is_exempt())
+
     def __str__(self) -> str:
-        """Formats the account's number and balance"""
-        return f"#{self._num:0>9},\tbalance: ${self.balance:,.2f}"
+        return self._describe(self.balance)
+
+    def _describe(self, balance) -> str:
+        """Formats the account's number and the given balance"""
+        return f"#{self._num:0>9},\tbalance: ${balance:,.2f}"
 
     def _get_balance(self) -> Decimal:
         """Calculates the balance for an account by summing its transactions
@@ -70,28 +86,48 @@ class Account:
         # create transaction
         trans = Transaction(amt, date, exempt)
 
-        # check account rules
-        bal_ok = self._check_balance(trans)
-        lim_ok = self._check_limits(trans)
-        seq_ok = self._check_sequence(trans)
-
-        if trans.is_exempt():
-            if seq_ok:
-                self._transactions.append(trans)
-            else:
+        # the rules are checked and the transaction appended as one write
+        # (serialized with other threads' writes by the clock's lock)
+        with self._clock:
+            bal_ok = self._check_balance(trans)
+            lim_ok = self._check_limits(trans)
+            seq_ok = self._check_sequence(trans)
+
+            if trans.is_exempt():
+                if not seq_ok:
+                    raise TransactionSequenceError(self._newest_trans()._date)
+            elif not bal_ok:
+                raise OverdrawError
+            elif not lim_ok:
+                raise TransactionLimitError
+            elif not seq_ok:
                 raise TransactionSequenceError(self._newest_trans()._date)
-        elif not bal_ok:
-            raise OverdrawError
-        elif not lim_ok:
-            raise TransactionLimitError
-        elif not seq_ok:
-            raise TransactionSequenceError(self._newest_trans()._date)
-        else:
-            self._transactions.append(trans)
+
+            self._append(trans)
 
         logging.debug(f"Created transaction, {self._num}, {amt}")
         
 
+    def _append(self, trans: Transaction) -> None:
+        """Appends an accepted transaction stamped with a new version
+        (called inside the clock, which publishes the version on exit,
+        once the transaction is visible)"""
+        version = self._clock.stamp()
+        self._transactions.append(trans)
+        self._versions.append(version)
+        self._hashes.add(trans.date, trans._amt, trans.is_exempt())
+
+    def _get_hashes(self) -> AccountHashes:
+        """Per-month hash trees of the account's transactions"""
+        return self._hashes
+
+    hashes = property(_get_hashes)
+
+    def _get_num(self) -> int:
+        return self._num
+
+    num = property(_get_num)
+
     def _check_balance(self, trans: Transaction) -> bool:
         """Checks whether an incoming transaction overdraws the balance
 
@@ -139,9 +175,11 @@ class Account:
         return date(year, month, day)
 
     def interest_and_fees(self) -> None:
-        """Calculate interest and fees for the account"""
-        self._interest()
-        self._fees()
+        """Calculate interest and fees for the account
+        (published together, so snapshots see both or neither)"""
+        with self._clock:
+            self._interest()
+            self._fees()
 
     def _interest(self) -> None:
         """Calculate interest for the current balance and add
@@ -157,14 +195,14 @@ class Account:
 class SavingsAccount(Account):
     """Account subclass for Savings account"""
 
-    def __init__(self, num: int) -> None:
-        super().__init__(num)
+    def __init__(self, num: int, clock: VersionClock = None) -> None:
+        super().__init__(num, clock)
         self._interest_rate = Decimal('0.029')
         self._day_lim = 2
         self._month_lim = 5
 
-    def __str__(self) -> str:
-        return "Savings" + super().__str__()
+    def _describe(self, balance) -> str:
+        return "Savings" + super()._describe(balance)
 
     def _check_limits(self, trans1: Transaction) -> bool:
         """Checks if incoming transaction is allowed given account limits
@@ -184,15 +222,15 @@ class SavingsAccount(Account):
 class CheckingAccount(Account):
     """Account subclass for Checking account"""
 
-    def __init__(self, num: int) -> None:
-        super().__init__(num)
+    def __init__(self, num: int, clock: VersionClock = None) -> None:
+        super().__init__(num, clock)
         self._interest_rate = Decimal('0.0012')
         self._balance_threshold = Decimal(100)
         self._low_balance_fee = Decimal(-10)
         self._exempt_allowed = 2
 
-    def __str__(self) -> str:
-        return "Checking" + super().__str__()
+    def _describe(self, balance) -> str:
+        return "Checking" + super()._describe(balance)
 
     def _fees(self) -> None:
         """Adds a low-balance fee if balance below threshold"""
@@ -6,6 +6,7 @@ implements Bank class to aggregate Accounts
 
 import logging
 from account import Account, SavingsAccount, CheckingAccount
+from snapshot import VersionClock, BankSnapshot
 
 # constants for pattern matching
 SAVINGS = "savings"
@@ -16,6 +17,19 @@ class Bank:
 
     def __init__(self) -> None:
         self._accounts: dict = {}
+        self._clock = VersionClock()
+        # True while the accounts dict is shared with a snapshot
+        self._shared = False
+
+    def __setstate__(self, state: dict) -> None:
+        """Upgrades banks pickled before snapshots were supported"""
+        self.__dict__.update(state)
+        if "_clock" not in state:
+            self._clock = VersionClock()
+            self._shared = False
+            for acct in self._accounts.values():
+                acct._clock = self._clock
+                acct._versions = [0] * len(acct._transactions)
 
     def add_account(self, acct_type: str) -> Account:
         """Creates and adds an account to the bank
@@ -26,19 +40,24 @@ class Bank:
         Returns:
             Account: Account object created or None if type not matched
         """
-        acct_num = self._generate_account_number()
+        with self._clock:
+            acct_num = self._generate_account_number()
 
-        if acct_type == SAVINGS:
-            acct = SavingsAccount(acct_num)
-        elif acct_type == CHECKING:
-            acct = CheckingAccount(acct_num)
-        else:
-            return None
+            if acct_type == SAVINGS:
+                acct = SavingsAccount(acct_num, self._clock)
+            elif acct_type == CHECKING:
+                acct = CheckingAccount(acct_num, self._clock)
+            else:
+                return None
 
-        logging.debug(f"Created account: {acct_num}")
+            logging.debug(f"Created account: {acct_num}")
 
-        self._accounts[acct_num] = acct
-        return self._accounts.get(acct_num)
+            # copy the accounts dict on the first write after a snapshot
+            if self._shared:
+                self._accounts = dict(self._accounts)
+                self._shared = False
+            self._accounts[acct_num] = acct
+        return acct
 
     def _generate_account_number(self) -> int:
         return len(self._accounts) + 1
@@ -60,4 +79,15 @@ class Bank:
         """
         return self._accounts.get(int(num))
 
+    def snapshot(self) -> BankSnapshot:
+        """Returns a read-only, consistent view of the bank in O(1)
+
+        the view shares the accounts dict (copied by the next add_account)
+        and ignores transactions stamped after the current version, so
+        reports can iterate over it while new transactions keep arriving
+        """
+        with self._clock:
+            self._shared = True
+            return BankSnapshot(self._accounts, self._clock.version)
+
     accounts = property(_get_accounts)
@@ -0,0 +1,304 @@
+"""
+hashtree module
+
+implements the hash trees over bank ledgers of proj2 and proj3, so both
+models hash a ledger identically; each project keeps an identical copy of
+this module (the proj3 tests check that the copies match), since their
+other modules share names and cannot be imported from one path
+
+    transaction: leaf hash of its canonical text
+    month: append-only Merkle tree (RFC 6962 layout) over its leaves
+    account: keyed hash over the roots of its months
+    bank: tree of keyed hashes over the account roots; node (level, prefix)
+        hashes the nodes one level down whose prefix shifted right by
+        FANOUT_BITS is its prefix, so level 0 holds the account roots
+        (prefix = account number) and (DEPTH, 0) is the bank root
+
+two ledgers are compared by diff, which requests the children of the
+nodes that differ from each side level by level (see answer), and the
+leaves of the months that differ last, so the digests exchanged grow with
+the number of differences rather than with the size of the ledgers
+
+a ledger is served to other processes by serve (one JSON request per
+line, answered with one JSON line) and used through a Peer
+"""
+
+# library modules
+import sys
+import json
+import subprocess
+from hashlib import sha256
+from decimal import Decimal, Context, MAX_PREC, ROUND_HALF_UP
+
+CENT = Decimal("0.01")
+
+# rounds any amount to cents exactly, whatever the caller's context
+EXACT = Context(prec=MAX_PREC, rounding=ROUND_HALF_UP)
+
+# hash of a month, account or bank without any transactions
+EMPTY = sha256(b"").digest()
+
+# bits of the account number per level of the bank tree (16 children per
+# node) and levels above the accounts (account numbers below 2 ** 32)
+FANOUT_BITS = 4
+DEPTH = 8
+ROOT = (DEPTH, 0)
+
+
+def canonical(date, amt, exempt) -> str:
+    """Canonical text of a transaction (amount rounded to cents)
+
+    Decimal, int and str amounts are rounded exactly; floats (the Float
+    amounts of old proj3 databases) are read through their shortest repr
+    """
+    if isinstance(amt, float):
+        amt = repr(amt)
+    cents = Decimal(amt).quantize(CENT, context=EXACT)
+    return f"{date.isoformat()}|{cents}|{int(bool(exempt))}"
+
+
+def leaf_hash(text: str) -> bytes:
+    """Hash of a single transaction given its canonical text"""
+    return sha256(b"\x00" + text.encode()).digest()
+
+
+def node_hash(left: bytes, right: bytes) -> bytes:
+    """Hash of an interior node of a tree"""
+    return sha256(b"\x01" + left + right).digest()
+
+
+def tree_hash(leaves: list) -> bytes:
+    """Root of the Merkle tree over a list of leaf hashes"""
+    if not leaves:
+        return EMPTY
+    if len(leaves) == 1:
+        return leaves[0]
+    split = 1 << ((len(leaves) - 1).bit_length() - 1)
+    return node_hash(tree_hash(leaves[:split]), tree_hash(leaves[split:]))
+
+
+def keyed_hash(children: dict) -> bytes:
+    """Hash over the (key, root) pairs of the children of a node"""
+    if not children:
+        return EMPTY
+    digest = sha256(b"\x02")
+    for key in sorted(children):
+        digest.update(f"{key}:".encode() + children[key])
+    return digest.digest()
+
+
+class MerkleTree:
+    """Append-only Merkle tree stored as the roots of its perfect subtrees"""
+
+    def __init__(self, frontier=None, count=0) -> None:
+        # list of (height, hash), heights strictly decreasing
+        self._frontier: list = frontier or []
+        self._count = count
+
+    def append(self, leaf: bytes) -> None:
+        """Adds a leaf, merging perfect subtrees of equal height"""
+        self._frontier.append((0, leaf))
+        self._count += 1
+        while len(self._frontier) > 1 and self._frontier[-1][0] == self._frontier[-2][0]:
+            height, right = self._frontier.pop()
+            _, left = self._frontier.pop()
+            self._frontier.append((height + 1, node_hash(left, right)))
+
+    def _get_root(self) -> bytes:
+        """Root hash (equal to tree_hash over all leaves)"""
+        if not self._frontier:
+            return EMPTY
+        root = self._frontier[-1][1]
+        for _, peak in reversed(self._frontier[:-1]):
+            root = node_hash(peak, root)
+        return root
+
+    root = property(_get_root)
+
+    def _get_count(self) -> int:
+        return self._count
+
+    count = property(_get_count)
+
+
+def child_range(prefix: int) -> tuple:
+    """Returns the first and last prefix of the children of a node"""
+    return prefix << FANOUT_BITS, ((prefix + 1) << FANOUT_BITS) - 1
+
+
+def check_number(num: int) -> int:
+    """Returns an account number that fits the bank tree
+
+    Raises:
+        ValueError: the number is negative or needs more than DEPTH levels
+    """
+    if not 0 <= num < 1 << (FANOUT_BITS * DEPTH):
+        raise ValueError(f"account number {num} does not fit the ledger hash tree")
+    return num
+
+
+def bank_nodes(account_roots: dict) -> dict:
+    """Builds every node of the bank tree over the roots of the accounts
+
+    Args:
+        account_roots (dict): account number -> account root
+
+    Returns:
+        dict: (level, prefix) -> hash, for every level from 0 to DEPTH
+    """
+    level_nodes = {check_number(num): root for num, root in account_roots.items()}
+    nodes = {(0, num): root for num, root in level_nodes.items()}
+    for level in range(1, DEPTH + 1):
+        children: dict = {}
+        for prefix, node in level_nodes.items():
+            children.setdefault(prefix >> FANOUT_BITS, {})[prefix] = node
+        level_nodes = {prefix: keyed_hash(group) for prefix, group in children.items()}
+        nodes.update(((level, prefix), node) for prefix, node in level_nodes.items())
+    return nodes
+
+
+def diff_leaves(left: list, right: list, low=0, high=None) -> list:
+    """Returns the indices at which two lists of leaf hashes differ
+    by descending only into subtrees whose hashes differ"""
+    if high is None:
+        high = max(len(left), len(right))
+    if high <= low or tree_hash(left[low:high]) == tree_hash(right[low:high]):
+        return []
+    if high - low == 1:
+        return [low]
+    split = low + (1 << ((high - low - 1).bit_length() - 1))
+    return diff_leaves(left, right, low, split) + diff_leaves(left, right, split, high)
+
+
+def answer(ledger, request: dict) -> dict:
+    """Answers a request for the digests of a ledger
+
+    Args:
+        ledger: object with the methods
+            root() -> bytes: the bank root
+            children(level, prefix) -> dict: key -> hash of the children of
+                a node (the months of an account for level 0)
+            leaves(num, month) -> list: canonical texts of the transactions
+                of a month of an account, in insertion order
+        request (dict): any of
+            "root": true
+            "children": [[level, prefix], ...]
+            "leaves": [[account number, "YYYY-MM"], ...]
+
+    Returns:
+        dict: hex root, {"level:prefix": {key: hex}} children and
+        {"num:YYYY-MM": [text, ...]} leaves, as requested
+    """
+    response = {}
+    if request.get("root"):
+        response["root"] = ledger.root().hex()
+    if "children" in request:
+        response["children"] = {
+            f"{level}:{prefix}": {str(key): node.hex() for key, node
+                                  in ledger.children(level, prefix).items()}
+            for level, prefix in request["children"]}
+    if "leaves" in request:
+        response["leaves"] = {f"{num}:{month}": ledger.leaves(num, month)
+                              for num, month in request["leaves"]}
+    return response
+
+
+def serve(ledger, infile=sys.stdin, outfile=sys.stdout) -> None:
+    """Answers JSON requests, one per line, until the input is closed"""
+    for line in infile:
+        outfile.write(json.dumps(answer(ledger, json.loads(line))) + "\n")
+        outfile.flush()
+
+
+class Peer:
+    """Client of a ledger served by another process
+
+    constructor args:
+        command (list): command line of a process running serve
+    """
+
+    def __init__(self, command: list) -> None:
+        self._process = subprocess.Popen(command, stdin=subprocess.PIPE,
+                                         stdout=subprocess.PIPE, text=True)
+
+    def request(self, **fields) -> dict:
+        """Sends a request (see answer) and returns the response"""
+        self._process.stdin.write(json.dumps(fields) + "\n")
+        self._process.stdin.flush()
+        line = self._process.stdout.readline()
+        if not line:
+            raise RuntimeError(f"ledger process exited with status {self._process.wait()}")
+        return json.loads(line)
+
+    def close(self) -> None:
+        self._process.stdin.close()
+        self._process.wait()
+
+
+class LocalPeer:
+    """Client of a ledger in this process (same interface as Peer)"""
+
+    def __init__(self, ledger) -> None:
+        self._ledger = ledger
+
+    def request(self, **fields) -> dict:
+        return answer(self._ledger, fields)
+
+    def close(self) -> None:
+        pass
+
+
+def diff(left, right, names=("left", "right")) -> list:
+    """Compares two ledgers top-down and describes every difference
+
+    Args:
+        left (Peer | LocalPeer): first ledger
+        right (Peer | LocalPeer): second ledger
+        names (tuple, default=("left", "right")): names of the ledgers
+
+    Returns:
+        list: human-readable differences (empty if the ledgers match)
+    """
+    if left.request(root=True)["root"] == right.request(root=True)["root"]:
+        return []
+
+    changes, months = [], []
+    nodes = [ROOT]
+    while nodes:
+        request = [list(node) for node in nodes]
+        lefts = left.request(children=request)["children"]
+        rights = right.request(children=request)["children"]
+        differing = []
+        for level, prefix in nodes:
+            key = f"{level}:{prefix}"
+            left_children, right_children = lefts[key], rights[key]
+            for child in sorted(left_children.keys() | right_children.keys(),
+                                key=lambda child: (len(child), child)):
+                if left_children.get(child) == right_children.get(child):
+                    continue
+                if level == 0:
+                    months.append([prefix, child])
+                elif level == 1 and (child not in left_children
+                                     or child not in right_children):
+                    only = names[0] if child in left_children else names[1]
+                    changes.append(f"account {child} only in {only}")
+                else:
+                    differing.append((level - 1, int(child)))
+        nodes = differing
+
+    if not months:
+        return changes
+
+    # the leaves of the differing months only
+    left_leaves = left.request(leaves=months)["leaves"]
+    right_leaves = right.request(leaves=months)["leaves"]
+    for num, month in months:
+        left_texts = left_leaves[f"{num}:{month}"]
+        right_texts = right_leaves[f"{num}:{month}"]
+        for index in diff_leaves([leaf_hash(text) for text in left_texts],
+                                 [leaf_hash(text) for text in right_texts]):
+            left_text = left_texts[index] if index < len(left_texts) else "missing"
+            right_text = right_texts[index] if index < len(right_texts) else "missing"
+            changes.append(f"account {num} {month} transaction {index}: "
+                           f"{left_text} != {right_text}")
+    return changes
@@ -0,0 +1,119 @@
+"""
+merkle module
+
+implements per-account, per-month hash trees over transactions
+
+each month of an account is an append-only Merkle tree (RFC 6962 layout)
+kept as its frontier of perfect subtrees, so adding a transaction costs
+O(log n); the hashing (and the bank tree over the account roots) is in
+the hashtree module, shared with proj3, so comparing two ledgers of
+either model starts with a single hash
+
+usage (served to `verify.py diff` in proj3):
+    python merkle.py digest bank.pickle [--level bank|accounts|months] [--accounts 1,2]
+    python merkle.py serve bank.pickle
+"""
+
+# library modules
+import json
+
+# custom modules
+from hashtree import (EMPTY, ROOT, MerkleTree, bank_nodes, child_range, canonical,
+                      keyed_hash, leaf_hash, serve)
+
+
+class AccountHashes:
+    """Month trees of an account with a cached account root"""
+
+    def __init__(self) -> None:
+        self._months: dict = {}
+        self._root = EMPTY
+
+    def add(self, date, amt, exempt) -> None:
+        """Adds a transaction to the tree of its month"""
+        leaf = leaf_hash(canonical(date, amt, exempt))
+        self._months.setdefault(date.strftime("%Y-%m"), MerkleTree()).append(leaf)
+        self._root = None
+
+    def _get_root(self) -> bytes:
+        if self._root is None:
+            self._root = keyed_hash(self.month_roots())
+        return self._root
+
+    root = property(_get_root)
+
+    def month_roots(self) -> dict:
+        """Returns the root of each month, keyed by YYYY-MM"""
+        return {month: tree.root for month, tree in self._months.items()}
+
+
+class BankLedger:
+    """Digests of the ledger of a bank (see hashtree.answer)"""
+
+    def __init__(self, bank) -> None:
+        self._bank = bank
+        self._nodes = bank_nodes({acct.num: acct.hashes.root for acct in bank.accounts})
+
+    def root(self) -> bytes:
+        return self._nodes.get(ROOT, EMPTY)
+
+    def children(self, level: int, prefix: int) -> dict:
+        if level == 0:
+            acct = self._bank.get_account(prefix)
+            return acct.hashes.month_roots() if acct else {}
+        first, last = child_range(prefix)
+        return {child: self._nodes[level - 1, child] for child in range(first, last + 1)
+                if (level - 1, child) in self._nodes}
+
+    def leaves(self, num: int, month: str) -> list:
+        acct = self._bank.get_account(num)
+        return [canonical(t.date, t._amt, t.is_exempt())
+                for t in (acct._transactions if acct else [])
+                if t.date.strftime("%Y-%m") == month]
+
+
+def digest(ledger: BankLedger, level="bank", only=None) -> dict:
+    """Builds a JSON-serializable digest of a ledger
+
+    Args:
+        ledger (BankLedger): ledger of a bank
+        level (str, default="bank"): "bank", "accounts" or "months"
+        only (set, default=None): account numbers to include below bank level
+
+    Returns:
+        dict: hex roots down to the requested level
+    """
+    result = {"root": ledger.root().hex()}
+    nums = [num for (node_level, num) in ledger._nodes if node_level == 0
+            and (only is None or num in only)]
+    if level in ("accounts", "months"):
+        result["accounts"] = {str(num): ledger._nodes[0, num].hex() for num in nums}
+    if level == "months":
+        result["months"] = {str(num): {month: root.hex() for month, root
+                                       in ledger.children(0, num).items()}
+                            for num in nums}
+    return result
+
+
+if __name__ == "__main__":
+    from pickle import load
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Digests of the ledger of a pickled bank")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    digest_parser = subparsers.add_parser("digest", help="print the digest of the ledger")
+    digest_parser.add_argument("pickle")
+    digest_parser.add_argument("--level", choices=["bank", "accounts", "months"], default="bank")
+    digest_parser.add_argument("--accounts", help="comma-separated account numbers")
+    serve_parser = subparsers.add_parser("serve", help="answer digest requests on stdin")
+    serve_parser.add_argument("pickle")
+    args = parser.parse_args()
+
+    with open(args.pickle, "rb") as file:
+        bank_ledger = BankLedger(load(file))
+
+    if args.command == "serve":
+        serve(bank_ledger)
+    else:
+        selected = {int(num) for num in args.accounts.split(",")} if args.accounts else None
+        print(json.dumps(digest(bank_ledger, args.level, selected)))
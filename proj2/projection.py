@@ -0,0 +1,228 @@
+"""
+projection module
+
+implements a Monte-Carlo projection of account balances
+
+simulates many stochastic deposit/withdrawal paths for an account type
+at once with NumPy (one array element per path) and applies the rules of
+SavingsAccount and CheckingAccount: overdraft rejection, savings day and
+month limits, month-end interest on the balance and the checking
+low-balance fee; the rule parameters are read from the account classes
+
+as with Account.interest_and_fees, interest in a month without accepted
+transactions is dated at the end of the previous month, so it is only
+added while that date has fewer exempt transactions than allowed
+
+usage:
+    python projection.py savings --paths 200000 --months 36
+"""
+
+# library modules
+from calendar import monthrange
+from collections import namedtuple
+from datetime import date
+
+# numerical modules
+import numpy as np
+
+# custom modules
+from account import SavingsAccount, CheckingAccount
+
+ACCOUNT_TYPES = {
+    "savings": SavingsAccount,
+    "checking": CheckingAccount,
+}
+
+# shape of the lognormal amounts (scaled to the configured means)
+SIGMA = 0.75
+
+Projection = namedtuple("Projection", ["balances", "overdrafts", "limits"])
+
+
+class BalanceProjection:
+    """Projects balances of one account type over many random paths
+
+    constructor args:
+        acct_type (str): "savings" or "checking"
+        initial (float): initial deposit of every path
+        monthly_rate (float): mean number of attempted transactions per month
+        deposit_share (float): fraction of attempted transactions that are deposits
+        deposit_mean (float): mean deposit amount
+        withdrawal_mean (float): mean withdrawal amount
+        max_per_month (int): cap on attempted transactions per month
+    """
+
+    def __init__(self, acct_type: str, initial=500.0, monthly_rate=6.0,
+                 deposit_share=0.5, deposit_mean=200.0, withdrawal_mean=180.0,
+                 max_per_month=30) -> None:
+        acct = ACCOUNT_TYPES[acct_type](0)
+
+        self._interest_rate = float(acct._interest_rate)
+        self._day_lim = getattr(acct, "_day_lim", None)
+        self._month_lim = getattr(acct, "_month_lim", None)
+        self._balance_threshold = float(getattr(acct, "_balance_threshold", 0))
+        self._low_balance_fee = float(getattr(acct, "_low_balance_fee", 0))
+        self._charges_fee = hasattr(acct, "_low_balance_fee")
+        self._exempt_allowed = acct._exempt_allowed
+
+        self._initial = initial
+        self._monthly_rate = monthly_rate
+        self._deposit_share = deposit_share
+        self._deposit_mean = deposit_mean
+        self._withdrawal_mean = withdrawal_mean
+        self._max_per_month = max_per_month
+
+    def run(self, paths: int, months: int, seed=0, start=date(2023, 1, 1)) -> Projection:
+        """Simulates the given number of paths
+
+        Args:
+            paths (int): number of simulated accounts
+            months (int): number of months to simulate
+            seed (int, default=0): seed for the random number generator
+            start (date, default=2023-01-01): first month of the projection
+                (the initial deposit is made on its first day)
+
+        Returns:
+            Projection: month-end balances (months x paths) and the number
+                of overdraft and limit rejections per path
+        """
+        rng = np.random.default_rng(seed)
+        balance = np.full(paths, self._initial)
+        balances = np.empty((months, paths))
+        overdrafts = np.zeros(paths, dtype=np.int64)
+        limits = np.zeros(paths, dtype=np.int64)
+
+        # exempt transactions on the newest date of each path
+        exempt = np.zeros(paths, dtype=np.int64)
+
+        year, month = start.year, start.month
+        for index in range(months):
+            days = monthrange(year, month)[1]
+            accepted = self._month(rng, balance, days, overdrafts, limits, opening=index == 0)
+
+            # month-end interest, then the fee on the balance including interest
+            # (a fee is only attempted once the interest was added)
+            idle = accepted == 0
+            exempt[~idle] = 0
+            interest_ok = exempt < self._exempt_allowed
+            balance += np.where(interest_ok, balance * self._interest_rate, 0.0)
+            exempt += interest_ok
+            if self._charges_fee:
+                fee_ok = (interest_ok & (balance < self._balance_threshold)
+                          & (exempt < self._exempt_allowed))
+                balance += np.where(fee_ok, self._low_balance_fee, 0.0)
+                exempt += fee_ok
+
+            balances[index] = balance
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+        return Projection(balances, overdrafts, limits)
+
+    def _month(self, rng, balance, days, overdrafts, limits, opening=False):
+        """Applies one month of attempted transactions to every path in place
+        (in the opening month the initial deposit counts towards the limits)
+
+        Returns:
+            ndarray: transactions accepted in the month by each path
+        """
+        paths = balance.shape[0]
+
+        counts = np.minimum(rng.poisson(self._monthly_rate, paths), self._max_per_month)
+        slots = int(counts.max(initial=0))
+
+        # one row per slot so that each step works on contiguous memory;
+        # attempted transactions are in chronological order within each path
+        # (days only matter for the savings day limit, so they are only
+        # drawn when the account type has one)
+        active = np.arange(slots)[:, None] < counts
+        when = np.zeros((slots, paths), dtype=np.int8)
+        if self._day_lim is not None:
+            when = draw_days(rng, counts, slots, days)
+
+        # amounts are i.i.d., so they are only drawn for attempted slots
+        attempted = int(counts.sum())
+        deposit = rng.random(attempted, dtype=np.float32) < self._deposit_share
+        size = np.where(deposit, self._deposit_mean * 100, -self._withdrawal_mean * 100)
+        lognormal = np.exp(rng.standard_normal(attempted, dtype=np.float32) * SIGMA
+                           - SIGMA ** 2 / 2)
+        amounts = np.zeros((slots, paths))
+        amounts[active] = np.rint(lognormal * size) / 100
+
+        same_day = np.full(paths, int(opening))
+        same_month = np.full(paths, int(opening))
+        previous_day = np.full(paths, int(opening), dtype=np.int8)
+
+        for amt, day, attempted in zip(amounts, when, active):
+            same_day *= day == previous_day
+            previous_day = day
+
+            # same order of checks as Account.add_transaction
+            bal_ok = (amt >= 0) | (balance > -amt)
+            if self._day_lim is None:
+                lim_ok = True
+            else:
+                lim_ok = (same_day < self._day_lim) & (same_month < self._month_lim)
+
+            accepted = attempted & bal_ok & lim_ok
+            overdrafts += attempted & ~bal_ok
+            limits += attempted & bal_ok & ~lim_ok
+
+            balance += np.where(accepted, amt, 0.0)
+            same_day += accepted
+            same_month += accepted
+
+        return same_month
+
+
+def draw_days(rng, counts, slots: int, days: int):
+    """Draws a uniform day for each attempted transaction of every path
+
+    the attempted transactions of a path are its first counts[path] slots;
+    the other slots get days + 1 before each path is sorted, so the sorted
+    active slots hold exactly the days drawn for them
+
+    Returns:
+        ndarray: days (slots x paths), chronological within each path
+    """
+    paths = counts.shape[0]
+    when = rng.integers(1, days + 1, (paths, slots), dtype=np.int8)
+    when[np.arange(slots) >= counts[:, None]] = days + 1
+    return np.ascontiguousarray(np.sort(when, axis=1).T)
+
+
+def summarize(projection: Projection, paths: int) -> str:
+    """Formats month-end balance percentiles and rejection rates"""
+    lines = [f"{'month':>5}{'p5':>12}{'p50':>12}{'p95':>12}{'mean':>12}"]
+    for index, balances in enumerate(projection.balances, start=1):
+        p5, p50, p95 = np.percentile(balances, [5, 50, 95])
+        lines.append(f"{index:>5}{p5:>12,.2f}{p50:>12,.2f}{p95:>12,.2f}{balances.mean():>12,.2f}")
+    lines.append(f"overdraft rejections per path: {projection.overdrafts.sum() / paths:.2f}")
+    lines.append(f"limit rejections per path: {projection.limits.sum() / paths:.2f}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    import time
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Project account balances with Monte-Carlo paths")
+    parser.add_argument("type", choices=list(ACCOUNT_TYPES))
+    parser.add_argument("--paths", type=int, default=100000)
+    parser.add_argument("--months", type=int, default=36)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--initial", type=float, default=500.0)
+    parser.add_argument("--monthly-rate", type=float, default=6.0)
+    parser.add_argument("--deposit-mean", type=float, default=200.0)
+    parser.add_argument("--withdrawal-mean", type=float, default=180.0)
+    args = parser.parse_args()
+
+    began = time.perf_counter()
+    result = BalanceProjection(args.type,
+                               initial=args.initial,
+                               monthly_rate=args.monthly_rate,
+                               deposit_mean=args.deposit_mean,
+                               withdrawal_mean=args.withdrawal_mean).run(args.paths,
+                                                                         args.months,
+                                                                         args.seed)
+    print(summarize(result, args.paths))
+    print(f"{args.paths:,} paths x {args.months} months in {time.perf_counter() - began:.2f}s")
@@ -0,0 +1,120 @@
+"""
+snapshot module
+
+implements read-only, point-in-time views of a Bank
+
+every transaction added to an account is stamped with a version from the
+bank's VersionClock; a snapshot only records the newest published version
+(and shares the bank's account dict copy-on-write), so taking one is O(1)
+and its views ignore any transaction stamped after it was taken
+
+writers may run on several threads: every write holds the clock's lock
+from its stamp until its transaction is appended and published
+"""
+
+import threading
+from bisect import bisect_right
+
+
+class VersionClock:
+    """Monotonic version counter shared by a bank and its accounts
+
+    versions are stamped first and published afterwards, so a snapshot
+    never sees a version whose transaction is still being appended;
+    using the clock as a context manager holds its (reentrant) lock, so a
+    write is serialized with other threads' writes and snapshots, and
+    publishes the group of stamps made inside it at once
+    """
+
+    def __init__(self) -> None:
+        self.version = 0
+        self._next = 0
+        self._depth = 0
+        self._lock = threading.RLock()
+
+    def __getstate__(self) -> dict:
+        """Pickles the counters without the lock"""
+        state = self.__dict__.copy()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state: dict) -> None:
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+    def stamp(self) -> int:
+        """Returns the next (unpublished) version"""
+        with self._lock:
+            self._next += 1
+            return self._next
+
+    def publish(self) -> None:
+        """Makes all stamped versions visible to new snapshots"""
+        with self._lock:
+            if self._depth == 0:
+                self.version = self._next
+
+    def __enter__(self):
+        self._lock.acquire()
+        self._depth += 1
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._depth -= 1
+        self.publish()
+        self._lock.release()
+
+
+class AccountSnapshot:
+    """Read-only view of an account as of a given version"""
+
+    def __init__(self, account, version: int) -> None:
+        self._account = account
+        self._version = version
+
+    def __str__(self) -> str:
+        return self._account._describe(self.balance)
+
+    def _visible(self) -> list:
+        """Returns the transactions stamped at or before the snapshot"""
+        cut = bisect_right(self._account._versions, self._version)
+        return self._account._transactions[:cut]
+
+    def _get_balance(self):
+        return sum(x for x in self._visible())
+
+    balance = property(_get_balance)
+
+    def _get_transactions(self) -> list:
+        return sorted(self._visible())
+
+    transactions = property(_get_transactions)
+
+    def _get_num(self) -> int:
+        return self._account._num
+
+    num = property(_get_num)
+
+
+class BankSnapshot:
+    """Read-only view of a bank as of a given version"""
+
+    def __init__(self, accounts: dict, version: int) -> None:
+        self._accounts = accounts
+        self._version = version
+
+    def _get_version(self) -> int:
+        return self._version
+
+    version = property(_get_version)
+
+    def _get_accounts(self) -> list:
+        """Returns views of the accounts that existed at the snapshot"""
+        return [AccountSnapshot(acct, self._version) for acct in self._accounts.values()]
+
+    accounts = property(_get_accounts)
+
+    def get_account(self, num: str) -> AccountSnapshot:
+        """Returns a view of the account with the given number or None"""
+        acct = self._accounts.get(int(num))
+        return None if acct is None else AccountSnapshot(acct, self._version)
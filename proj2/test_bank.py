@@ -0,0 +1,189 @@
+"""
+testing module for the bank modules 'bank.py', 'account.py', 'snapshot.py',
+'merkle.py', 'hashtree.py'
+and 'projection.py'
+"""
+
+# library modules
+import pickle
+import threading
+from decimal import Decimal
+from datetime import date
+from calendar import monthrange
+
+# testing modules
+import pytest
+
+# numerical modules
+import numpy as np
+
+# under-test modules
+from bank import Bank, SAVINGS, CHECKING
+from account import OverdrawError, TransactionLimitError, TransactionSequenceError
+from snapshot import AccountSnapshot
+from merkle import AccountHashes, BankLedger
+from hashtree import LocalPeer, canonical, diff, leaf_hash
+from projection import SIGMA, BalanceProjection, draw_days
+
+
+@pytest.fixture
+def bank():
+    return Bank()
+
+
+class TestSnapshots:
+
+    def test_snapshot_ignores_later_writes(self, bank):
+        acct = bank.add_account(CHECKING)
+        acct.add_transaction("100", date="2023-01-02")
+        snap = bank.snapshot()
+
+        acct.add_transaction("50", date="2023-01-03")
+        acct.interest_and_fees()
+        bank.add_account(SAVINGS).add_transaction("10", date="2023-01-03")
+
+        assert [view.balance for view in snap.accounts] == [Decimal("100")]
+        assert [str(trans) for trans in snap.get_account(1).transactions] == ["2023-01-02, $100.00"]
+        assert snap.get_account(2) is None
+        assert len(bank.accounts) == 2 and acct.balance > 150
+
+    def test_balance_at_each_version(self, bank):
+        acct = bank.add_account(CHECKING)
+        other = bank.add_account(CHECKING)
+        expected = {bank.snapshot().version: Decimal(0)}
+        for day, amt in enumerate(("100", "-30", "5.25", "12"), start=2):
+            acct.add_transaction(amt, date=f"2023-01-{day:02}")
+            expected[bank.snapshot().version] = acct.balance
+            other.add_transaction("1", date=f"2023-01-{day:02}")  # versions between acct's
+
+        for version in range(max(expected) + 1):
+            balance = expected[max(known for known in expected if known <= version)]
+            assert AccountSnapshot(acct, version).balance == balance
+
+    def test_concurrent_writers(self, bank):
+        accts = [bank.add_account(CHECKING) for _ in range(8)]
+        snap = bank.snapshot()
+
+        def write(acct):
+            for day in range(1, 29):
+                acct.add_transaction("1", date=f"2023-02-{day:02}")
+
+        threads = [threading.Thread(target=write, args=(acct,)) for acct in accts]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        # every write got its own version, in the order of its account's writes
+        versions = [version for acct in accts for version in acct._versions]
+        assert sorted(versions) == list(range(1, len(versions) + 1))
+        assert all(acct._versions == sorted(acct._versions) for acct in accts)
+        assert bank.snapshot().version == len(versions)
+        assert all(view.balance == 0 for view in snap.accounts)
+
+    def test_pickle(self, bank):
+        bank.add_account(SAVINGS).add_transaction("20", date="2023-01-02")
+        copy = pickle.loads(pickle.dumps(bank))
+        copy.get_account(1).add_transaction("5", date="2023-01-03")
+        assert copy.snapshot().get_account(1).balance == Decimal("25")
+
+
+def pinned_ledger(bank) -> Bank:
+    """Adds the ledger whose root is pinned (also by the proj3 tests)"""
+    acct = bank.add_account(CHECKING)
+    acct.add_transaction("100", date="2023-01-02")
+    acct.add_transaction("-20.5", date="2023-01-15")
+    acct.interest_and_fees()
+    bank.add_account(SAVINGS).add_transaction("50", date="2023-02-01")
+    return bank
+
+
+class TestLedgerHashes:
+
+    PINNED_ROOT = "c698efa5361b5d34a096d5a4c2c02a939ac568c0d4de5feb4cfcc070cd805b8b"
+
+    def diff(self, left, right) -> list:
+        return diff(LocalPeer(BankLedger(left)), LocalPeer(BankLedger(right)))
+
+    def test_pinned_root(self, bank):
+        assert BankLedger(pinned_ledger(bank)).root().hex() == self.PINNED_ROOT
+
+    def test_equal_ledgers(self, bank):
+        assert self.diff(pinned_ledger(bank), pinned_ledger(Bank())) == []
+
+    def test_changed_leaf(self, bank):
+        other = pinned_ledger(Bank())
+        acct = other.get_account(1)
+        acct._transactions[1]._amt = Decimal("-20.25")  # tampered, then rehashed
+        acct._hashes = AccountHashes()
+        for trans in acct._transactions:
+            acct._hashes.add(trans.date, trans._amt, trans.is_exempt())
+        assert self.diff(pinned_ledger(bank), other) == [
+            "account 1 2023-01 transaction 1: 2023-01-15|-20.50|0 != 2023-01-15|-20.25|0"]
+
+    def test_large_amounts_are_exact(self):
+        day = date(2023, 1, 2)
+        cents = 2 ** 53 + 1  # not representable as a float
+        texts = [canonical(day, Decimal(f"{amount}E-2"), False)
+                 for amount in (cents, cents + 1)]
+        assert texts == ["2023-01-02|90071992547409.93|0", "2023-01-02|90071992547409.94|0"]
+        assert leaf_hash(texts[0]) != leaf_hash(texts[1])
+        assert canonical(day, Decimal("0.015"), True) == canonical(day, 0.015, True) == \
+            "2023-01-02|0.02|1"
+
+    def test_extra_month(self, bank):
+        other = pinned_ledger(Bank())
+        other.get_account(2).add_transaction("7", date="2023-03-01")
+        assert self.diff(pinned_ledger(bank), other) == [
+            "account 2 2023-03 transaction 0: missing != 2023-03-01|7.00|0"]
+
+
+class TestProjection:
+
+    def test_active_days_are_uniform(self):
+        rng = np.random.default_rng(0)
+        counts = np.minimum(rng.poisson(6.0, 50000), 30)
+        when = draw_days(rng, counts, int(counts.max()), 31)
+        active = np.arange(when.shape[0])[:, None] < counts
+        assert abs(when[active].mean() - 16) < 0.1
+        assert (np.diff(when, axis=0)[active[1:]] >= 0).all()
+
+    def replay(self, acct_type: str, paths: int, months: int, rate: float, seed=1):
+        """Draws the projection's transactions with a separate generator and
+        applies them through real accounts; returns the final balances and
+        the overdraft and limit rejections of every path"""
+        rng = np.random.default_rng(seed)
+        results = []
+        for _ in range(paths):
+            acct = Bank().add_account(acct_type)
+            acct.add_transaction("500", date="2023-01-01")
+            overdrafts = limits = 0
+            for month in range(1, months + 1):
+                days = monthrange(2023, month)[1]
+                for day in sorted(rng.integers(1, days + 1, min(rng.poisson(rate), 30))):
+                    size = 200 if rng.random() < 0.5 else -180
+                    amount = round(float(np.exp(rng.standard_normal() * SIGMA
+                                                - SIGMA ** 2 / 2)) * size, 2)
+                    try:
+                        acct.add_transaction(f"{amount:.2f}",
+                                             date=date(2023, month, day).isoformat())
+                    except OverdrawError:
+                        overdrafts += 1
+                    except TransactionLimitError:
+                        limits += 1
+                try:
+                    acct.interest_and_fees()
+                except TransactionSequenceError:
+                    pass  # interest of a month without transactions, already added
+            results.append((float(acct.balance), overdrafts, limits))
+        return np.array(results)
+
+    @pytest.mark.parametrize("acct_type", [SAVINGS, CHECKING])
+    def test_mean_matches_replay(self, acct_type):
+        # few transactions a month, so months without any are common
+        projection = BalanceProjection(acct_type, monthly_rate=3.0).run(40000, 4)
+        projected = (projection.balances[-1], projection.overdrafts, projection.limits)
+        replayed = self.replay(acct_type, 3000, 4, 3.0)
+        for values, exact in zip(projected, replayed.T):
+            error = np.hypot(values.std() / len(values) ** 0.5, exact.std() / len(exact) ** 0.5)
+            assert abs(values.mean() - exact.mean()) <= 4 * error + 1e-9
@@ -2,22 +2,23 @@
 BankCLI module
 
 implements CLI for Bank interface
+
+the menu is printed while the database opens in the background (see
+startup module); SQLAlchemy and the models are only imported there
 """
 
 # library modules
 import sys
 import logging
+from argparse import ArgumentParser
+from contextlib import nullcontext
 from decimal import Decimal, InvalidOperation
 from datetime import datetime
 
-# SQL modules
-from sqlalchemy import create_engine
-from sqlalchemy.orm.session import sessionmaker
-
 # custom modules
-from db import Base, DATABASE
-from bank import Bank
-from account import Account, OverdrawError, TransactionLimitError, TransactionSequenceError
+from settings import DATABASE, PROFILES
+from startup import Startup
+from errors import OverdrawError, TransactionLimitError, TransactionSequenceError
 
 # configure the logging module
 logging.basicConfig(filename="bank.log",
@@ -29,20 +30,15 @@ logging.basicConfig(filename="bank.log",
 class CLI:
     """Display a CLI and respond to commands"""
 
-    def __init__(self) -> None:
-
-        self._session = Session()
+    def __init__(self, startup: Startup) -> None:
 
-        self._bank: Bank = self._session.query(Bank).first()
-        if self._bank is None:
-            self._bank = Bank()
-            self._session.add(self._bank)
-            self._session.commit()
-            logging.debug("Saved to bank.db")
-        else:
-            logging.debug("Loaded from bank.db")
+        # session, bank and instrumentation are loaded by the first command
+        self._startup = startup
+        self._session = None
+        self._bank = None
+        self._instrumentation = None
 
-        self._account: Account = None
+        self._account = None
 
         self._choices = {
             "1": self._add_account,
@@ -63,13 +59,40 @@ class CLI:
                 self._print_choices()
                 choice = self._parse_input()
                 action = self._choices.get(choice)
-                action()
+                if action not in (None, self._quit):
+                    self._open()
+                with self._trace(action):
+                    action()
         except Exception as err:
             print("Sorry! Something unexpected happened. "
                   "If this problem persists please contact "
                   "our support team for assistance.")
             logging.error(f"{type(err).__name__}: {repr(str(err))}")
 
+    def _open(self) -> None:
+        """Loads the bank once the database is open (first command only)"""
+        if self._bank is not None:
+            return
+        from bank import Bank
+
+        self._session = self._startup.session()
+        self._instrumentation = self._startup.instrumentation
+
+        self._bank = self._session.query(Bank).first()
+        if self._bank is None:
+            self._bank = Bank()
+            self._session.add(self._bank)
+            self._session.commit()
+            logging.debug("Saved to bank.db")
+        else:
+            logging.debug("Loaded from bank.db")
+
+    def _trace(self, action):
+        """Records the SQL of a command (when instrumented)"""
+        if self._instrumentation is None or action is None:
+            return nullcontext()
+        return self._instrumentation.command(action.__name__.strip("_").replace("_", " "))
+
     def _print_choices(self) -> None:
         print("--------------------------------")
         print(f"Currently selected account: {self._account}")
@@ -119,9 +142,8 @@ class CLI:
             print("Account cannot be created with a negative initial balance.")
 
     def _get_summary(self) -> None:
-        accts = self._bank.accounts
-        for acct in accts:
-            print(acct)
+        for row in self._bank.summary():
+            print(row)
 
     def _set_account(self) -> None:
         acct_num = self._parse_input("Enter account number",
@@ -132,12 +154,14 @@ class CLI:
 
     def _get_transactions(self) -> None:
         try:
-            transactions = sorted(self._account.transactions)
+            pages = self._account.pages()
         except AttributeError:
             print("This command requires that you first select an account.")
         else:
-            for transaction in transactions:
-                print(transaction)
+            # one keyset page in memory at a time
+            for page in pages:
+                for transaction in page:
+                    print(transaction)
 
     def _add_transaction(self) -> None:
         # get amount for transaction
@@ -181,10 +205,15 @@ class CLI:
         sys.exit(0)
 
 if __name__ == "__main__":
-    engine = create_engine(DATABASE)
-    Base.metadata.create_all(engine)
-
-    Session = sessionmaker()
-    Session.configure(bind=engine)
-
-    CLI()
+    parser = ArgumentParser()
+    parser.add_argument("--profile", choices=list(PROFILES), default="default",
+                        help="SQLite storage profile (default: SQLite defaults)")
+    parser.add_argument("--instrument", nargs="?", const="-", metavar="FILE",
+                        help="report the SQL of each command (to FILE or stdout)")
+    args = parser.parse_args()
+
+    startup = Startup(DATABASE, args.profile, args.instrument)
+    try:
+        CLI(startup)
+    finally:
+        startup.close()
@@ -2,27 +2,43 @@
 BankCLI module
 
 implements GUI for Bank
+
+every query and commit runs on a background DatabaseWorker with its own
+session; callbacks submit jobs and the results are shown when the worker
+posts them back, so the Tk mainloop never waits for the database
+
+the window is drawn while the database opens in the background (see
+startup module); SQLAlchemy, the models and tkcalendar are only imported
+where they are first needed
 """
 
 # library modules
 import sys
+import time
 import logging
+from argparse import ArgumentParser
+from collections import namedtuple
 from re import fullmatch
 from decimal import InvalidOperation
 
 # GUI modules
 import tkinter as tk
-from tkinter import messagebox
-from tkcalendar import Calendar
-
-# SQL modules
-from sqlalchemy import create_engine
-from sqlalchemy.orm.session import sessionmaker
+from tkinter import messagebox, filedialog
 
 # custom modules
-from db import Base, DATABASE
-from bank import Bank
-from account import Account, OverdrawError, TransactionLimitError, TransactionSequenceError
+from settings import DATABASE, PROFILES, PAGE_SIZE
+from startup import Startup
+from worker import DatabaseWorker, Cancelled, POLL_MS
+from errors import OverdrawError, TransactionLimitError, TransactionSequenceError
+
+# rows of the accounts view (only these rows have widgets)
+ACCOUNT_ROWS = 10
+
+# operations of a workload between two progress reports of a load
+LOAD_PROGRESS_STEP = 1000
+
+# what the GUI shows of the selected account (transactions are detached)
+AccountView = namedtuple("AccountView", ["description", "newest_date", "page"])
 
 # configure the logging module
 logging.basicConfig(filename="bank.log",
@@ -31,23 +47,107 @@ logging.basicConfig(filename="bank.log",
                     datefmt="%Y-%m-%d %I:%M:%S")
 
 
+# jobs run on the worker thread as func(session, job, *args)
+
+def _get_bank(session):
+    """Returns the bank of the worker's session (created if missing)"""
+    from bank import Bank
+
+    bank_id = session.info.get("bank_id")
+    if bank_id is not None:
+        return session.get(Bank, bank_id)
+
+    bank = session.query(Bank).first()
+    if bank is None:
+        bank = Bank()
+        session.add(bank)
+        session.commit()
+        logging.debug("Saved to bank.db")
+    else:
+        logging.debug("Loaded from bank.db")
+    session.info["bank_id"] = bank._id
+    return bank
+
+
+def _account_window(session, job, keys: dict, limit: int, recount: bool) -> tuple:
+    bank = _get_bank(session)
+    total = bank.account_count if recount else None
+    if "at" not in keys:
+        return total, bank.summary_window(limit, **keys)
+
+    # a jump of the scrollbar: numbers are given out in order, so the
+    # account at a fraction of the list is interpolated between the ends
+    low, high = bank.account_range()
+    if low is None:
+        return total, []
+    rows = bank.summary_window(limit, after=low - 1 + round(keys["at"] * (high - low + 1)))
+    if len(rows) < limit:
+        rows = bank.summary_window(limit, before=high + 1)  # the last window
+    return total, rows
+
+
+def _account_view(session, job, num: int, keys: dict) -> AccountView:
+    acct = _get_bank(session).get_account(num)
+    page = acct.transaction_page(**keys)
+    for trans in page.transactions:
+        session.expunge(trans)
+    return AccountView(str(acct), acct.newest_date, page)
+
+
+def _open_account(session, job, acct_type: str, amt: str) -> None:
+    acct = _get_bank(session).add_account(acct_type, session)
+    acct.add_transaction(amt, session)
+
+
+def _add_transaction(session, job, num: int, amt: str, date) -> None:
+    _get_bank(session).get_account(num).add_transaction(amt, session, date=date)
+
+
+def _interest_and_fees(session, job, num: int) -> None:
+    _get_bank(session).get_account(num).interest_and_fees(session)
+
+
+def _load_workload(session, job, path: str) -> str:
+    from workload import load
+    from loader import bulk_load
+
+    _get_bank(session)
+    session.commit()
+    began = time.perf_counter()
+    with open(path, encoding="utf-8") as file:
+        operations = list(load(file))
+
+    def reporting():
+        for index, op in enumerate(operations):
+            if index % LOAD_PROGRESS_STEP == 0:
+                job.progress(index, len(operations))
+            yield op
+        job.progress(len(operations), len(operations))
+
+    loader = bulk_load(session.get_bind(), reporting())
+    return loader.report(time.perf_counter() - began)
+
+
 class GUI:
     """Display a GUI and respond to user inputs"""
 
-    def __init__(self):
+    def __init__(self, startup: Startup):
 
-        self._session = Session()
+        # the worker's first session waits until the database is open
+        self._startup = startup
+        self._worker = DatabaseWorker(startup.session)
 
-        self._bank: Bank = self._session.query(Bank).first()
-        if self._bank is None:
-            self._bank = Bank()
-            self._session.add(self._bank)
-            self._session.commit()
-            logging.debug("Saved to bank.db")
-        else:
-            logging.debug("Loaded from bank.db")
+        # the Tk thread keeps the number of the selected account and
+        # what was last loaded of it, never ORM objects
+        self._account_num: int = None
+        self._account_view: AccountView = None
 
-        self._account: Account = None
+        # current transaction page and the keys it was fetched with
+        self._page = None
+        self._page_keys: dict = {}
+
+        # running workload load (can be cancelled)
+        self._load_job = None
 
         # main tkinter window with title
         self._window = tk.Tk()
@@ -90,6 +190,10 @@ class GUI:
                   text="interest and fees",
                   command=self._interest_and_fees).grid(row=0, column=2)
 
+        tk.Button(self._frames["commands"],
+                  text="load workload",
+                  command=self._load_workload).grid(row=0, column=3)
+
         # frame for user-input entries
         self._frames["input"] = tk.LabelFrame(self._frames["main"])
         self._frames["input"].grid(row=2, pady=10)
@@ -104,9 +208,12 @@ class GUI:
         self._frames["accounts"].grid(row=0, column=0, sticky="news",
                                       padx=10, pady=10)
 
-        # listbox for holding accounts (inside accounts frame)
-        self._accounts_listbox = tk.Listbox(self._frames["accounts"])
-        self._accounts_listbox.pack()
+        # virtualized list of accounts (inside accounts frame)
+        self._accounts_view = GUI.VirtualList(self._frames["accounts"], ACCOUNT_ROWS,
+                                              load=self._load_accounts,
+                                              key=lambda row: row.num,
+                                              command=GUI.SelectAccountHandler(self))
+        self._accounts_view.pack()
 
         # frame for holding transactions
         self._frames["transactions"] = tk.LabelFrame(self._frames["contents"],
@@ -114,13 +221,31 @@ class GUI:
         self._frames["transactions"].grid(row=0, column=1, columnspan=3,
                                           sticky="news", padx=10, pady=10)
 
-        # listbox for holding transactions (inside transactions frame)
-        self._transactions_listbox = tk.Listbox(self._frames["transactions"])
-        self._transactions_listbox.pack()
+        # one row per transaction of a page (inside transactions frame)
+        self._transactions_view = GUI.RowView(self._frames["transactions"], PAGE_SIZE,
+                                              colour=self._transaction_colour)
+        self._transactions_view.pack()
+
+        # prev/next controls for transaction pages (inside transactions frame)
+        self._frames["pages"] = tk.Frame(self._frames["transactions"])
+        self._frames["pages"].pack()
+
+        self._prev_button = tk.Button(self._frames["pages"], text="prev", state=tk.DISABLED,
+                                      command=self._prev_page)
+        self._prev_button.grid(row=0, column=0)
+
+        self._next_button = tk.Button(self._frames["pages"], text="next", state=tk.DISABLED,
+                                      command=self._next_page)
+        self._next_button.grid(row=0, column=1)
+
+        # views are updated from committed changes, not after each command
+        self._worker.submit(lambda session, job: startup.feed.subscribe(self._notify))
 
         self._show_accounts()
 
+        self._window.after(POLL_MS, self._poll)
         self._window.mainloop()
+        self._worker.close()
 
     def _handle_exception(self, exception, value, traceback):
         err_msg = ("Sorry! Something unexpected happened. "
@@ -130,12 +255,196 @@ class GUI:
         logging.error(f"{exception.__name__}: {repr(value)}")
         sys.exit(1)
 
+    def _submit(self, name: str, func, *args, **callbacks):
+        """Queues a job on the database worker, recording its SQL as a
+        command when instrumented (see DatabaseWorker.submit)"""
+        def job(session, job, *args):
+            instrumentation = self._startup.instrumentation
+            if instrumentation is None:
+                return func(session, job, *args)
+            with instrumentation.command(name):
+                return func(session, job, *args)
+        return self._worker.submit(job, *args, **callbacks)
+
+    def _poll(self) -> None:
+        """Delivers the worker's results on the Tk thread"""
+        try:
+            self._worker.poll()
+        finally:
+            self._window.after(POLL_MS, self._poll)
+
     def _clean_input_frame(self) -> None:
         for widget in self._frames["input"].winfo_children():
             widget.destroy()
 
     def _update_selected_account(self) -> None:
-        self._selected_label.set(f"Selected Account: {str(self._account)}")
+        description = None if self._account_view is None else self._account_view.description
+        self._selected_label.set(f"Selected Account: {description}")
+
+    class RowView(tk.Frame):
+        """Fixed set of row widgets reused for the rows on screen
+
+        widgets are created once; showing new rows only reconfigures
+        the widgets whose text changed
+
+        constructor args:
+            parent (tk Widget): container for widget
+            rows (int): number of row widgets
+            command (callable, default=None): called with the row of a
+                clicked widget (rows are buttons if given, labels if not)
+            colour (callable, default=None): foreground colour of a row text
+        """
+
+        def __init__(self, parent, rows, command=None, colour=None, *args, **kwargs):
+
+            tk.Frame.__init__(self, parent, *args, **kwargs)
+
+            self._rows = rows
+            self._command = command
+            self._colour = colour
+            self._items: list = [None] * rows
+            self._texts: list = [None] * rows
+            self._widgets: list = []
+
+            for index in range(rows):
+                if command is None:
+                    widget = tk.Label(self, anchor="w", width=40, bg="white")
+                else:
+                    widget = tk.Button(self, anchor="w", width=40, bg="white",
+                                       command=lambda index=index: self._select(index))
+                widget.grid(row=index, column=0, sticky="nesw")
+                self._widgets.append(widget)
+
+        def show(self, items) -> None:
+            """Shows rows in the widgets, reconfiguring only changed widgets"""
+            items = list(items)[:self._rows]
+            items += [None] * (self._rows - len(items))
+            for index, item in enumerate(items):
+                self._items[index] = item
+                text = "" if item is None else str(item)
+                if text == self._texts[index]:
+                    continue
+                self._texts[index] = text
+                options = {"text": text}
+                if self._colour is not None:
+                    options["fg"] = self._colour(text)
+                if self._command is not None:
+                    options["state"] = tk.DISABLED if item is None else tk.NORMAL
+                self._widgets[index].configure(**options)
+
+        def _get_visible(self) -> list:
+            """Getter for the rows on screen"""
+            return [item for item in self._items if item is not None]
+
+        visible = property(_get_visible)
+
+        def _select(self, index) -> None:
+            if self._items[index] is not None:
+                self._command(self._items[index])
+
+    class VirtualList(RowView):
+        """Scrollable RowView over a long list that is never loaded whole
+
+        only the window of rows on screen is fetched; scrolling fetches the
+        new window and reconfigures the widgets; windows are loaded in the
+        background, and scrolls made while one is loading are coalesced
+
+        windows are fetched by key: a scroll within reach of the rows on
+        screen loads the rows after (or before) the key of one of them, and
+        a jump of the scrollbar loads the rows at a fraction of the list
+
+        constructor args:
+            parent (tk Widget): container for widget
+            rows (int): number of rows on screen
+            load (callable): load(keys, limit, recount, done) fetches rows
+                of the list and calls done(total, rows) on the Tk thread
+                (total is None unless recount is True); keys is {} for the
+                first window, {"after": key} or {"before": key} for the rows
+                after or before a row's key, or {"at": fraction}
+            key (callable): key of a row
+        """
+
+        def __init__(self, parent, rows, load, key, *args, **kwargs):
+
+            GUI.RowView.__init__(self, parent, rows, *args, **kwargs)
+
+            self._load = load
+            self._key = key
+            self._keys: dict = {}
+            self._offset = 0
+            self._shown = 0
+            self._total = 0
+            self._loading = False
+            self._stale = False
+            self._recount = False
+
+            self._scrollbar = tk.Scrollbar(self, orient=tk.VERTICAL, command=self._scroll)
+            self._scrollbar.grid(row=0, column=1, rowspan=rows, sticky="ns")
+
+            for widget in self._widgets + [self]:
+                for sequence in ("<MouseWheel>", "<Button-4>", "<Button-5>"):
+                    widget.bind(sequence, self._wheel)
+
+        def refresh(self, recount=True) -> None:
+            """Loads and shows the window of rows at the current offset
+
+            Args:
+                recount (bool, default=True): count the rows of the list again
+            """
+            self._recount = self._recount or recount
+            if self._loading:
+                self._stale = True
+                return
+            self._loading, self._stale = True, False
+            recount, self._recount = self._recount, False
+            self._keys = self._window_keys()
+            self._load(self._keys, self._rows, recount,
+                       lambda total, items, offset=self._offset: self._loaded(total, items, offset))
+
+        def _window_keys(self) -> dict:
+            """Keys of the window at the current offset, relative to the
+            rows on screen (at offset self._shown) when they are in reach"""
+            if self._offset == 0:
+                return {}
+            visible = self.visible
+            moved = self._offset - self._shown
+            if moved == 0:
+                return self._keys
+            if 0 < moved <= len(visible):
+                return {"after": self._key(visible[moved - 1])}
+            if -len(visible) <= moved < 0 and len(visible) == self._rows:
+                return {"before": self._key(visible[moved])}
+            return {"at": self._offset / self._total}
+
+        def _loaded(self, total, items, offset) -> None:
+            self._loading = False
+            if total is not None:
+                self._total = total
+            if self._stale:
+                self.refresh(recount=False)
+                return
+            self._shown = offset
+            self.show(items)
+            if self._total:
+                self._scrollbar.set(self._offset / self._total,
+                                    min(1.0, (self._offset + self._rows) / self._total))
+            else:
+                self._scrollbar.set(0.0, 1.0)
+
+        def _scroll(self, action, amount, unit=None) -> None:
+            if action == "moveto":
+                offset = round(float(amount) * self._total)
+            else:
+                step = self._rows if unit == "pages" else 1
+                offset = self._offset + int(amount) * step
+            offset = max(0, min(offset, self._total - self._rows))
+            if offset != self._offset:
+                self._offset = offset
+                self.refresh(recount=False)
+
+        def _wheel(self, event) -> None:
+            up = event.num == 4 or event.delta > 0
+            self._scroll("scroll", -1 if up else 1, "units")
 
     class ValidatingEntry(tk.Frame):
         """Entry with highlighting for validation
@@ -174,27 +483,26 @@ class GUI:
 
     def _open_account(self) -> None:
 
-        def open_callback() -> None:
-
-            # adding an account cannot raise an exception
-            acct = self._bank.add_account(options.get(), self._session)
-
+        def open_failed(err) -> None:
             # adding a transaction can raise exceptions
-            try:
-                acct.add_transaction(amt_sel.get(), self._session)
-            except InvalidOperation:
+            if isinstance(err, InvalidOperation):
                 err_msg = "Please try again with a valid dollar amount."
                 messagebox.showwarning("WARNING", err_msg)
-            except AttributeError:
+            elif isinstance(err, AttributeError):
                 err_msg = "New account could not be created."
                 messagebox.showwarning("WARNING", err_msg)
                 self._clean_input_frame()
-            except OverdrawError:
+            elif isinstance(err, OverdrawError):
                 err_msg = "New account cannot have negative initial balance."
                 messagebox.showwarning("WARNING", err_msg)
                 self._clean_input_frame()
-            finally:
-                self._show_accounts()
+            else:
+                raise err
+
+        def open_callback() -> None:
+            # adding an account cannot raise an exception
+            self._submit("open account", _open_account, options.get(), amt_sel.get(),
+                         on_error=open_failed)
 
         self._clean_input_frame()
 
@@ -219,77 +527,103 @@ class GUI:
         type_sel.grid(row=0, column=2, padx=10)
 
     class SelectAccountHandler:
-        """Event handler for select account buttons"""
+        """Event handler for the rows of the accounts view"""
 
-        def __init__(self, gui, acct) -> None:
+        def __init__(self, gui) -> None:
             self._gui = gui
-            self._acct = acct
 
-        def __call__(self) -> None:
-            self._gui._account = self._acct
-            self._gui._update_selected_account()
-            self._gui._show_transactions()
+        def __call__(self, row) -> None:
+            self._gui._account_num = row.num
+            self._gui._page_keys = {}
+            self._gui._show_account()
 
     def _show_accounts(self) -> None:
 
         self._update_selected_account()
-
-        for acct in self._accounts_listbox.winfo_children():
-            acct.destroy()
-
-        for acct in self._bank.accounts:
-            tk.Button(self._accounts_listbox,
-                      text=str(acct),
-                      command=GUI.SelectAccountHandler(self, acct),
-                      bg="white").grid(column=0, sticky="nesw")
-
-        if self._account is not None:
-            self._show_transactions()
-
-    def _show_transactions(self) -> None:
-
-        for trans in self._transactions_listbox.winfo_children():
-            trans.destroy()
-
-        for trans in sorted(self._account.transactions):
-            trans_str = str(trans)
-            col = "red" if "$-" in trans_str else "green"
-            tk.Label(self._transactions_listbox,
-                     text=trans_str,
-                     fg=col,
-                     bg="white").grid(sticky="nws")
+        self._accounts_view.refresh()
+
+        if self._account_num is not None:
+            self._show_account()
+
+    def _load_accounts(self, keys, limit, recount, done) -> None:
+        self._submit("show accounts", _account_window, keys, limit, recount,
+                     on_done=lambda result: done(*result))
+
+    def _notify(self, change) -> None:
+        """Change feed subscriber: hands the change to the Tk thread
+        (commits happen on the worker thread)"""
+        self._worker.post(self._on_change, change)
+
+    def _on_change(self, change) -> None:
+        """Updates only the views showing a changed account"""
+        if change.created or any(row.num in change.accounts
+                                 for row in self._accounts_view.visible):
+            self._accounts_view.refresh(recount=bool(change.created))
+
+        if self._account_num in change.accounts:
+            self._show_account()
+
+    @staticmethod
+    def _transaction_colour(text: str) -> str:
+        return "red" if "$-" in text else "green"
+
+    def _show_account(self) -> None:
+        """Loads the selected account and its current transaction page"""
+        num = self._account_num
+
+        def show(view: AccountView) -> None:
+            if num != self._account_num:
+                return  # another account was selected meanwhile
+            self._account_view = view
+            self._page = view.page
+            self._update_selected_account()
+            self._transactions_view.show(self._page.transactions)
+            self._prev_button["state"] = tk.NORMAL if self._page.has_prev else tk.DISABLED
+            self._next_button["state"] = tk.NORMAL if self._page.has_next else tk.DISABLED
+
+        self._submit("select account", _account_view, num, dict(self._page_keys),
+                     on_done=show)
+
+    def _prev_page(self) -> None:
+        self._page_keys = {"before": self._page.transactions[0].key}
+        self._show_account()
+
+    def _next_page(self) -> None:
+        self._page_keys = {"after": self._page.transactions[-1].key}
+        self._show_account()
 
     def _add_transaction(self) -> None:
 
-        def add_callback() -> None:
+        def add_failed(err) -> None:
             # adding a transaction can raise exceptions
-            try:
-                self._account.add_transaction(amt_sel.get(),
-                                              self._session,
-                                              date=date_sel.get_date())
-            except InvalidOperation:
+            if isinstance(err, InvalidOperation):
                 err_msg = "Please try again with a valid dollar amount."
                 messagebox.showwarning("WARNING", err_msg)
-            except OverdrawError:
+            elif isinstance(err, OverdrawError):
                 err_msg = ("This transaction could not be completed "
                            "due to an insufficient account balance.")
                 messagebox.showwarning("WARNING", err_msg)
-            except TransactionLimitError:
+            elif isinstance(err, TransactionLimitError):
                 err_msg = ("This transaction could not be completed "
                            "because the account has reached a transaction limit.")
                 messagebox.showwarning("WARNING", err_msg)
-            except TransactionSequenceError as err:
+            elif isinstance(err, TransactionSequenceError):
                 err_msg = f"New transactions must be from {err.latest_date} onward"
                 messagebox.showwarning("WARNING", err_msg)
             else:
-                self._clean_input_frame()
-            finally:
-                self._show_accounts()
+                raise err
 
-        if self._account is None:
+        def add_callback() -> None:
+            self._submit("add transaction", _add_transaction, self._account_num,
+                         amt_sel.get(), date_sel.get_date(),
+                         on_done=lambda _: self._clean_input_frame(), on_error=add_failed)
+
+        if self._account_view is None:
             messagebox.showwarning("WARNING", ("You must select an account"
                                                "before adding a transaction"))
         else:
+            from tkcalendar import Calendar
+
             self._clean_input_frame()
 
             button = tk.Button(self._frames["input"],
@@ -309,7 +643,7 @@ class GUI:
             date_label.grid(row=1, column=0, padx=(10, 0))
 
             date_sel = Calendar(self._frames["input"],
-                                mindate=self._account.newest_date,
+                                mindate=self._account_view.newest_date,
                                 date_pattern="yyyy-mm-dd",
                                 selectbackground="green",
                                 showweeknumers=False,
@@ -317,25 +651,77 @@ class GUI:
             date_sel.grid(row=1, column=1, pady=(10, 10), padx=(0,10))
 
     def _interest_and_fees(self) -> None:
-        try:
-            self._account.interest_and_fees(self._session)
-        except AttributeError:
+
+        def interest_failed(err) -> None:
+            if isinstance(err, TransactionSequenceError):
+                err_msg = (f"Cannot apply interest and fees again "
+                           f"in the month of {err.latest_date.strftime('%B')}.")
+                messagebox.showwarning("WARNING", err_msg)
+            else:
+                raise err
+
+        if self._account_num is None:
             err_msg = "This command requires that you first select an account."
             messagebox.showwarning("WARNING", err_msg)
-        except TransactionSequenceError as err:
-            err_msg = (f"Cannot apply interest and fees again "
-                       f"in the month of {err.latest_date.strftime('%B')}.")
-            messagebox.showwarning("WARNING", err_msg)
         else:
-            logging.debug("Triggered fees and interest")
-        finally:
+            self._submit("interest and fees", _interest_and_fees, self._account_num,
+                         on_done=lambda _: logging.debug("Triggered fees and interest"),
+                         on_error=interest_failed)
+
+    def _load_workload(self) -> None:
+        """Bulk loads a workload file in the background with progress and cancel"""
+
+        if self._load_job is not None:
+            messagebox.showwarning("WARNING", "A workload is already being loaded.")
+            return
+
+        path = filedialog.askopenfilename(title="Workload",
+                                          filetypes=[("workload", "*.jsonl"), ("all", "*")])
+        if not path:
+            return
+
+        self._clean_input_frame()
+
+        progress = tk.StringVar(self._frames["input"])
+        progress.set("Loading workload...")
+        tk.Label(self._frames["input"], textvariable=progress).grid(row=0, column=0)
+
+        def report(done: int, total: int) -> None:
+            progress.set(f"Loading workload: {done:,} of {total:,} operations")
+
+        def finish(result: str) -> None:
+            self._load_job = None
+            self._clean_input_frame()
+            logging.debug(f"Loaded workload {path}")
+            messagebox.showinfo("INFO", result)
             self._show_accounts()
 
-if __name__ == "__main__":
-    engine = create_engine(DATABASE)
-    Base.metadata.create_all(engine)
+        def fail(err) -> None:
+            self._load_job = None
+            self._clean_input_frame()
+            if isinstance(err, Cancelled):
+                messagebox.showinfo("INFO", "Workload load cancelled; nothing was saved.")
+            elif isinstance(err, (OSError, ValueError)):
+                messagebox.showwarning("WARNING", f"Could not load the workload: {err}")
+            else:
+                raise err
+
+        self._load_job = self._submit("load workload", _load_workload, path,
+                                      on_done=finish, on_error=fail, on_progress=report)
 
-    Session = sessionmaker()
-    Session.configure(bind=engine)
+        tk.Button(self._frames["input"], text="Cancel",
+                  command=self._load_job.cancel).grid(row=0, column=1, padx=10)
 
-    GUI()
+if __name__ == "__main__":
+    parser = ArgumentParser()
+    parser.add_argument("--profile", choices=list(PROFILES), default="default",
+                        help="SQLite storage profile (default: SQLite defaults)")
+    parser.add_argument("--instrument", nargs="?", const="-", metavar="FILE",
+                        help="report the SQL of each command (to FILE or stdout)")
+    args = parser.parse_args()
+
+    startup = Startup(DATABASE, args.profile, args.instrument, watch_changes=True)
+    try:
+        GUI(startup)
+    finally:
+        startup.close()
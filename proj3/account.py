@@ -12,29 +12,27 @@ classes:
 # library modules
 import logging
 from decimal import Decimal
-from datetime import date
+from collections import namedtuple
+from datetime import date, timedelta
 from calendar import monthrange
 
 # SQL modules
-from sqlalchemy.orm import relationship, backref
-from sqlalchemy import ForeignKey, Column, Integer, Float, String
+from sqlalchemy.orm import relationship, backref, object_session
+from sqlalchemy import ForeignKey, Column, Integer, Float, String, select, func, false, tuple_
 
 # custom modules
 from db import Base
-from transaction import Transaction
+from settings import PAGE_SIZE, ACCOUNT_LAYOUT, JOINED
+from errors import OverdrawError, TransactionLimitError, TransactionSequenceError
+from transaction import Transaction, from_cents, interest
+import merkle
+import rollup
 
-class OverdrawError(Exception):
-    """Custom exception to handle overdrawn balance errors"""
+# one page of a transaction listing and whether pages exist before and after it
+TransactionPage = namedtuple("TransactionPage", ["transactions", "has_prev", "has_next"])
 
-class TransactionLimitError(Exception):
-    """Custom exception to handle invalid transactions on Savings accounts"""
-
-class TransactionSequenceError(Exception):
-    """Custom exception to enforce chronological ordering of transactions"""
-
-    def __init__(self, latest_date):
-        super().__init__()
-        self.latest_date = latest_date
+# the single layout loads the subtype columns with every account row
+SUBTYPE_LOAD = {} if ACCOUNT_LAYOUT == JOINED else {"polymorphic_load": "inline"}
 
 class Account(Base):
     """Abstract class for account subclasses"""
@@ -45,7 +43,8 @@ class Account(Base):
     _transactions = relationship("Transaction", backref=backref("account"))
     _interest_rate = Column(Float)
     _interest_triggered = Column(Integer)
-    _bank_id = Column(Integer, ForeignKey("bank._id"))
+    _balance_cents = Column(Integer)
+    _bank_id = Column(Integer, ForeignKey("bank._id"), index=True)
     _type = Column(String(10))
 
     __mapper_args__ = {
@@ -57,18 +56,26 @@ class Account(Base):
         self._num = num
         self._interest_rate = 0
         self._interest_triggered = False
+        self._balance_cents = 0
 
     def __str__(self) -> str:
         """Formats the account's number and balance"""
-        return f"#{self._num:0>9},\tbalance: ${self.balance:,.2f}"
+        return self._describe(self._num, self.balance)
+
+    @classmethod
+    def _describe(cls, num: int, balance: Decimal) -> str:
+        """Formats an account number and balance (also used for summary
+        rows that are not loaded as accounts)"""
+        return f"#{num:0>9},\tbalance: ${balance:,.2f}"
 
     def _get_balance(self) -> Decimal:
-        """Calculates the balance for an account by summing its transactions
+        """Returns the balance for an account (the sum of its transactions
+        in integer cents, maintained in the same unit of work as each insert)
 
         Returns:
             Decimal: current balance
         """
-        return Decimal(sum(x for x in self._transactions))
+        return from_cents(self._balance_cents)
 
     balance = property(_get_balance)
 
@@ -78,6 +85,49 @@ class Account(Base):
 
     transactions = property(_get_transactions)
 
+    def transaction_page(self, *, after=None, before=None, size=PAGE_SIZE) -> TransactionPage:
+        """Returns one page of the account's transactions in (date, id) order
+
+        keyset pagination: a page starts right after (or ends right before)
+        the key of a transaction on a neighbouring page, so fetching any page
+        is one range scan of the page index however long the history is
+
+        Args:
+            after (tuple, kw, default=None): key of the last transaction of
+                the previous page (first page if neither key is given)
+            before (tuple, kw, default=None): key of the first transaction of
+                the next page
+            size (int, kw, default=PAGE_SIZE): transactions per page
+
+        Returns:
+            TransactionPage: transactions of the page and whether pages exist
+            before and after it
+        """
+        position = tuple_(Transaction._date, Transaction._id)
+        query = select(Transaction).where(Transaction._account_num == self._num)
+        if before is not None:
+            query = (query.where(position < tuple_(*before))
+                     .order_by(Transaction._date.desc(), Transaction._id.desc()))
+        else:
+            if after is not None:
+                query = query.where(position > tuple_(*after))
+            query = query.order_by(Transaction._date, Transaction._id)
+
+        rows = object_session(self).scalars(query.limit(size + 1)).all()
+        more = len(rows) > size
+        rows = rows[:size]
+        if before is not None:
+            return TransactionPage(rows[::-1], more, True)
+        return TransactionPage(rows, after is not None, more)
+
+    def pages(self, size=PAGE_SIZE):
+        """Yields the account's transactions page by page from the oldest"""
+        page = self.transaction_page(size=size)
+        yield page.transactions
+        while page.has_next:
+            page = self.transaction_page(after=page.transactions[-1].key, size=size)
+            yield page.transactions
+
     def add_transaction(self, amt, session, *, date=None, exempt=False) -> None:
         """
         Creates a pending transaction with given amount and date
@@ -88,21 +138,29 @@ class Account(Base):
             date (str, kw, default=None): date of incoming transaction
             exempt (bool, kw, default=False): exempt from account rules
         """
+        self._add_pending(amt, session, date=date, exempt=exempt)
+
+        # commit pending transaction
+        session.commit()
+        logging.debug("Saved to bank.db")
+
+    def _add_pending(self, amt, session, *, date=None, exempt=False) -> None:
+        """Validates a transaction and adds it to the session without committing"""
         # create transaction
         trans = Transaction(amt, date, exempt)
 
+        # get date of newest transaction
+        newest = self._last_date()
+
         # check account rules
         bal_ok = self._check_balance(trans)
         lim_ok = self._check_limits(trans)
-        seq_ok = self._check_sequence(trans)
-
-        # get newest transaction
-        newest = self._newest_trans()
+        seq_ok = self._check_sequence(trans, newest)
 
         # exempt transactions only care about sequence errors
         if trans.is_exempt():
             if not seq_ok:
-                raise TransactionSequenceError(newest.date)
+                raise TransactionSequenceError(newest)
         else:
             # non-exempt transactions care about all errors
             if not bal_ok:
@@ -110,22 +168,23 @@ class Account(Base):
             if not lim_ok:
                 raise TransactionLimitError
             if not seq_ok:
-                raise TransactionSequenceError(newest.date)
+                raise TransactionSequenceError(newest)
 
             # if non-exempt transaction enters new month, enable interest/fees
-            if newest is not None and trans.date > self._newest_end_of_month():
+            if newest is not None and trans.date > self._end_of_month(newest):
                 self._interest_triggered = False
                 session.add(self)
 
-        # add pending transaction
-        self._transactions.append(trans)
+        # add pending transaction (and its leaf in the ledger hash tree);
+        # setting the backref does not load the transactions collection
+        trans.account = self
+        self._balance_cents = (self._balance_cents or 0) + trans._amt_cents
         session.add(trans)
+        session.add(self)
+        merkle.record(session, self._num, trans)
+        rollup.record(session, self._num, trans, self._balance_cents)
         logging.debug(f"Created transaction, {self._num}, {amt}")
 
-        # commit pending transaction
-        session.commit()
-        logging.debug("Saved to bank.db")
-
 
     def _check_balance(self, trans: Transaction) -> bool:
         """Checks whether an incoming transaction overdraws the balance
@@ -141,45 +200,58 @@ class Account(Base):
     def _check_limits(self, trans1: Transaction) -> bool:
         return trans1 is not None
 
-    def _check_sequence(self, trans: Transaction) -> bool:
+    def _check_sequence(self, trans: Transaction, newest: date) -> bool:
         """Checks whether incoming transaction satisfies
         chronological (partial/total) ordering of transactions
+
+        Args:
+            trans (Transaction): incoming transaction
+            newest (date): date of the newest transaction (None if no transactions)
         """
-        newest = self._newest_trans()
         if newest is None:
             return True
         if not trans.is_exempt():
-            return newest <= trans
+            return newest <= trans.date
         # check if triggering is allowed for exempt transactions
-        return newest <= trans and not self._interest_triggered
+        return newest <= trans.date and not self._interest_triggered
+
+    def _non_exempt_count(self, start: date, end: date) -> int:
+        """Counts non-exempt transactions dated in [start, end)
+        (an index range scan on the transaction table)"""
+        return object_session(self).scalar(
+            select(func.count())
+            .where(Transaction._account_num == self._num,
+                   Transaction._date >= start,
+                   Transaction._date < end,
+                   Transaction._exempt == false()))
+
+    def _last_date(self) -> date:
+        """Returns date of most recent transaction on the account or None
+        (kept by the rollup row of the account's newest month)"""
+        month = rollup.newest_month(object_session(self), self._num)
+        return month.newest_date if month is not None else None
 
     def _newest_date(self) -> date:
         """Returns date of most recent transaction on the account
         or today's date if account has no transactions (negative initial amt)
         """
-        newest = self._newest_trans()
-        return newest.date if newest else date.today()
+        newest = self._last_date()
+        return newest if newest else date.today()
 
     newest_date = property(_newest_date)
 
-    def _newest_trans(self) -> Transaction:
-        """Returns most recent transaction on the account"""
-        return max(self.transactions, default=None)
+    @staticmethod
+    def _end_of_month(day: date) -> date:
+        """Returns the last day of the month of the given date"""
+        return date(day.year, day.month, monthrange(day.year, day.month)[1])
 
     def _newest_end_of_month(self) -> date:
         """Returns date for end of month"""
-        # get newest transaction
-        newest_date = self._newest_date()
-
-        # calculate date attributes
-        year = newest_date.year
-        month = newest_date.month
-        day = monthrange(year, month)[1]
-
-        return date(year, month, day)
+        return self._end_of_month(self._newest_date())
 
     def interest_and_fees(self, session) -> None:
-        """Calculate interest and fees for the account"""
+        """Calculate interest and fees for the account
+        (committed together with the trigger flag in a single commit)"""
         self._interest(session)
         self._fees(session)
         self._interest_triggered = True
@@ -189,16 +261,20 @@ class Account(Base):
     def _interest(self, session) -> None:
         """Calculate interest for the current balance and add
         as a new transaction exempt from account limits"""
-        interest = self._get_balance() * Decimal(self._interest_rate)
         interest_date = self._newest_end_of_month().isoformat()
-        self.add_transaction(interest,
-                             session,
-                             date=interest_date,
-                             exempt=True)
+        self._add_pending(interest(self._get_balance(), self._interest_rate),
+                          session,
+                          date=interest_date,
+                          exempt=True)
 
     def _fees(self, session) -> None:
         pass
 
+    def statement(self) -> list:
+        """Returns the monthly totals of the account, oldest month first
+        (read from the account_month rollup)"""
+        return rollup.statement(object_session(self), self._num)
+
     def _get_num(self) -> None:
         return self._num
 
@@ -208,14 +284,17 @@ class Account(Base):
 class SavingsAccount(Account):
     """Account subclass for Savings account"""
 
-    __tablename__ = "savingsaccount"
+    # the subtype columns are added to the account table in the single layout
+    if ACCOUNT_LAYOUT == JOINED:
+        __tablename__ = "savingsaccount"
+        _num = Column(Integer, ForeignKey("account._num"), primary_key=True)
 
-    _num = Column(Integer, ForeignKey("account._num"), primary_key=True)
     _day_lim = Column(Integer)
     _month_lim = Column(Integer)
 
     __mapper_args__ = {
-        "polymorphic_identity": "savingsaccount"
+        "polymorphic_identity": "savingsaccount",
+        **SUBTYPE_LOAD,
     }
 
     def __init__(self, num: int) -> None:
@@ -224,8 +303,9 @@ class SavingsAccount(Account):
         self._day_lim = 2
         self._month_lim = 5
 
-    def __str__(self) -> str:
-        return "Savings" + super().__str__()
+    @classmethod
+    def _describe(cls, num: int, balance: Decimal) -> str:
+        return "Savings" + super()._describe(num, balance)
 
     def _check_limits(self, trans1: Transaction) -> bool:
         """Checks if incoming transaction is allowed given account limits
@@ -236,23 +316,34 @@ class SavingsAccount(Account):
         Returns:
             bool: True if allowed, False if not allowed
         """
-        non_exempts = [t for t in self._transactions if not t.is_exempt()]
-        same_day = len([t2 for t2 in non_exempts if trans1.same_day(t2)])
-        same_month = len([t2 for t2 in non_exempts if trans1.same_month(t2)])
+        day = trans1.date
+        # day and month totals come from the rollup row of the month
+        month = rollup.get_month(object_session(self), self._num, day)
+        if month is None:
+            same_day = same_month = 0
+        elif day >= month.newest_date:
+            same_day, same_month = month.same_day(day), month.non_exempt
+        else:
+            # before the newest date: rejected by the sequence check anyway,
+            # but a limit error is raised first, so count that day exactly
+            same_day = self._non_exempt_count(day, day + timedelta(days=1))
+            same_month = month.non_exempt
         return same_day < self._day_lim and same_month < self._month_lim
 
 
 class CheckingAccount(Account):
     """Account subclass for Checking account"""
 
-    __tablename__ = "checkingaccount"
+    if ACCOUNT_LAYOUT == JOINED:
+        __tablename__ = "checkingaccount"
+        _num = Column(Integer, ForeignKey("account._num"), primary_key=True)
 
-    _num = Column(Integer, ForeignKey("account._num"), primary_key=True)
     _balance_threshold = Column(Integer)
     _low_balance_fee = Column(Integer)
 
     __mapper_args__ = {
-        "polymorphic_identity": "checkingaccount"
+        "polymorphic_identity": "checkingaccount",
+        **SUBTYPE_LOAD,
     }
 
     def __init__(self, num: int) -> None:
@@ -261,14 +352,15 @@ class CheckingAccount(Account):
         self._balance_threshold = 100
         self._low_balance_fee = -10
 
-    def __str__(self) -> str:
-        return "Checking" + super().__str__()
+    @classmethod
+    def _describe(cls, num: int, balance: Decimal) -> str:
+        return "Checking" + super()._describe(num, balance)
 
     def _fees(self, session) -> None:
         """Adds a low-balance fee if balance below threshold"""
         if self._get_balance() < Decimal(self._balance_threshold):
             fees_date = self._newest_end_of_month().isoformat()
-            self.add_transaction(Decimal(self._low_balance_fee),
-                                 session,
-                                 date=fees_date,
-                                 exempt=True)
+            self._add_pending(Decimal(self._low_balance_fee),
+                              session,
+                              date=fees_date,
+                              exempt=True)
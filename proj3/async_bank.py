@@ -0,0 +1,228 @@
+"""
+async_bank module
+
+implements an asyncio variant of the proj3 bank operations on
+SQLAlchemy's AsyncSession and the aiosqlite driver
+(requires the sqlalchemy[asyncio] extra and aiosqlite)
+
+each operation runs in its own AsyncSession; reads are plain async
+queries (no lazy loads), and the account rules of Account are reused
+through AsyncSession.run_sync, whose queries are awaited on the event
+loop like any other; SQLite allows a single writer, so writes queue on
+an asyncio lock instead of failing with "database is locked"
+
+usage:
+    bank = await AsyncBank.open("sqlite+aiosqlite:///bank.db")
+    num = await bank.add_account("savings")
+    await bank.add_transaction(num, "100.00", date="2023-01-02")
+    async for row in bank.summary():
+        print(row)
+    await bank.close()
+
+    python async_bank.py --workload ops.jsonl --database sqlite+aiosqlite:///async.db
+"""
+
+# library modules
+import time
+import asyncio
+from collections import Counter
+
+# SQL modules
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import async_sessionmaker
+
+# custom modules
+from db import ASYNC_DATABASE, create_async_bank_engine
+from migrations import migrate
+from bank import Bank, AccountSummary, summary_query
+from account import (Account, PAGE_SIZE, OverdrawError, TransactionLimitError,
+                     TransactionSequenceError)
+
+
+def _get_account(session, bank_id: int, num: int) -> Account:
+    """Loads an account of a bank by primary key (sync side of run_sync)"""
+    acct = session.get(Account, int(num))
+    if acct is None or acct._bank_id != bank_id:
+        raise KeyError(num)
+    return acct
+
+
+def _add_account(session, bank_id: int, acct_type: str) -> int:
+    acct = session.get(Bank, bank_id).add_account(acct_type, session)
+    return None if acct is None else acct.num
+
+
+def _add_transaction(session, bank_id: int, num: int, amt, date) -> None:
+    _get_account(session, bank_id, num).add_transaction(amt, session, date=date)
+
+
+def _interest_and_fees(session, bank_id: int, num: int) -> None:
+    _get_account(session, bank_id, num).interest_and_fees(session)
+
+
+def _transaction_page(session, bank_id: int, num: int, keys: dict):
+    return _get_account(session, bank_id, num).transaction_page(**keys)
+
+
+class AsyncBank:
+    """Bank operations for asyncio applications
+
+    accounts are referred to by number and returned as AccountSummary
+    rows, since ORM objects do not outlive the session of an operation
+
+    constructor args:
+        engine (AsyncEngine): engine of an upgraded bank database
+        bank_id (int): id of the bank the operations act on
+    """
+
+    def __init__(self, engine, bank_id: int) -> None:
+        self._engine = engine
+        self._bank_id = bank_id
+        self._sessions = async_sessionmaker(engine, expire_on_commit=False)
+        self._write_lock = asyncio.Lock()
+
+    @classmethod
+    async def open(cls, url=ASYNC_DATABASE, profile="default"):
+        """Upgrades the database and opens its first bank (created if missing)
+
+        Args:
+            url (str, default=ASYNC_DATABASE): sqlite+aiosqlite database URL
+            profile (str, default="default"): storage profile (see db.PROFILES)
+
+        Returns:
+            AsyncBank: operations on the bank
+        """
+        engine = create_async_bank_engine(url, profile)
+        async with engine.begin() as conn:
+            await conn.run_sync(migrate)
+
+        async with async_sessionmaker(engine, expire_on_commit=False)() as session:
+            bank_id = await session.scalar(select(Bank._id).order_by(Bank._id).limit(1))
+            if bank_id is None:
+                bank = Bank()
+                session.add(bank)
+                await session.commit()
+                bank_id = bank._id
+        return cls(engine, bank_id)
+
+    async def close(self) -> None:
+        """Closes the connections of the engine"""
+        await self._engine.dispose()
+
+    async def _write(self, func, *args):
+        """Runs a sync operation on a new session, one writer at a time"""
+        async with self._write_lock:
+            async with self._sessions() as session:
+                return await session.run_sync(func, self._bank_id, *args)
+
+    async def add_account(self, acct_type: str) -> int:
+        """Creates an account ("savings" or "checking")
+
+        Returns:
+            int: number of the new account or None if type not matched
+        """
+        return await self._write(_add_account, acct_type)
+
+    async def get_account(self, num: int) -> AccountSummary:
+        """Returns number, type and balance of an account or None"""
+        async with self._sessions() as session:
+            row = (await session.execute(summary_query(self._bank_id, num=int(num)))).first()
+        return None if row is None else AccountSummary.from_row(row)
+
+    async def add_transaction(self, num: int, amt, *, date=None) -> None:
+        """Adds a transaction to an account if allowed by the account rules
+
+        Raises:
+            KeyError: no such account in the bank
+            OverdrawError, TransactionLimitError, TransactionSequenceError
+        """
+        await self._write(_add_transaction, num, amt, date)
+
+    async def interest_and_fees(self, num: int) -> None:
+        """Adds interest and fees to an account
+
+        Raises:
+            KeyError: no such account in the bank
+            TransactionSequenceError
+        """
+        await self._write(_interest_and_fees, num)
+
+    async def transaction_page(self, num: int, *, after=None, before=None, size=PAGE_SIZE):
+        """Returns one keyset page of an account's transactions
+        (see Account.transaction_page)"""
+        keys = {"after": after, "before": before, "size": size}
+        async with self._sessions() as session:
+            return await session.run_sync(_transaction_page, self._bank_id, num, keys)
+
+    async def summary(self, batch_size=1000):
+        """Yields a summary row for every account, streamed from one query"""
+        async with self._sessions() as session:
+            rows = await session.stream(summary_query(self._bank_id, batch_size))
+            async for row in rows:
+                yield AccountSummary.from_row(row)
+
+
+async def replay_clients(bank: AsyncBank, operations) -> Counter:
+    """Replays a workload with one concurrent client task per account slot
+    (errors other than those of the account rules propagate)
+
+    Returns:
+        Counter: number of rejections per exception name
+    """
+    from workload import OPEN, TRANSACTION, INTEREST
+
+    clients: dict = {}
+    for op in operations:
+        clients.setdefault(op.slot, []).append(op)
+    rejections = Counter()
+
+    async def client(ops) -> None:
+        num = None
+        for op in ops:
+            try:
+                if op.kind == OPEN:
+                    num = await bank.add_account(op.acct_type)
+                    await bank.add_transaction(num, op.amount, date=op.date.isoformat())
+                elif op.kind == TRANSACTION:
+                    await bank.add_transaction(num, op.amount, date=op.date.isoformat())
+                elif op.kind == INTEREST:
+                    await bank.interest_and_fees(num)
+            except (OverdrawError, TransactionLimitError, TransactionSequenceError) as err:
+                rejections[type(err).__name__] += 1
+
+    await asyncio.gather(*(client(ops) for ops in clients.values()))
+    return rejections
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+    from workload import WorkloadGenerator, load
+
+    parser = ArgumentParser(description="Replay a workload with concurrent async clients")
+    parser.add_argument("--database", default="sqlite+aiosqlite://")
+    parser.add_argument("--profile", default="default", help="see db.PROFILES")
+    parser.add_argument("--workload", help="file written by workload.py (default: generate)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--months", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.workload:
+        with open(args.workload, encoding="utf-8") as file:
+            operations = list(load(file))
+    else:
+        operations = list(WorkloadGenerator(seed=args.seed, accounts=args.accounts,
+                                            months=args.months))
+
+    async def main() -> None:
+        bank = await AsyncBank.open(args.database, args.profile)
+        began = time.perf_counter()
+        rejections = await replay_clients(bank, operations)
+        elapsed = time.perf_counter() - began
+        print(f"{len(operations)} operations in {elapsed:.2f}s "
+              f"({len(operations) / elapsed:,.0f} ops/s)")
+        print("rejections: " + (", ".join(f"{name}={count}" for name, count
+                                          in rejections.most_common()) or "-"))
+        await bank.close()
+
+    asyncio.run(main())
@@ -6,19 +6,88 @@ implements Bank class to aggregate Accounts
 
 # library modules
 import logging
+from collections import namedtuple
 
 # SQL modules
-from sqlalchemy import Column, Integer
-from sqlalchemy.orm import relationship, backref
+from sqlalchemy import Column, Integer, select, func
+from sqlalchemy.orm import relationship, backref, object_session
 
 # custom modules
 from db import Base
 from account import Account, SavingsAccount, CheckingAccount
+from transaction import from_cents
 
 # constants for pattern matching
 SAVINGS = "savings"
 CHECKING = "checking"
 
+class AccountSummary(namedtuple("AccountSummary", ["num", "type", "balance"])):
+    """Number, polymorphic type and balance of an account (one summary row)"""
+
+    __slots__ = ()
+
+    @classmethod
+    def from_row(cls, row):
+        """Creates a summary from a (number, type, balance in cents) row"""
+        num, acct_type, cents = row
+        return cls(num, acct_type, from_cents(cents))
+
+    def __str__(self) -> str:
+        """Formats the row exactly like str() of the account itself"""
+        acct_class = Account.__mapper__.polymorphic_map[self.type].class_
+        return acct_class._describe(self.num, self.balance)
+
+
+def summary_query(bank_id: int, batch_size=None, num=None):
+    """Returns the query for the summary rows of a bank's accounts
+
+    Args:
+        bank_id (int): id of the bank
+        batch_size (int, default=None): rows fetched per batch to stream
+            the results (None to buffer them)
+        num (int, default=None): only the account with this number
+
+    Returns:
+        Select: number, type and balance in cents in account number order
+    """
+    query = (select(Account._num, Account._type, Account._balance_cents)
+             .where(Account._bank_id == bank_id)
+             .order_by(Account._num))
+    if batch_size is not None:
+        query = query.execution_options(yield_per=batch_size)
+    if num is not None:
+        query = query.where(Account._num == num)
+    return query
+
+
+def window_query(bank_id: int, limit: int, after=None, before=None):
+    """Returns the query for a window of a bank's summary rows
+
+    keyset pagination on the account number: a window starts right after
+    (or ends right before) the number of an account on a neighbouring
+    window, so it is one range seek of the primary key however far down
+    the list it is
+
+    Args:
+        bank_id (int): id of the bank
+        limit (int): rows of the window
+        after (int, default=None): number of the last account before the
+            window (first window if neither number is given)
+        before (int, default=None): number of the first account after the
+            window (the rows are then in descending number order)
+
+    Returns:
+        Select: number, type and balance in cents of the window's rows
+    """
+    query = summary_query(bank_id)
+    if before is not None:
+        return (query.where(Account._num < before)
+                .order_by(None).order_by(Account._num.desc()).limit(limit))
+    if after is not None:
+        query = query.where(Account._num > after)
+    return query.limit(limit)
+
+
 class Bank(Base):
     """Contains information about accounts at a bank"""
 
@@ -47,13 +116,23 @@ class Bank(Base):
 
         logging.debug(f"Created account: {acct_num}")
 
-        self._accounts.append(acct)
+        # setting the backref does not load the accounts collection
+        acct.bank = self
         session.add(acct)
         session.commit()
         return acct
 
     def _generate_account_number(self) -> int:
-        return len(self._accounts) + 1
+        """Returns one more than the highest account number in the database
+        (a MAX() over the primary key index, not a count of loaded accounts)"""
+        if self._shards() is not None:
+            return self._shards().next_account_number()
+        session = object_session(self)
+        return (session.scalar(select(func.max(Account._num))) or 0) + 1
+
+    def _shards(self):
+        """Returns the ShardSet of a sharded session (see shards module) or None"""
+        return object_session(self).info.get("shards")
 
     def _get_accounts(self) -> list:
         """Getter method for accounts"""
@@ -61,6 +140,66 @@ class Bank(Base):
 
     accounts = property(_get_accounts)
 
+    def summary(self, batch_size=1000):
+        """Yields a summary row for every account in account number order
+
+        one query over the account table (balances are maintained there), so
+        no accounts or transactions are loaded; rows are streamed batch_size
+        at a time, so memory stays bounded however many accounts there are
+
+        Args:
+            batch_size (int, default=1000): rows fetched per batch
+
+        Yields:
+            AccountSummary: number, type and balance of an account
+        """
+        if self._shards() is not None:
+            yield from self._shards().summary(self._id, batch_size)
+            return
+        rows = object_session(self).execute(summary_query(self._id, batch_size))
+        for row in rows:
+            yield AccountSummary.from_row(row)
+
+    def summary_window(self, limit: int, *, after=None, before=None) -> list:
+        """Returns the summary rows of a window of the accounts in account
+        number order (the rows on screen in a scrolled view)
+
+        Args:
+            limit (int): rows of the window
+            after (int, kw, default=None): number of the last account
+                before the window (first window if neither is given)
+            before (int, kw, default=None): number of the first account
+                after the window
+
+        Returns:
+            list: AccountSummary rows (fewer than limit at either end)
+        """
+        if self._shards() is not None:
+            return self._shards().summary_window(self._id, limit, after, before)
+        rows = object_session(self).execute(window_query(self._id, limit, after, before)).all()
+        if before is not None:
+            rows.reverse()
+        return [AccountSummary.from_row(row) for row in rows]
+
+    def account_range(self) -> tuple:
+        """Returns the lowest and highest account number of the bank
+        ((None, None) if it has no accounts)"""
+        if self._shards() is not None:
+            return self._shards().account_range(self._id)
+        return tuple(object_session(self).execute(
+            select(func.min(Account._num), func.max(Account._num))
+            .where(Account._bank_id == self._id)).one())
+
+    def _get_account_count(self) -> int:
+        """Getter for the number of accounts in the bank (a COUNT() over
+        the index on the bank id)"""
+        if self._shards() is not None:
+            return self._shards().account_count(self._id)
+        return object_session(self).scalar(
+            select(func.count()).where(Account._bank_id == self._id))
+
+    account_count = property(_get_account_count)
+
     def get_account(self, num: str) -> Account:
         """Returns the account with the given account num
 
@@ -70,7 +209,8 @@ class Bank(Base):
         Returns:
             Account: Account with given number or None
         """
-        for acct in self._accounts:
-            if acct.num == int(num):
-                return acct
-        return None
+        # primary-key lookup (served from the identity map when loaded)
+        acct = object_session(self).get(Account, int(num))
+        if acct is None or acct._bank_id != self._id:
+            return None
+        return acct
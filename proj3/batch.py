@@ -0,0 +1,121 @@
+"""
+batch module
+
+implements a group-commit session for bulk transaction writes
+
+Account.add_transaction and interest_and_fees call session.commit() after
+every accepted transaction, and on SQLite every commit waits for a sync to
+disk; GroupCommitSession turns those commits into flushes and only commits
+(one sync for the whole group) once a batch is full or old enough
+
+a session is not thread-safe, so no timer thread can commit it: the age
+limit is checked by the owner's calls to commit(), sync_if_due() and
+idle(); loops that wait for work (DatabaseWorker, paced replays) wait
+until the batch deadline at most and then call sync_if_due(), so a batch
+is never left unsynced for longer than max_delay while its owner is idle
+
+usage:
+    Session = sessionmaker(bind=engine, class_=GroupCommitSession,
+                           batch_size=500, max_delay=0.2)
+    session = Session()
+    ...
+    session.idle(0.5)  # waiting: commits the batch once max_delay has passed
+    session.sync()  # durable now
+    session.close()  # like Session.close(), discards a batch that was not synced
+"""
+
+# library modules
+import time
+import logging
+
+# SQL modules
+from sqlalchemy.orm import Session
+
+
+class GroupCommitSession(Session):
+    """Session that defers commits until a batch is full or old enough
+
+    commit() flushes, so the pending rows are visible to the validation
+    queries of later transactions in the same batch (limits, overdraft and
+    sequence checks stay correct), but they are only durable after sync();
+    a rollback or close() discards every transaction of the current batch
+
+    constructor args:
+        batch_size (int): number of commit() calls grouped in one commit
+        max_delay (float): seconds after which a batch is committed even if
+            it is not full (by the next commit(), sync_if_due() or idle())
+    """
+
+    def __init__(self, *args, batch_size=100, max_delay=1.0, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        self._batch_size = batch_size
+        self._max_delay = max_delay
+        self._batched = 0
+        self._opened = None
+
+    def commit(self) -> None:
+        """Flushes and adds the caller's unit of work to the current batch"""
+        self.flush()
+        if self._batched == 0:
+            self._opened = time.monotonic()
+        self._batched += 1
+
+        if (self._batched >= self._batch_size
+                or time.monotonic() - self._opened >= self._max_delay):
+            self.sync()
+
+    def _get_deadline(self) -> float:
+        """time.monotonic() by which the current batch must be committed
+        (None if no commit is waiting)"""
+        return self._opened + self._max_delay if self._batched else None
+
+    deadline = property(_get_deadline)
+
+    def sync_if_due(self) -> bool:
+        """Commits the current batch if it is older than max_delay
+
+        Returns:
+            bool: True if a batch was committed
+        """
+        if self._batched and time.monotonic() >= self.deadline:
+            self.sync()
+            return True
+        return False
+
+    def idle(self, seconds: float) -> None:
+        """Sleeps, committing the current batch when its deadline passes"""
+        end = time.monotonic() + seconds
+        while (remaining := end - time.monotonic()) > 0:
+            deadline = self.deadline
+            if deadline is None:
+                time.sleep(remaining)
+                return
+            time.sleep(min(max(deadline - time.monotonic(), 0), remaining))
+            self.sync_if_due()
+
+    def sync(self) -> None:
+        """Commits the current batch immediately"""
+        batched = self._batched
+        super().commit()
+        self._batched = 0
+        if batched:
+            logging.debug(f"Committed batch of {batched}")
+
+    def _get_pending(self) -> int:
+        """Number of commits waiting in the current batch"""
+        return self._batched
+
+    pending = property(_get_pending)
+
+    def rollback(self) -> None:
+        super().rollback()
+        self._batched = 0
+
+    def close(self) -> None:
+        """Discards the batch if it was not synced (like Session.close(), so
+        a session closed on an error path never commits half-finished work;
+        call sync() first to keep it)"""
+        if self._batched:
+            logging.debug(f"Discarded batch of {self._batched}")
+            self.rollback()
+        super().close()
@@ -0,0 +1,318 @@
+"""
+benchmark module
+
+implements micro-benchmarks for the proj3 bank database
+
+usage:
+    python benchmark.py insert [--history 0 1000 10000 100000] [--samples 200]
+    python benchmark.py pages [--history 0 1000 10000 100000] [--samples 200]
+    python benchmark.py profiles [--accounts 100] [--writes 2000] [--reads 5000]
+    python benchmark.py startup [--runs 5]
+    python benchmark.py close [--accounts 100000] [--sample 1000]
+"""
+
+# library modules
+import os
+import sys
+import time
+import subprocess
+from statistics import median
+import random
+import tempfile
+from contextlib import contextmanager
+from pathlib import Path
+from datetime import date, timedelta
+from argparse import ArgumentParser
+
+# SQL modules
+from sqlalchemy import insert, update, select
+from sqlalchemy.orm.session import sessionmaker
+
+# custom modules
+from db import PROFILES, create_bank_engine
+from migrations import upgrade
+from bank import Bank
+from account import Account
+from transaction import Transaction
+from replay import percentile
+from loader import bulk_load
+from workload import WorkloadGenerator, INTEREST
+from close import month_end_close
+import rollup
+
+
+@contextmanager
+def bench_bank(profile="default"):
+    """Yields a session and a new bank in a temporary database file"""
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_bank_engine(f"sqlite:///{Path(directory) / 'bench.db'}", profile)
+        upgrade(engine)
+        session = sessionmaker(bind=engine)()
+
+        bank = Bank()
+        session.add(bank)
+        session.commit()
+        try:
+            yield session, bank
+        finally:
+            session.close()
+            engine.dispose()
+
+
+def prefill(session, acct, rows: int, start: date) -> None:
+    """Inserts a history of $1 deposits (one per day, ending a month before start) with Core"""
+    if not rows:
+        return
+    first = start - timedelta(days=rows + 31)
+    session.execute(insert(Transaction.__table__),
+                    [{"_account_num": acct.num, "_amt_cents": 100, "_exempt": False,
+                      "_date": first + timedelta(days=day)} for day in range(rows)])
+    session.execute(update(Account.__table__)
+                    .where(Account.__table__.c._num == acct.num)
+                    .values(_balance_cents=Account.__table__.c._balance_cents + 100 * rows))
+    rollup.rebuild(session)
+    session.commit()
+
+
+def time_inserts(session, acct, samples: int, start: date) -> list:
+    """Times add_transaction calls (four per month to stay within savings limits)"""
+    latencies = []
+    for sample in range(samples):
+        when = start + timedelta(days=7 * sample)
+        began = time.perf_counter()
+        acct.add_transaction("1.00", session, date=when.isoformat())
+        latencies.append(time.perf_counter() - began)
+    return sorted(latencies)
+
+
+def bench_insert(histories: list, samples: int) -> None:
+    """Prints insert latency percentiles (ms) for growing transaction histories"""
+    start = (date(2000, 1, 1) + timedelta(days=max(histories) + 62)).replace(day=1)
+    print(f"{'history':>9}{'type':>10}{'p50':>9}{'p95':>9}{'p99':>9}")
+    for history in histories:
+        for acct_type in ("checking", "savings"):
+            with bench_bank() as (session, bank):
+                acct = bank.add_account(acct_type, session)
+                prefill(session, acct, history, start)
+
+                latencies = time_inserts(session, acct, samples, start)
+                print(f"{history:>9}{acct_type:>10}"
+                      + "".join(f"{percentile(latencies, p) * 1000:>9.3f}" for p in (50, 95, 99)))
+
+
+def bench_pages(histories: list, samples: int) -> None:
+    """Prints the latency (ms) of fetching the first and the last page of
+    the transaction listing for growing transaction histories"""
+    start = (date(2000, 1, 1) + timedelta(days=max(histories) + 62)).replace(day=1)
+    print(f"{'history':>9}{'first p50':>12}{'last p50':>12}")
+    for history in histories:
+        with bench_bank() as (session, bank):
+            acct = bank.add_account("checking", session)
+            prefill(session, acct, history, start)
+            acct.add_transaction("1.00", session, date=start.isoformat())
+            # a key after every transaction selects the last page
+            last_key = (start + timedelta(days=1), 0)
+
+            timings = {}
+            for name, keys in (("first", {}), ("last", {"before": last_key})):
+                latencies = []
+                for _ in range(samples):
+                    session.expunge_all()
+                    session.add(acct)
+                    began = time.perf_counter()
+                    acct.transaction_page(**keys)
+                    latencies.append(time.perf_counter() - began)
+                timings[name] = percentile(sorted(latencies), 50) * 1000
+            print(f"{history:>9}{timings['first']:>12.3f}{timings['last']:>12.3f}")
+
+
+def bench_profiles(accounts: int, writes: int, reads: int) -> None:
+    """Prints write, read and scan throughput (per second) for each storage profile
+
+    writes are committed deposits spread over the accounts, reads are
+    account lookups with the limit and sequence queries of a transaction,
+    and the scan is a full account summary
+    """
+    print(f"{'profile':>10}{'writes/s':>12}{'reads/s':>12}{'scan rows/s':>14}")
+    for profile in PROFILES:
+        rng = random.Random(0)
+        with bench_bank(profile) as (session, bank):
+            nums = [bank.add_account("checking", session).num for _ in range(accounts)]
+
+            began = time.perf_counter()
+            for write in range(writes):
+                acct = bank.get_account(nums[write % accounts])
+                day = date(2000, 1, 1) + timedelta(days=write // accounts)
+                acct.add_transaction("1.00", session, date=day.isoformat())
+            write_rate = writes / (time.perf_counter() - began)
+
+            session.expunge_all()
+            session.add(bank)
+            began = time.perf_counter()
+            for _ in range(reads):
+                acct = bank.get_account(rng.choice(nums))
+                newest = acct._last_date()
+                rollup.get_month(session, acct.num, newest)
+                session.expunge(acct)
+            read_rate = reads / (time.perf_counter() - began)
+
+            began = time.perf_counter()
+            rows = sum(1 for _ in bank.summary())
+            scan_rate = rows / (time.perf_counter() - began)
+
+            print(f"{profile:>10}{write_rate:>12,.0f}{read_rate:>12,.0f}{scan_rate:>14,.0f}")
+
+def _python_env(pycache: str) -> dict:
+    """Environment running the proj3 modules with bytecode cached in pycache"""
+    env = dict(os.environ, PYTHONPYCACHEPREFIX=pycache)
+    env.pop("PYTHONDONTWRITEBYTECODE", None)  # warm runs need the cache
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [str(Path(__file__).resolve().parent),
+                                                      env.get("PYTHONPATH")]))
+    return env
+
+
+def time_import(module: str, directory: str, pycache: str) -> float:
+    """Returns the seconds a new interpreter takes to import a module
+    (None if it cannot be imported here)"""
+    code = ("import time; began = time.perf_counter(); "
+            f"import {module}; print(time.perf_counter() - began)")
+    result = subprocess.run([sys.executable, "-c", code], cwd=directory, capture_output=True,
+                            text=True, env=_python_env(pycache))
+    return float(result.stdout) if result.returncode == 0 else None
+
+
+def _read_prompt(stream) -> None:
+    """Reads CLI output up to and including the next input prompt"""
+    while True:
+        char = stream.read(1)
+        if char in (b">", b""):
+            return
+
+
+def time_cli(directory: str, pycache: str) -> tuple:
+    """Starts BankCLI.py in a directory and returns the seconds until its
+    first prompt and until its first database command (summary) finished"""
+    script = Path(__file__).resolve().parent / "BankCLI.py"
+    began = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, "-u", str(script)], cwd=directory, bufsize=0,
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                            env=_python_env(pycache))
+    _read_prompt(proc.stdout)
+    prompt = time.perf_counter() - began
+    proc.stdin.write(b"2\n")
+    _read_prompt(proc.stdout)
+    ready = time.perf_counter() - began
+    proc.stdin.write(b"7\n")
+    proc.communicate()
+    return prompt, ready
+
+
+def _startup_run(start: str, measure):
+    """Calls measure(directory, pycache) in a new directory; a warm run
+    first starts the CLI once to fill the bytecode cache and the database"""
+    with tempfile.TemporaryDirectory() as directory:
+        pycache = str(Path(directory) / "pycache")
+        if start == "warm":
+            time_cli(directory, pycache)
+        return measure(directory, pycache)
+
+
+def bench_startup(runs: int) -> None:
+    """Prints median import and CLI startup times (ms) over several runs
+
+    cold runs start with an empty bytecode cache and no database (the
+    schema is created at startup); warm runs reuse both
+    """
+    timings: dict = {}
+    for _ in range(runs):
+        for start in ("cold", "warm"):
+            for module in ("BankCLI", "BankGUI"):
+                timings.setdefault((f"import {module}", start), []).append(
+                    _startup_run(start, lambda directory, pycache:
+                                 time_import(module, directory, pycache)))
+            prompt, ready = _startup_run(start, time_cli)
+            timings.setdefault(("CLI first prompt", start), []).append(prompt)
+            timings.setdefault(("CLI first command", start), []).append(ready)
+
+    print(f"{'':>20}{'cold':>10}{'warm':>10}")
+    for name in dict.fromkeys(name for name, _ in timings):
+        cells = []
+        for start in ("cold", "warm"):
+            samples = timings[name, start]
+            cells.append("n/a" if None in samples else f"{median(samples) * 1000:.1f}")
+        print(f"{name:>20}{cells[0]:>10}{cells[1]:>10}")
+
+
+def bench_close(accounts: int, sample: int) -> None:
+    """Prints the month-end close rate (accounts/s) of the per-account ORM
+    path on a sample of accounts and of the set-based close on the rest
+
+    the bank is bulk loaded from a one-month workload without interest
+    operations, so every account is due for interest
+    """
+    operations = (op for op in WorkloadGenerator(seed=0, accounts=accounts, months=1,
+                                                 monthly_rate=2.0)
+                  if op.kind != INTEREST)
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_bank_engine(f"sqlite:///{Path(directory) / 'bench.db'}", "bulk")
+        upgrade(engine)
+        began = time.perf_counter()
+        bulk_load(engine, operations)
+        print(f"loaded {accounts:,} accounts in {time.perf_counter() - began:.2f}s")
+
+        session = sessionmaker(bind=engine)()
+        nums = session.scalars(select(Account._num).order_by(Account._num).limit(sample)).all()
+        began = time.perf_counter()
+        for num in nums:
+            session.get(Account, num).interest_and_fees(session)
+        orm = time.perf_counter() - began
+        session.close()
+
+        began = time.perf_counter()
+        result = month_end_close(engine)
+        closed = time.perf_counter() - began
+        engine.dispose()
+
+    print(f"{'path':>12}{'accounts':>12}{'seconds':>10}{'accounts/s':>12}")
+    print(f"{'orm':>12}{len(nums):>12,}{orm:>10.2f}{len(nums) / orm:>12,.0f}")
+    print(f"{'set-based':>12}{result.accounts:>12,}{closed:>10.2f}"
+          f"{result.accounts / closed:>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Benchmark the proj3 bank database")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    insert_parser = subparsers.add_parser("insert", help="insert latency vs history size")
+    insert_parser.add_argument("--history", type=int, nargs="+", default=[0, 1000, 10000, 100000])
+    insert_parser.add_argument("--samples", type=int, default=200)
+
+    pages_parser = subparsers.add_parser("pages", help="transaction page latency vs history size")
+    pages_parser.add_argument("--history", type=int, nargs="+", default=[0, 1000, 10000, 100000])
+    pages_parser.add_argument("--samples", type=int, default=200)
+
+    profiles_parser = subparsers.add_parser("profiles", help="throughput of storage profiles")
+    profiles_parser.add_argument("--accounts", type=int, default=100)
+    profiles_parser.add_argument("--writes", type=int, default=2000)
+    profiles_parser.add_argument("--reads", type=int, default=5000)
+
+    startup_parser = subparsers.add_parser("startup", help="import and startup times of the CLI and GUI")
+    startup_parser.add_argument("--runs", type=int, default=5)
+
+    close_parser = subparsers.add_parser("close", help="month-end close: ORM vs set-based")
+    close_parser.add_argument("--accounts", type=int, default=100000)
+    close_parser.add_argument("--sample", type=int, default=1000,
+                              help="accounts closed one at a time with the ORM")
+
+    args = parser.parse_args()
+
+    if args.command == "insert":
+        bench_insert(args.history, args.samples)
+    elif args.command == "pages":
+        bench_pages(args.history, args.samples)
+    elif args.command == "profiles":
+        bench_profiles(args.accounts, args.writes, args.reads)
+    elif args.command == "startup":
+        bench_startup(args.runs)
+    elif args.command == "close":
+        bench_close(args.accounts, args.sample)
@@ -0,0 +1,81 @@
+"""
+changes module
+
+implements change notifications for the proj3 bank
+
+a ChangeFeed watches the sessions of a session factory, collects the
+accounts touched by each flush (new or updated accounts and accounts of
+new transactions) and tells its subscribers which accounts changed once
+the changes are committed; rolled back changes are never announced
+
+usage:
+    feed = ChangeFeed(Session)
+    feed.subscribe(lambda change: print(change.accounts, change.created))
+"""
+
+# library modules
+import logging
+from collections import namedtuple
+
+# SQL modules
+from sqlalchemy import event
+
+# custom modules
+from account import Account
+from transaction import Transaction
+
+# numbers of the accounts changed by a commit and of those it created
+Change = namedtuple("Change", ["accounts", "created"])
+
+
+class ChangeFeed:
+    """Announces committed account changes to subscribers
+
+    subscribers are called from within Session.commit(), where the
+    session cannot run queries; GUI subscribers should only schedule
+    their update (e.g. with after_idle)
+
+    constructor args:
+        session_factory (sessionmaker): factory of the sessions to watch
+    """
+
+    def __init__(self, session_factory) -> None:
+        self._subscribers: list = []
+        event.listen(session_factory, "after_flush", self._after_flush)
+        event.listen(session_factory, "after_commit", self._after_commit)
+        event.listen(session_factory, "after_rollback", self._after_rollback)
+
+    def subscribe(self, callback) -> None:
+        """Registers a callback taking a Change"""
+        self._subscribers.append(callback)
+
+    def unsubscribe(self, callback) -> None:
+        """Removes a registered callback"""
+        self._subscribers.remove(callback)
+
+    def _after_flush(self, session, flush_context) -> None:
+        accounts, created = session.info.setdefault("changes", (set(), set()))
+        for obj in session.new:
+            if isinstance(obj, Account):
+                created.add(obj._num)
+                accounts.add(obj._num)
+            elif isinstance(obj, Transaction):
+                accounts.add(obj._account_num)
+        for obj in session.dirty:
+            if isinstance(obj, Account):
+                accounts.add(obj._num)
+
+    def _after_commit(self, session) -> None:
+        accounts, created = session.info.pop("changes", (set(), set()))
+        if not accounts:
+            return
+        change = Change(frozenset(accounts), frozenset(created))
+        for callback in list(self._subscribers):
+            try:
+                callback(change)
+            except Exception as err:
+                # a failing subscriber must not fail the commit
+                logging.error(f"{type(err).__name__}: {repr(str(err))}")
+
+    def _after_rollback(self, session) -> None:
+        session.info.pop("changes", None)
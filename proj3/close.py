@@ -0,0 +1,182 @@
+"""
+close module
+
+implements the set-based month-end close of a proj3 bank
+
+the close adds interest and low-balance fees to every account of a bank
+whose interest was not triggered yet, with the results of calling
+Account.interest_and_fees on each account, but in a fixed number of
+statements inside one database transaction instead of a few queries and
+a commit per account:
+    1. the accounts to close, their posting date (end of the month of the
+       newest transaction, or of today) and interest go to a temp table,
+       then the checking accounts below their threshold get their fee
+    2. the interest and fee transactions are inserted with INSERT ... SELECT
+    3. one UPDATE adds them to the balances and sets _interest_triggered
+    4. the month rollups are upserted and the month hash trees extended
+
+interest is computed by a Python SQL function with the Decimal arithmetic
+of Account._interest (rounded to cents like a Transaction), and hash tree
+leaves are appended by another, so the rows written are exactly those of
+the per-account path
+
+usage:
+    python close.py [--database URL] [--profile bulk]
+"""
+
+# library modules
+import time
+from datetime import date
+from collections import namedtuple
+from argparse import ArgumentParser
+
+# SQL modules
+from sqlalchemy import text, select, func
+
+# custom modules
+from db import DATABASE, create_bank_engine
+from settings import ACCOUNT_LAYOUT, JOINED
+from migrations import upgrade
+from account import Account
+from transaction import to_cents, from_cents, interest
+from merkle import decode_tree, encode_frontier, leaf_hash, canonical
+
+# accounts closed and fees charged by a month-end close
+MonthClose = namedtuple("MonthClose", ["accounts", "fees"])
+
+# FROM clause of the accounts (a) and alias of the table holding the checking
+# columns, which depends on the account layout (see settings module)
+if ACCOUNT_LAYOUT == JOINED:
+    ACCOUNTS = "account AS a LEFT JOIN checkingaccount AS c ON c._num = a._num"
+    CHECKING = "c"
+else:
+    ACCOUNTS = "account AS a"
+    CHECKING = "a"
+
+STATEMENTS = (
+    "CREATE TEMP TABLE month_close ("
+    "num INTEGER PRIMARY KEY, day TEXT, month TEXT, balance INTEGER, interest INTEGER, "
+    "threshold INTEGER, fee INTEGER)",
+
+    # the newest date of an account is one seek on the (account, date) index
+    "INSERT INTO month_close (num, day, balance, interest, threshold, fee) "
+    "SELECT a._num, date(COALESCE((SELECT MAX(t._date) FROM \"transaction\" AS t "
+    "                              WHERE t._account_num = a._num), :today), "
+    "            'start of month', '+1 month', '-1 day'), "
+    "COALESCE(a._balance_cents, 0), "
+    "close_interest_cents(COALESCE(a._balance_cents, 0), a._interest_rate), "
+    f"{CHECKING}._balance_threshold, {CHECKING}._low_balance_fee "
+    f"FROM {ACCOUNTS} "
+    "WHERE a._bank_id = :bank_id AND NOT COALESCE(a._interest_triggered, 0)",
+
+    # fees are checked against the balance including the interest
+    "UPDATE month_close SET month = substr(day, 1, 7), "
+    "fee = CASE WHEN balance + interest < threshold * 100 THEN fee * 100 END",
+
+    "INSERT INTO \"transaction\" (_amt_cents, _date, _exempt, _account_num) "
+    "SELECT interest, day, 1, num FROM month_close ORDER BY num",
+
+    "INSERT INTO \"transaction\" (_amt_cents, _date, _exempt, _account_num) "
+    "SELECT fee, day, 1, num FROM month_close WHERE fee IS NOT NULL ORDER BY num",
+
+    "UPDATE account SET _balance_cents = balance + interest + COALESCE(fee, 0), "
+    "_interest_triggered = 1 "
+    "FROM month_close WHERE account._num = month_close.num",
+
+    # the day is the month's newest; its non-exempt count is kept if the
+    # month's last transaction is already dated on it
+    "INSERT INTO account_month "
+    "(_account_num, _month, _non_exempt, _exempt, _net_cents, _closing_cents, "
+    "_newest_date, _newest_non_exempt) "
+    "SELECT num, month, 0, 1 + (fee IS NOT NULL), interest + COALESCE(fee, 0), "
+    "balance + interest + COALESCE(fee, 0), day, 0 FROM month_close WHERE true "
+    "ON CONFLICT (_account_num, _month) DO UPDATE SET "
+    "_exempt = _exempt + excluded._exempt, "
+    "_net_cents = _net_cents + excluded._net_cents, "
+    "_closing_cents = excluded._closing_cents, "
+    "_newest_non_exempt = CASE WHEN _newest_date = excluded._newest_date "
+    "THEN _newest_non_exempt ELSE 0 END, "
+    "_newest_date = excluded._newest_date",
+
+    "INSERT OR IGNORE INTO month_hash (_account_num, _month, _count, _frontier) "
+    "SELECT num, month, 0, '' FROM month_close",
+
+    # the interest leaf of a month is appended before its fee leaf
+    "UPDATE month_hash SET _count = _count + 1, "
+    "_frontier = close_append_leaf(_frontier, _count, day, interest) "
+    "FROM month_close WHERE month_hash._account_num = num AND month_hash._month = month",
+
+    "UPDATE month_hash SET _count = _count + 1, "
+    "_frontier = close_append_leaf(_frontier, _count, day, fee) "
+    "FROM month_close WHERE month_hash._account_num = num AND month_hash._month = month "
+    "AND fee IS NOT NULL",
+)
+
+
+def interest_cents(balance_cents: int, rate: float) -> int:
+    """Interest of a balance in cents, computed like Account._interest"""
+    return to_cents(interest(from_cents(balance_cents), rate))
+
+
+def append_leaf(frontier: str, count: int, day: str, cents: int) -> str:
+    """Stored frontier of a month hash tree after an exempt transaction"""
+    tree = decode_tree(frontier, count)
+    tree.append(leaf_hash(canonical(date.fromisoformat(day), from_cents(cents), True)))
+    return encode_frontier(tree)
+
+
+def close_month(conn, bank_id: int, today=None) -> MonthClose:
+    """Adds month-end interest and fees to the accounts of a bank
+    (the caller commits; conn must be a SQLite connection in a transaction)
+
+    Args:
+        conn (Connection): connection with an open transaction
+        bank_id (int): id of the bank
+        today (date, default=None): posting month of accounts without
+            transactions (the current date if None)
+
+    Returns:
+        MonthClose: number of accounts closed and of fees charged
+    """
+    driver = conn.connection.driver_connection
+    driver.create_function("close_interest_cents", 2, interest_cents, deterministic=True)
+    driver.create_function("close_append_leaf", 4, append_leaf, deterministic=True)
+
+    params = {"bank_id": bank_id, "today": (today or date.today()).isoformat()}
+    conn.execute(text("DROP TABLE IF EXISTS temp.month_close"))
+    for statement in STATEMENTS:
+        conn.execute(text(statement), params)
+    accounts, fees = conn.execute(text("SELECT COUNT(*), COUNT(fee) FROM month_close")).one()
+    conn.execute(text("DROP TABLE temp.month_close"))
+    return MonthClose(accounts, fees)
+
+
+def month_end_close(engine, bank_id=None) -> MonthClose:
+    """Closes the month of a bank in a single transaction
+
+    Args:
+        engine (Engine): engine of an upgraded bank database
+        bank_id (int, default=None): id of the bank (the first bank if None)
+
+    Returns:
+        MonthClose: number of accounts closed and of fees charged
+    """
+    with engine.begin() as conn:
+        if bank_id is None:
+            bank_id = conn.scalar(select(func.min(Account.__table__.c._bank_id)))
+        return close_month(conn, bank_id)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Add month-end interest and fees to a proj3 bank")
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--profile", default="bulk", help="storage profile (see db.PROFILES)")
+    args = parser.parse_args()
+
+    engine = create_bank_engine(args.database, args.profile)
+    upgrade(engine)
+
+    began = time.perf_counter()
+    result = month_end_close(engine)
+    print(f"closed {result.accounts:,} accounts ({result.fees:,} fees) "
+          f"in {time.perf_counter() - began:.2f}s")
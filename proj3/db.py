@@ -1,8 +1,86 @@
-"""Database management module"""
+"""Database management module
+
+implements the declarative base and the engines of the bank; storage
+profiles (named SQLite tuning settings, see settings module) are applied
+to every new connection through an engine connect event
+"""
 
 # SQL modules
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.pool import QueuePool, NullPool, StaticPool, SingletonThreadPool
+
+# custom modules
+from settings import DATABASE, ASYNC_DATABASE, Profile, PROFILES
 
 # configure SQL information
 Base = declarative_base()
-DATABASE = "sqlite:///bank.db"
+
+POOLS = {
+    "queue": QueuePool,
+    "null": NullPool,
+    "static": StaticPool,
+    "singleton": SingletonThreadPool,
+}
+
+
+def _pragmas(profile: Profile) -> list:
+    """Returns the PRAGMA statements that apply a profile"""
+    return [f"PRAGMA {name} = {value}"
+            for name, value in zip(profile._fields, profile)
+            if value is not None and name != "pool"]
+
+
+def _listen(engine, settings: Profile) -> None:
+    """Applies the pragmas of a profile to every new connection of an engine"""
+    pragmas = _pragmas(settings)
+    if pragmas:
+        @event.listens_for(engine, "connect")
+        def apply_profile(dbapi_conn, _record) -> None:
+            cursor = dbapi_conn.cursor()
+            for pragma in pragmas:
+                cursor.execute(pragma)
+            cursor.close()
+
+
+def create_bank_engine(url=DATABASE, profile="default", **kwargs):
+    """Creates an engine whose connections are tuned by a storage profile
+
+    Args:
+        url (str, default=DATABASE): database URL
+        profile (str, default="default"): name of a profile in PROFILES
+        kwargs: passed on to create_engine
+
+    Returns:
+        Engine: engine for the bank database
+    """
+    settings = PROFILES[profile]
+    if settings.pool is not None:
+        kwargs.setdefault("poolclass", POOLS[settings.pool])
+    engine = create_engine(url, **kwargs)
+    _listen(engine, settings)
+    return engine
+
+
+def create_async_bank_engine(url=ASYNC_DATABASE, profile="default", **kwargs):
+    """Creates an asyncio engine (aiosqlite driver) tuned by a storage profile
+
+    the pool of a profile is ignored unless it also works with asyncio
+    (null or static); the default is the asyncio adapted queue pool
+
+    Args:
+        url (str, default=ASYNC_DATABASE): sqlite+aiosqlite database URL
+        profile (str, default="default"): name of a profile in PROFILES
+        kwargs: passed on to create_async_engine
+
+    Returns:
+        AsyncEngine: engine for the bank database
+    """
+    from sqlalchemy.ext.asyncio import create_async_engine  # needs greenlet
+
+    settings = PROFILES[profile]
+    if settings.pool in ("null", "static"):
+        kwargs.setdefault("poolclass", POOLS[settings.pool])
+    engine = create_async_engine(url, **kwargs)
+    _listen(engine.sync_engine, settings)
+    return engine
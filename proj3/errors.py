@@ -0,0 +1,22 @@
+"""
+errors module
+
+implements the exceptions raised by the account rules
+
+kept free of SQLAlchemy imports so the CLI and GUI can handle them
+without importing the database layer at startup (account re-exports them)
+"""
+
+
+class OverdrawError(Exception):
+    """Custom exception to handle overdrawn balance errors"""
+
+class TransactionLimitError(Exception):
+    """Custom exception to handle invalid transactions on Savings accounts"""
+
+class TransactionSequenceError(Exception):
+    """Custom exception to enforce chronological ordering of transactions"""
+
+    def __init__(self, latest_date):
+        super().__init__()
+        self.latest_date = latest_date
@@ -0,0 +1,237 @@
+"""
+export module
+
+implements a streaming export of proj3 transactions for downstream systems
+
+transactions are read with a single query whose rows are fetched
+batch_size at a time (yield_per), and every batch is written out before
+the next one is fetched, so memory use does not grow with the ledger;
+no account or relationship is loaded
+
+formats:
+    csv: id,account,date,amount,exempt with a header line
+    columns: compact binary with one block per batch; a block is the row
+        count (uint32) followed by each column as a little-endian array:
+        id (int64), account (int64), date (int32 proleptic ordinal),
+        amount in cents (int64), exempt (int8); see read_columns
+
+orders:
+    account: account number, date, id (read in index order)
+    date: date, id (sorted by SQLite, which spills to temp files)
+
+incremental runs keep a watermark file holding the highest transaction id
+exported so far; the next run exports only the rows with a higher id (ids
+only grow since transactions are never deleted) and the file is replaced
+once the export is complete
+
+usage:
+    python export.py OUT [--format csv|columns] [--order date|account]
+                         [--watermark FILE] [--database URL] [--batch-size 10000]
+"""
+
+# library modules
+import io
+import os
+import sys
+import csv
+import json
+import time
+import struct
+from array import array
+from collections import namedtuple
+from argparse import ArgumentParser
+
+# SQL modules
+from sqlalchemy import select, func
+
+# custom modules
+from db import DATABASE, create_bank_engine
+from migrations import upgrade
+from transaction import Transaction, from_cents
+
+CSV = "csv"
+COLUMNS = "columns"
+
+# first bytes of a columns export
+MAGIC = b"P3TX\x01"
+
+# array typecode of each column of a columns block
+COLUMN_TYPES = (("id", "q"), ("account", "q"), ("date", "i"), ("amount_cents", "q"),
+                ("exempt", "b"))
+
+ORDERS = {
+    "account": (Transaction._account_num, Transaction._date, Transaction._id),
+    "date": (Transaction._date, Transaction._id),
+}
+
+# rows written by an export and the watermark to pass to the next one
+ExportResult = namedtuple("ExportResult", ["rows", "watermark"])
+
+
+def export_query(order="date", after=0, upto=None):
+    """Returns the query for the exported transaction rows
+
+    Args:
+        order (str, default="date"): "date" or "account" (see ORDERS)
+        after (int, default=0): only rows with a higher id (the watermark)
+        upto (int, default=None): only rows with this id or lower
+
+    Returns:
+        Select: id, account number, date, cents and exempt flag
+    """
+    query = (select(Transaction._id, Transaction._account_num, Transaction._date,
+                    Transaction._amt_cents, Transaction._exempt)
+             .where(Transaction._id > after)
+             .order_by(*ORDERS[order]))
+    if upto is not None:
+        query = query.where(Transaction._id <= upto)
+    return query
+
+
+class CsvWriter:
+    """Writes batches of transaction rows as CSV text to a binary file"""
+
+    def __init__(self, file) -> None:
+        self._text = io.TextIOWrapper(file, encoding="utf-8", newline="", write_through=True)
+        self._csv = csv.writer(self._text)
+        self._csv.writerow(("id", "account", "date", "amount", "exempt"))
+
+    def write(self, rows: list) -> None:
+        self._csv.writerows((trans_id, num, day.isoformat(), from_cents(cents), int(exempt))
+                            for trans_id, num, day, cents, exempt in rows)
+
+    def close(self) -> None:
+        self._text.detach()  # leave the file open for its owner
+
+
+class ColumnsWriter:
+    """Writes batches of transaction rows as blocks of the columns format"""
+
+    def __init__(self, file) -> None:
+        self._file = file
+        self._file.write(MAGIC)
+
+    def write(self, rows: list) -> None:
+        ids, nums, days, cents, exempt = zip(*rows)
+        columns = (ids, nums, [day.toordinal() for day in days], cents,
+                   [int(flag) for flag in exempt])
+        self._file.write(struct.pack("<I", len(rows)))
+        for (_, typecode), values in zip(COLUMN_TYPES, columns):
+            column = array(typecode, values)
+            if sys.byteorder == "big":
+                column.byteswap()
+            self._file.write(column.tobytes())
+
+    def close(self) -> None:
+        pass
+
+
+WRITERS = {CSV: CsvWriter, COLUMNS: ColumnsWriter}
+
+
+def read_columns(file):
+    """Yields the blocks of a columns export as dicts of column arrays
+    (dates stay proleptic ordinals, see date.fromordinal)
+
+    Raises:
+        ValueError: the file is not a columns export
+    """
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("not a proj3 columns export")
+    while header := file.read(4):
+        (count,) = struct.unpack("<I", header)
+        block = {}
+        for name, typecode in COLUMN_TYPES:
+            column = array(typecode)
+            column.frombytes(file.read(count * column.itemsize))
+            if sys.byteorder == "big":
+                column.byteswap()
+            block[name] = column
+        yield block
+
+
+def export(engine, file, fmt=CSV, order="date", after=0, batch_size=10000) -> ExportResult:
+    """Streams the transactions added after a watermark to a binary file
+
+    the highest transaction id is read first and the export stops at
+    it, so the returned watermark covers exactly the rows written (rows
+    committed during the export go to the next one)
+
+    Args:
+        engine (Engine): engine of an upgraded bank database
+        file (BinaryIO): file written to
+        fmt (str, default="csv"): "csv" or "columns"
+        order (str, default="date"): "date" or "account"
+        after (int, default=0): watermark of the previous export
+        batch_size (int, default=10000): rows fetched and written at a time
+
+    Returns:
+        ExportResult: number of rows written and the new watermark
+    """
+    writer = WRITERS[fmt](file)
+    rows = 0
+    with engine.connect() as conn:
+        upto = conn.scalar(select(func.max(Transaction._id))) or after
+        result = (conn.execution_options(yield_per=batch_size)
+                  .execute(export_query(order, after, upto)))
+        for batch in result.partitions():
+            writer.write(batch)
+            rows += len(batch)
+    writer.close()
+    return ExportResult(rows, max(after, upto))
+
+
+def load_watermark(path: str) -> int:
+    """Returns the watermark stored in a file (0 if it does not exist)"""
+    try:
+        with open(path, encoding="utf-8") as file:
+            return json.load(file)["transaction_id"]
+    except FileNotFoundError:
+        return 0
+
+
+def save_watermark(path: str, watermark: int) -> None:
+    """Replaces the watermark file (atomically, so a failed run keeps the old one)"""
+    with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+        json.dump({"transaction_id": watermark}, file)
+    os.replace(f"{path}.tmp", path)
+
+
+def _peak_memory() -> str:
+    """Formats the peak resident memory of the process (Unix only)"""
+    try:
+        import resource
+    except ImportError:
+        return "n/a"
+    return f"{resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024:,.1f} MB"
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Export proj3 transactions")
+    parser.add_argument("out", help="file written (- for stdout)")
+    parser.add_argument("--format", choices=list(WRITERS), default=CSV)
+    parser.add_argument("--order", choices=list(ORDERS), default="date")
+    parser.add_argument("--watermark", help="file of the last exported id (incremental runs)")
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    args = parser.parse_args()
+
+    engine = create_bank_engine(args.database)
+    upgrade(engine)
+    after = load_watermark(args.watermark) if args.watermark else 0
+
+    began = time.perf_counter()
+    if args.out == "-":
+        result = export(engine, sys.stdout.buffer, args.format, args.order, after,
+                        args.batch_size)
+        sys.stdout.buffer.flush()
+    else:
+        with open(args.out, "wb") as out:
+            result = export(engine, out, args.format, args.order, after, args.batch_size)
+    elapsed = time.perf_counter() - began
+
+    if args.watermark:
+        save_watermark(args.watermark, result.watermark)
+    print(f"exported {result.rows:,} transactions after #{after} in {elapsed:.2f}s "
+          f"({result.rows / elapsed:,.0f} rows/s, peak memory {_peak_memory()}), "
+          f"watermark #{result.watermark}", file=sys.stderr)
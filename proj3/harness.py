@@ -0,0 +1,292 @@
+"""
+harness module
+
+implements a seeded large-database benchmark harness for the proj3 bank
+
+seed writes a reproducible bank database of a given size (accounts,
+transactions per account, savings/checking mix) with the bulk loader;
+run times the code paths behind the CLI and GUI commands on sampled
+accounts and checks each of them against thresholds:
+    statements: SQL statements per call (a new N+1 pattern or an extra
+        round trip per call exceeds it)
+    plans: EXPLAIN QUERY PLAN of every statement executed; a full SCAN of
+        a table not allowed for the command, or a temp B-tree for an
+        ORDER BY / GROUP BY, means an index is missing or not used
+
+run adds a transaction and interest to each sampled account (dated in
+the month after its newest transaction), so it can be repeated on the
+same database; the exit status is 1 if a threshold fails
+
+usage:
+    python harness.py seed [--database sqlite:///bench.db] [--accounts 10000]
+                           [--transactions 50] [--savings 0.5] [--seed 0]
+    python harness.py run [--database sqlite:///bench.db] [--samples 200] [--seed 0]
+"""
+
+# library modules
+import io
+import sys
+import time
+import random
+from datetime import date, timedelta
+from collections import namedtuple
+from argparse import ArgumentParser
+
+# SQL modules
+from sqlalchemy import event, select
+from sqlalchemy.orm.session import sessionmaker
+
+# custom modules
+from db import create_bank_engine
+from migrations import upgrade
+from bank import Bank, SAVINGS, CHECKING
+from account import Account
+from loader import bulk_load
+from workload import Operation, OPEN, TRANSACTION
+from instrument import Instrumentation
+from replay import percentile
+
+BENCH_DATABASE = "sqlite:///bench.db"
+
+# first day of a seeded history (transactions are a week apart, so
+# savings accounts stay within their day and month limits)
+SEED_START = date(2000, 1, 3)
+
+# limits of a command: SQL statements per call and the tables it may scan
+Check = namedtuple("Check", ["max_statements", "scans"])
+
+CHECKS = {
+    "get_account": Check(1, ()),
+    "balance": Check(1, ()),
+    "transaction_page": Check(2, ()),
+    "add_transaction": Check(12, ()),
+    "interest_and_fees": Check(13, ()),
+    "summary": Check(1, ("account",)),
+    "gui_account_window": Check(2, ()),
+    "gui_account_view": Check(3, ()),
+}
+
+# calls of the commands that read every account
+SUMMARY_SAMPLES = 3
+
+# one timed command: latencies (s), statements per call, plan problems
+Result = namedtuple("Result", ["name", "latencies", "statements", "plan_problems"])
+
+
+def seed_operations(accounts: int, transactions: int, savings: float, seed=0):
+    """Yields the workload operations of a seeded bank
+
+    every account is opened with a deposit and gets transactions - 1
+    more, one a week: deposits, and every fourth a small withdrawal
+    """
+    rng = random.Random(seed)
+    for slot in range(accounts):
+        acct_type = SAVINGS if rng.random() < savings else CHECKING
+        yield Operation(OPEN, slot, f"{rng.uniform(500, 2000):.2f}", SEED_START, acct_type)
+    for slot in range(accounts):
+        for week in range(1, transactions):
+            amount = -rng.uniform(1, 20) if week % 4 == 0 else rng.uniform(10, 200)
+            yield Operation(TRANSACTION, slot, f"{amount:.2f}",
+                            SEED_START + timedelta(weeks=week))
+
+
+def seed_database(url: str, accounts: int, transactions: int, savings: float, seed=0) -> str:
+    """Writes a seeded bank to a new or empty database
+
+    Returns:
+        str: report of the rows loaded
+    """
+    engine = create_bank_engine(url, "bulk")
+    upgrade(engine)
+    began = time.perf_counter()
+    loader = bulk_load(engine, seed_operations(accounts, transactions, savings, seed))
+    engine.dispose()
+    return loader.report(time.perf_counter() - began)
+
+
+class PlanRecorder:
+    """Records the statements (and parameters) an engine executes"""
+
+    def __init__(self, engine) -> None:
+        self._executed: list = []
+        event.listen(engine, "before_cursor_execute", self._record)
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        if not executemany:
+            self._executed.append((statement, parameters))
+
+    def take(self) -> list:
+        """Returns and forgets the statements recorded so far"""
+        executed, self._executed = self._executed, []
+        return executed
+
+
+def plan_problems(conn, executed: list, scans: tuple) -> set:
+    """Returns the problems of the query plans of executed statements
+
+    Args:
+        conn (Connection): connection to the database
+        executed (list): (statement, parameters) pairs
+        scans (tuple): tables the statements may scan in full
+
+    Returns:
+        set: problem descriptions (empty if every plan is fine)
+    """
+    problems = set()
+    seen = set()
+    for statement, parameters in executed:
+        if statement in seen or not statement.lstrip().upper().startswith(("SELECT", "UPDATE",
+                                                                            "DELETE")):
+            continue
+        seen.add(statement)
+        for *_, detail in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters):
+            words = detail.split()
+            if words[0] == "SCAN" and not words[1].startswith("(") and words[1] not in scans:
+                problems.add(detail)
+            elif "TEMP B-TREE" in detail:
+                problems.add(detail)
+    return problems
+
+
+class Harness:
+    """Times the CLI and GUI code paths on a bank database
+
+    constructor args:
+        url (str): database URL of a seeded bank
+        samples (int): calls of each command (on sampled accounts)
+        seed (int, default=0): seed for sampling accounts
+    """
+
+    def __init__(self, url: str, samples: int, seed=0) -> None:
+        self._engine = create_bank_engine(url)
+        upgrade(self._engine)
+        self._sessions = sessionmaker(bind=self._engine)
+        self._instrumentation = Instrumentation(self._engine, self._sessions, io.StringIO())
+        self._recorder = PlanRecorder(self._engine)
+
+        session = self._sessions()
+        nums = session.scalars(select(Account._num)).all()
+        self._count = len(nums)
+        self._nums = random.Random(seed).sample(nums, min(samples, len(nums)))
+        session.close()
+
+    def _time(self, name: str, calls) -> Result:
+        """Times calls of func(session, bank), each with a new session"""
+        latencies, statements = [], []
+        executed = []
+        for call in calls:
+            session = self._sessions()
+            bank = session.scalars(select(Bank).limit(1)).one()
+            session.info["bank_id"] = bank._id  # as cached by the GUI worker's session
+            self._recorder.take()
+            began = time.perf_counter()
+            with self._instrumentation.command(name) as stats:
+                call(session, bank)
+            latencies.append(time.perf_counter() - began)
+            statements.append(stats.statements)
+            executed.extend(self._recorder.take())
+            session.close()
+        with self._engine.connect() as conn:
+            problems = plan_problems(conn, executed, CHECKS[name].scans)
+        return Result(name, sorted(latencies), max(statements), problems)
+
+    def run(self) -> list:
+        """Times every command
+
+        Returns:
+            list: Result of each command
+        """
+        def new_month(acct) -> str:
+            newest = acct.newest_date
+            return (Account._end_of_month(newest) + timedelta(days=1)).isoformat()
+
+        def each(func) -> list:
+            return [lambda session, bank, num=num: func(session, bank, num) for num in self._nums]
+
+        results = [
+            self._time("get_account", each(lambda session, bank, num: bank.get_account(num))),
+            self._time("balance", each(lambda session, bank, num:
+                                       bank.get_account(num).balance)),
+            self._time("transaction_page", each(lambda session, bank, num:
+                                                bank.get_account(num).transaction_page())),
+            self._time("add_transaction", each(
+                lambda session, bank, num: (lambda acct: acct.add_transaction(
+                    "10.00", session, date=new_month(acct)))(bank.get_account(num)))),
+            self._time("interest_and_fees", each(lambda session, bank, num:
+                                                 bank.get_account(num).interest_and_fees(session))),
+            self._time("summary", [lambda session, bank: [str(row) for row in bank.summary()]]
+                       * SUMMARY_SAMPLES),
+        ]
+
+        try:
+            import BankGUI
+        except ImportError:
+            return results  # no tkinter: only the CLI paths
+        results.append(self._time("gui_account_window", [
+            lambda session, bank, num=num:
+                BankGUI._account_window(session, None, {"after": num}, 50, True)
+            for num in self._nums]))
+        results.append(self._time("gui_account_view", each(
+            lambda session, bank, num: BankGUI._account_view(session, None, num, {}))))
+        return results
+
+    def close(self) -> None:
+        self._instrumentation.close()
+        self._engine.dispose()
+
+
+def failures(results: list) -> list:
+    """Returns a description of every threshold a result exceeds"""
+    failed = []
+    for result in results:
+        check = CHECKS[result.name]
+        if result.statements > check.max_statements:
+            failed.append(f"{result.name}: {result.statements} statements per call "
+                          f"(at most {check.max_statements})")
+        for problem in sorted(result.plan_problems):
+            failed.append(f"{result.name}: query plan {problem!r}")
+    return failed
+
+
+def report(results: list) -> str:
+    """Formats the latency percentiles (ms) and statement counts of the results"""
+    lines = [f"{'command':>20}{'calls':>7}{'p50':>9}{'p95':>9}{'max':>9}{'stmts':>7}{'limit':>7}"]
+    for result in results:
+        lines.append(f"{result.name:>20}{len(result.latencies):>7}"
+                     + "".join(f"{percentile(result.latencies, pct) * 1000:>9.2f}"
+                               for pct in (50, 95, 100))
+                     + f"{result.statements:>7}{CHECKS[result.name].max_statements:>7}")
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Seeded large-database benchmark of the proj3 bank")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    seed_parser = subparsers.add_parser("seed", help="write a seeded bank database")
+    seed_parser.add_argument("--database", default=BENCH_DATABASE)
+    seed_parser.add_argument("--accounts", type=int, default=10000)
+    seed_parser.add_argument("--transactions", type=int, default=50,
+                             help="transactions per account")
+    seed_parser.add_argument("--savings", type=float, default=0.5,
+                             help="fraction of savings accounts")
+    seed_parser.add_argument("--seed", type=int, default=0)
+
+    run_parser = subparsers.add_parser("run", help="time and check the CLI and GUI paths")
+    run_parser.add_argument("--database", default=BENCH_DATABASE)
+    run_parser.add_argument("--samples", type=int, default=200)
+    run_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "seed":
+        print(seed_database(args.database, args.accounts, args.transactions, args.savings,
+                            args.seed))
+    elif args.command == "run":
+        harness = Harness(args.database, args.samples, args.seed)
+        results = harness.run()
+        harness.close()
+        print(report(results))
+        failed = failures(results)
+        for failure in failed:
+            print(f"FAIL {failure}")
+        sys.exit(1 if failed else 0)
@@ -0,0 +1,198 @@
+"""
+instrument module
+
+implements SQL instrumentation of user commands for the proj3 bank
+
+engine events (before/after_cursor_execute) time every statement and
+count the rows it wrote; session events count flushes, commits, loaded
+objects and lazy loads (relationship loads and reloads of expired
+attributes); statements are grouped per user command (the command running on the
+thread that executes them), and a statement text executed N_PLUS_ONE or
+more times in one command is flagged as a likely N+1 query pattern
+
+usage:
+    instrumentation = Instrumentation(engine, Session, output)
+    with instrumentation.command("summary"):
+        ...
+    instrumentation.close()  # removes the event listeners
+"""
+
+# library modules
+import sys
+import time
+import threading
+from contextlib import contextmanager
+from collections import Counter
+
+# SQL modules
+from sqlalchemy import event
+
+# custom modules
+from db import Base
+
+# executions of one statement text in a command flagged as N+1
+N_PLUS_ONE = 5
+
+
+class CommandStats:
+    """SQL activity recorded during one user command"""
+
+    def __init__(self, name: str) -> None:
+        self._name = name
+        self._started = time.perf_counter()
+        self._elapsed = 0.0
+        self._statements = Counter()
+        self._kinds = Counter()
+        self._sql_time = 0.0
+        self._rows_written = 0
+        self._loaded = 0
+        self._lazy_loads = Counter()
+        self._flushes = 0
+        self._commits = 0
+
+    def _get_statements(self) -> int:
+        """Getter for the number of statements executed"""
+        return sum(self._statements.values())
+
+    statements = property(_get_statements)
+
+    def _get_lazy_loads(self) -> int:
+        """Getter for the number of lazy loads triggered"""
+        return sum(self._lazy_loads.values())
+
+    lazy_loads = property(_get_lazy_loads)
+
+    def n_plus_one(self) -> list:
+        """Returns (count, statement) pairs of statements repeated N_PLUS_ONE times or more"""
+        return [(count, statement) for statement, count in self._statements.most_common()
+                if count >= N_PLUS_ONE and statement.startswith("SELECT")]
+
+    def report(self) -> str:
+        """Formats the statistics of the command"""
+        kinds = ", ".join(f"{kind} {count}" for kind, count in self._kinds.most_common())
+        lines = [f"command: {self._name} ({self._elapsed * 1000:.2f} ms)",
+                 f"  statements: {self.statements} ({kinds or 'none'}), "
+                 f"sql time {self._sql_time * 1000:.2f} ms",
+                 f"  rows written {self._rows_written}, objects loaded {self._loaded}, "
+                 f"flushes {self._flushes}, commits {self._commits}, "
+                 f"lazy loads {self.lazy_loads}"]
+        for target, count in self._lazy_loads.most_common():
+            lines.append(f"  lazy load: {count}x {target}")
+        for count, statement in self.n_plus_one():
+            lines.append(f"  possible N+1: {count}x {' '.join(statement.split())[:120]}")
+        return "\n".join(lines)
+
+
+class _Commands(threading.local):
+    """Command being recorded on each thread (None outside commands)"""
+
+    def __init__(self) -> None:
+        self.current: CommandStats = None
+
+
+class Instrumentation:
+    """Records SQL activity of an engine and its sessions per user command
+
+    constructor args:
+        engine (Engine): engine whose statements are recorded
+        session_factory (sessionmaker): factory of the sessions to watch
+        output (file, default=sys.stdout): where command reports are written
+    """
+
+    def __init__(self, engine, session_factory, output=None) -> None:
+        self._output = output or sys.stdout
+        self._commands = _Commands()
+        self._history: list = []
+        self._lock = threading.Lock()
+
+        self._listeners = [
+            (engine, "before_cursor_execute", self._before_execute),
+            (engine, "after_cursor_execute", self._after_execute),
+            (session_factory, "do_orm_execute", self._orm_execute),
+            (session_factory, "after_flush", self._after_flush),
+            (session_factory, "after_commit", self._after_commit),
+        ]
+        for target, name, listener in self._listeners:
+            event.listen(target, name, listener)
+        event.listen(Base, "load", self._load, propagate=True)
+
+    def close(self) -> None:
+        """Removes the event listeners (the mapped classes keep the load
+        listener for the life of the process otherwise)"""
+        if not self._listeners:
+            return  # already closed
+        for target, name, listener in self._listeners:
+            event.remove(target, name, listener)
+        event.remove(Base, "load", self._load)
+        self._listeners = []
+
+    def _get_current(self) -> CommandStats:
+        """Getter for the command recorded on the calling thread"""
+        return self._commands.current
+
+    _current = property(_get_current)
+
+    @contextmanager
+    def command(self, name: str):
+        """Records the SQL activity inside the block as one command
+        and writes its report when the block exits"""
+        outer, stats = self._commands.current, CommandStats(name)
+        self._commands.current = stats
+        try:
+            yield stats
+        finally:
+            stats._elapsed = time.perf_counter() - stats._started
+            self._commands.current = outer
+            with self._lock:
+                self._history.append(stats)
+                print(stats.report(), file=self._output, flush=True)
+
+    def traced(self, name: str, func):
+        """Wraps a callback so each call is recorded as a command"""
+        def wrapper(*args, **kwargs):
+            with self.command(name):
+                return func(*args, **kwargs)
+        return wrapper
+
+    def _get_history(self) -> list:
+        """Getter for the statistics of every finished command"""
+        return self._history
+
+    history = property(_get_history)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        conn.info.setdefault("query_start", []).append(time.perf_counter())
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany) -> None:
+        started = conn.info["query_start"].pop()
+        stats = self._current
+        if stats is None:
+            return
+        stats._sql_time += time.perf_counter() - started
+        stats._statements[statement] += 1
+        stats._kinds[statement.split(None, 1)[0].upper()] += 1
+        if cursor.rowcount > 0:
+            stats._rows_written += cursor.rowcount
+
+    def _orm_execute(self, orm_execute_state) -> None:
+        stats = self._current
+        if stats is None:
+            return
+        if orm_execute_state.is_relationship_load:
+            path = orm_execute_state.loader_strategy_path
+            stats._lazy_loads[str(path[-1]) if len(path) else "relationship"] += 1
+        elif orm_execute_state.is_column_load:
+            mapper = orm_execute_state.bind_mapper
+            stats._lazy_loads[f"{mapper.class_.__name__} expired attributes"] += 1
+
+    def _after_flush(self, session, flush_context) -> None:
+        if self._current is not None:
+            self._current._flushes += 1
+
+    def _after_commit(self, session) -> None:
+        if self._current is not None:
+            self._current._commits += 1
+
+    def _load(self, target, context) -> None:
+        if self._current is not None:
+            self._current._loaded += 1
@@ -0,0 +1,182 @@
+"""
+layout module
+
+implements the conversion of bank databases between the joined and
+single account layouts (see settings module) and a benchmark of both
+
+the models map one layout per process (PROJ3_ACCOUNT_LAYOUT), while the
+conversion is plain SQL, so it runs whatever layout is mapped:
+    joined -> single: the subtype columns are added to the account table,
+        filled from the subtype tables, and the subtype tables dropped
+    single -> joined: the subtype tables are created and filled from the
+        account rows of their type, and the columns dropped from account
+
+usage:
+    python layout.py convert single|joined [--database URL]
+    python layout.py bench [--accounts 5000] [--lookups 5000]
+"""
+
+# library modules
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import subprocess
+from pathlib import Path
+from argparse import ArgumentParser
+
+# SQL modules
+from sqlalchemy import event, select
+from sqlalchemy.orm.session import sessionmaker
+
+# custom modules
+from db import DATABASE, create_bank_engine
+from settings import JOINED, SINGLE
+from migrations import account_layout, upgrade
+
+# columns of each subtype table (named after the polymorphic identity)
+SUBTYPES = {
+    "savingsaccount": ("_day_lim", "_month_lim"),
+    "checkingaccount": ("_balance_threshold", "_low_balance_fee"),
+}
+
+
+def _to_single(conn) -> None:
+    for table, columns in SUBTYPES.items():
+        for column in columns:
+            conn.exec_driver_sql(f"ALTER TABLE account ADD COLUMN {column} INTEGER")
+        names = ", ".join(columns)
+        values = ", ".join(f"s.{column}" for column in columns)
+        conn.exec_driver_sql(f"UPDATE account SET ({names}) = ({values}) "
+                             f"FROM {table} AS s WHERE s._num = account._num")
+        conn.exec_driver_sql(f"DROP TABLE {table}")
+
+
+def _to_joined(conn) -> None:
+    for table, columns in SUBTYPES.items():
+        definitions = "".join(f"{column} INTEGER, " for column in columns)
+        conn.exec_driver_sql(f"CREATE TABLE {table} (_num INTEGER NOT NULL, {definitions}"
+                             "PRIMARY KEY (_num), FOREIGN KEY(_num) REFERENCES account (_num))")
+        names = ", ".join(columns)
+        conn.exec_driver_sql(f"INSERT INTO {table} (_num, {names}) "
+                             f"SELECT _num, {names} FROM account WHERE _type = ?", (table,))
+        for column in columns:
+            conn.exec_driver_sql(f"ALTER TABLE account DROP COLUMN {column}")
+
+
+def convert(conn, target: str) -> bool:
+    """Converts a database to an account layout (the caller commits)
+
+    Args:
+        conn (Connection): connection with an open transaction
+        target (str): "joined" or "single"
+
+    Returns:
+        bool: False if the database already had the layout
+    """
+    if account_layout(conn) in (None, target):
+        return False
+    if target == SINGLE:
+        _to_single(conn)
+    else:
+        _to_joined(conn)
+    return True
+
+
+def measure(accounts: int, lookups: int) -> dict:
+    """Times account inserts, loads, lookups and summaries with the layout
+    mapped by this process, in a temporary database
+
+    Returns:
+        dict: operations per second and statements per lookup
+    """
+    from bank import Bank, SAVINGS, CHECKING
+    from account import Account
+
+    rng = random.Random(0)
+    with tempfile.TemporaryDirectory() as directory:
+        engine = create_bank_engine(f"sqlite:///{Path(directory) / 'bench.db'}", "bulk")
+        upgrade(engine)
+        statements = []
+        event.listen(engine, "before_cursor_execute", lambda *args: statements.append(1))
+        session = sessionmaker(bind=engine)()
+        bank = Bank()
+        session.add(bank)
+        session.commit()
+
+        results = {}
+        began = time.perf_counter()
+        nums = [bank.add_account(SAVINGS if index % 2 else CHECKING, session).num
+                for index in range(accounts)]
+        results["insert/s"] = accounts / (time.perf_counter() - began)
+
+        # every account with the column its rules read (a subtype column)
+        session.expunge_all()
+        began = time.perf_counter()
+        for acct in session.scalars(select(Account)).all():
+            getattr(acct, "_day_lim", None) or getattr(acct, "_balance_threshold", None)
+        results["load/s"] = accounts / (time.perf_counter() - began)
+
+        session.expunge_all()
+        bank = session.query(Bank).first()
+        statements.clear()
+        began = time.perf_counter()
+        for _ in range(lookups):
+            acct = bank.get_account(rng.choice(nums))
+            getattr(acct, "_day_lim", None) or getattr(acct, "_balance_threshold", None)
+            session.expunge(acct)
+        results["lookup/s"] = lookups / (time.perf_counter() - began)
+        results["queries/lookup"] = len(statements) / lookups
+
+        began = time.perf_counter()
+        rows = sum(1 for _ in bank.summary())
+        results["summary rows/s"] = rows / (time.perf_counter() - began)
+
+        session.close()
+        engine.dispose()
+    return results
+
+
+def bench(accounts: int, lookups: int) -> None:
+    """Prints the measurements of both layouts (each in its own process,
+    since a process maps a single layout)"""
+    results = {}
+    for layout in (JOINED, SINGLE):
+        out = subprocess.run([sys.executable, __file__, "measure", "--accounts", str(accounts),
+                              "--lookups", str(lookups)],
+                             env=dict(os.environ, PROJ3_ACCOUNT_LAYOUT=layout),
+                             capture_output=True, text=True, check=True).stdout
+        results[layout] = json.loads(out)
+
+    print(f"{'':>16}{JOINED:>12}{SINGLE:>12}")
+    for name in results[JOINED]:
+        print(f"{name:>16}{results[JOINED][name]:>12,.1f}{results[SINGLE][name]:>12,.1f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Account layouts of proj3 bank databases")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    convert_parser = subparsers.add_parser("convert", help="convert a database to a layout")
+    convert_parser.add_argument("layout", choices=[JOINED, SINGLE])
+    convert_parser.add_argument("--database", default=DATABASE)
+
+    for name, help_text in (("bench", "compare the layouts"),
+                            ("measure", "measure the mapped layout (used by bench)")):
+        bench_parser = subparsers.add_parser(name, help=help_text)
+        bench_parser.add_argument("--accounts", type=int, default=5000)
+        bench_parser.add_argument("--lookups", type=int, default=5000)
+    args = parser.parse_args()
+
+    if args.command == "convert":
+        engine = create_bank_engine(args.database)
+        with engine.begin() as conn:
+            converted = convert(conn, args.layout)
+        print(f"converted to the {args.layout} layout" if converted
+              else f"already in the {args.layout} layout")
+    elif args.command == "bench":
+        bench(args.accounts, args.lookups)
+    elif args.command == "measure":
+        print(json.dumps(measure(args.accounts, args.lookups)))
@@ -0,0 +1,293 @@
+"""
+loader module
+
+implements a bulk loader for proj3 bank databases
+
+a workload (see workload module) is validated in memory with the same
+rules as Account.add_transaction and Account.interest_and_fees, and the
+accepted accounts, transactions, month hashes and month rollups are
+written with Core executemany inserts in large batches, all inside one
+database transaction; secondary transaction indexes are dropped for the
+load and rebuilt once at the end
+
+usage:
+    python loader.py WORKLOAD [--database URL] [--batch-size 50000] [--keep-indexes]
+    python workload.py --accounts 10000 --months 24 | python loader.py -
+"""
+
+# library modules
+import sys
+import time
+from decimal import Decimal
+from datetime import date
+from collections import Counter
+from argparse import ArgumentParser
+
+# SQL modules
+from sqlalchemy import insert, select, func
+
+# custom modules
+from db import DATABASE, create_bank_engine
+from migrations import upgrade
+from bank import Bank, SAVINGS, CHECKING
+from account import (Account, SavingsAccount, CheckingAccount, OverdrawError,
+                     TransactionLimitError, TransactionSequenceError)
+from transaction import Transaction, to_cents, from_cents, interest
+from merkle import MerkleTree, MonthHash, leaf_hash, canonical
+from rollup import AccountMonth, month_of
+from workload import OPEN, TRANSACTION, INTEREST, load
+
+# account classes and the prototype holding their rule parameters
+ACCOUNT_CLASSES = {SAVINGS: SavingsAccount, CHECKING: CheckingAccount}
+
+
+class AccountState:
+    """In-memory state of an account during a load (mirrors Account rules)
+
+    accepted transactions of an account are never dated before its newest
+    one, so the hash tree and totals of a month are final once a later
+    month starts; the non-exempt counts of every day and month are kept,
+    because a backdated transaction is checked against the limits of its
+    own day and month before the sequence check rejects it (as in
+    SavingsAccount._check_limits, so both report the same error)
+
+    constructor args:
+        num (int): account number
+        acct_type (str): "savings" or "checking"
+        loader (BulkLoader): receives the rows of accepted transactions
+    """
+
+    def __init__(self, num: int, acct_type: str, loader) -> None:
+        self._num = num
+        self._proto = ACCOUNT_CLASSES[acct_type](num)
+        self._loader = loader
+        self._balance = 0
+        self._newest: date = None
+        self._triggered = False
+        self._days = Counter()
+        self._months = Counter()
+        self._month: str = None
+        self._exempt_count = 0
+        self._net = 0
+        self._tree: MerkleTree = None
+
+    def add_transaction(self, cents: int, day: date, exempt=False) -> None:
+        """Validates a transaction like Account._add_pending and records it
+
+        Raises:
+            OverdrawError, TransactionLimitError, TransactionSequenceError
+        """
+        newest = self._newest
+        seq_ok = newest is None or (newest <= day and (not exempt or not self._triggered))
+
+        if exempt:
+            if not seq_ok:
+                raise TransactionSequenceError(newest)
+        else:
+            if cents < 0 and self._balance < -cents:
+                raise OverdrawError
+            if not self._check_limits(day):
+                raise TransactionLimitError
+            if not seq_ok:
+                raise TransactionSequenceError(newest)
+            # day is not before newest, so this is a later month
+            if newest is not None and (day.year, day.month) != (newest.year, newest.month):
+                self._triggered = False
+
+        self._record(cents, day, exempt)
+
+    def _check_limits(self, day: date) -> bool:
+        """Checks the day and month limits of savings accounts"""
+        if not isinstance(self._proto, SavingsAccount):
+            return True
+        return (self._days[day] < self._proto._day_lim
+                and self._months[month_of(day)] < self._proto._month_lim)
+
+    def _record(self, cents: int, day: date, exempt: bool) -> None:
+        """Updates balance, counters, month hash and rollup for an accepted transaction"""
+        month = month_of(day)
+        if month != self._month:
+            self._close_month()
+            self._month = month
+            self._tree = MerkleTree()
+            self._exempt_count = self._net = 0
+        if exempt:
+            self._exempt_count += 1
+        else:
+            self._days[day] += 1
+            self._months[month] += 1
+
+        self._balance += cents
+        self._net += cents
+        self._newest = day
+        self._tree.append(leaf_hash(canonical(day, from_cents(cents), exempt)))
+        self._loader.add_row(Transaction, {"_account_num": self._num, "_amt_cents": cents,
+                                           "_date": day, "_exempt": exempt})
+
+    def _close_month(self) -> None:
+        """Hands the finished month's hash and rollup rows to the loader"""
+        if self._month is None:
+            return
+        month_hash = MonthHash(self._num, self._month)
+        month_hash.tree = self._tree
+        self._loader.add_row(MonthHash, {column: getattr(month_hash, column)
+                                         for column in ("_account_num", "_month",
+                                                        "_count", "_frontier")})
+        # balance is the closing balance: later transactions are in later months
+        self._loader.add_row(AccountMonth, {"_account_num": self._num, "_month": self._month,
+                                            "_non_exempt": self._months[self._month],
+                                            "_exempt": self._exempt_count,
+                                            "_net_cents": self._net,
+                                            "_closing_cents": self._balance,
+                                            "_newest_date": self._newest,
+                                            "_newest_non_exempt": self._days[self._newest]})
+
+    def interest_and_fees(self) -> None:
+        """Adds interest and fees like Account.interest_and_fees
+
+        Raises:
+            TransactionSequenceError
+        """
+        end = Account._end_of_month(self._newest or date.today())
+        self.add_transaction(to_cents(interest(from_cents(self._balance),
+                                               self._proto._interest_rate)),
+                             end, exempt=True)
+
+        if isinstance(self._proto, CheckingAccount):
+            if from_cents(self._balance) < Decimal(self._proto._balance_threshold):
+                self.add_transaction(to_cents(Decimal(self._proto._low_balance_fee)),
+                                     end, exempt=True)
+        self._triggered = True
+
+    def rows(self, bank_id: int) -> list:
+        """Closes the current month and returns the (model, row) pairs of the
+        account (one row in the single layout, an account and a subtype row
+        in the joined layout)"""
+        self._close_month()
+        account = {"_num": self._num, "_interest_rate": self._proto._interest_rate,
+                   "_interest_triggered": self._triggered, "_balance_cents": self._balance,
+                   "_bank_id": bank_id, "_type": self._proto._type}
+        model = type(self._proto)
+        subtype = {column: getattr(self._proto, column, None)
+                   for column in model.__table__.columns.keys() if column not in account}
+        if model.__table__ is Account.__table__:
+            return [(Account, {**account, **subtype})]
+        return [(Account, account), (model, {"_num": self._num, **subtype})]
+
+
+class BulkLoader:
+    """Validates operations in memory and inserts the results in batches
+
+    constructor args:
+        conn (Connection): connection with an open transaction
+        batch_size (int): rows per executemany insert
+    """
+
+    def __init__(self, conn, batch_size=50000) -> None:
+        self._conn = conn
+        self._batch_size = batch_size
+        self._pending: dict = {}
+        self._slots: dict = {}
+        self._loaded = Counter()
+        self._rejections = Counter()
+
+        self._bank_id = conn.scalar(select(func.min(Bank.__table__.c._id)))
+        if self._bank_id is None:
+            self._bank_id = conn.execute(insert(Bank.__table__)).inserted_primary_key[0]
+        self._next_num = (conn.scalar(select(func.max(Account.__table__.c._num))) or 0) + 1
+
+    def add_row(self, model, row: dict) -> None:
+        """Queues a row for a table, inserting the queue when it is full"""
+        rows = self._pending.setdefault(model.__table__, [])
+        rows.append(row)
+        if len(rows) >= self._batch_size:
+            self._flush(model.__table__)
+
+    def _flush(self, table) -> None:
+        rows = self._pending.pop(table, [])
+        if rows:
+            self._conn.execute(insert(table), rows)
+            self._loaded[table.name] += len(rows)
+
+    def apply(self, op) -> None:
+        """Validates one workload operation (rejections are counted)"""
+        try:
+            if op.kind == OPEN:
+                self._slots[op.slot] = AccountState(self._next_num, op.acct_type, self)
+                self._next_num += 1
+                self._slots[op.slot].add_transaction(to_cents(op.amount), op.date)
+            elif op.kind == TRANSACTION:
+                self._slots[op.slot].add_transaction(to_cents(op.amount), op.date)
+            elif op.kind == INTEREST:
+                self._slots[op.slot].interest_and_fees()
+        except (OverdrawError, TransactionLimitError, TransactionSequenceError) as err:
+            self._rejections[type(err).__name__] += 1
+
+    def finish(self) -> None:
+        """Inserts the accounts and every queued row"""
+        for state in self._slots.values():
+            for model, row in state.rows(self._bank_id):
+                self.add_row(model, row)
+        for table in list(self._pending):
+            self._flush(table)
+
+    def _get_rejections(self) -> dict:
+        """Getter for the rejection counts per exception name"""
+        return dict(self._rejections)
+
+    rejections = property(_get_rejections)
+
+    def report(self, elapsed: float) -> str:
+        """Formats row counts per table and rejection counts"""
+        loaded = ", ".join(f"{name}={count:,}" for name, count in self._loaded.items())
+        rejected = ", ".join(f"{name}={count:,}" for name, count
+                             in self._rejections.most_common()) or "-"
+        return f"loaded {loaded} in {elapsed:.2f}s\nrejected {rejected}"
+
+
+def bulk_load(engine, operations, batch_size=50000, drop_indexes=True) -> BulkLoader:
+    """Loads operations into a database in a single transaction
+
+    Args:
+        engine (Engine): engine of an upgraded bank database
+        operations (iterable): workload operations
+        batch_size (int, default=50000): rows per executemany insert
+        drop_indexes (bool, default=True): drop the secondary transaction
+            indexes during the load and rebuild them at the end
+
+    Returns:
+        BulkLoader: loader holding row and rejection counts
+    """
+    indexes = Transaction.__table__.indexes if drop_indexes else ()
+    with engine.begin() as conn:
+        for index in indexes:
+            index.drop(conn)
+        loader = BulkLoader(conn, batch_size)
+        for op in operations:
+            loader.apply(op)
+        loader.finish()
+        for index in indexes:
+            index.create(conn)
+    return loader
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Bulk load a workload into a proj3 bank database")
+    parser.add_argument("workload", help="file written by workload.py (- for stdin)")
+    parser.add_argument("--database", default=DATABASE)
+    parser.add_argument("--profile", default="bulk", help="storage profile (see db.PROFILES)")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument("--keep-indexes", action="store_true",
+                        help="maintain indexes during the load instead of rebuilding them")
+    args = parser.parse_args()
+
+    engine = create_bank_engine(args.database, args.profile)
+    upgrade(engine)
+
+    began = time.perf_counter()
+    if args.workload == "-":
+        result = bulk_load(engine, load(sys.stdin), args.batch_size, not args.keep_indexes)
+    else:
+        with open(args.workload, encoding="utf-8") as file:
+            result = bulk_load(engine, load(file), args.batch_size, not args.keep_indexes)
+    print(result.report(time.perf_counter() - began))
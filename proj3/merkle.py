@@ -0,0 +1,315 @@
+"""
+merkle module
+
+implements per-account, per-month hash trees over transactions
+
+each month of an account is an append-only Merkle tree (RFC 6962 layout)
+stored in the month_hash table as its frontier of perfect subtrees, so
+adding a transaction costs O(log n); the hashing is in the hashtree
+module (an identical copy of proj2's), so ledgers of both models hash
+identically
+
+account roots and the bank tree over them (see hashtree) are persisted in
+the ledger_node table and derived incrementally: triggers on month_hash
+record the accounts whose months change in ledger_dirty, and refresh()
+recomputes only those accounts (and accounts added since) and their
+ancestors, so a digest costs O(changes * log accounts)
+
+the diff command compares two ledgers (a proj2 pickle or a proj3 database)
+by exchanging the children of differing nodes with each side level by
+level, and the leaves of differing months only (see hashtree.diff)
+
+the digest, diff, serve and rebuild commands are provided by verify.py
+"""
+
+# library modules
+import sys
+from pathlib import Path
+from datetime import date
+
+# SQL modules
+from sqlalchemy import (DDL, Column, ForeignKey, Integer, LargeBinary, String, delete, event,
+                        func, select, text)
+
+# custom modules
+from db import Base
+from transaction import Transaction, from_cents
+from hashtree import (EMPTY, DEPTH, ROOT, FANOUT_BITS, MerkleTree, Peer,
+                      canonical, leaf_hash, keyed_hash, child_range, check_number, serve,
+                      diff as diff_ledgers)
+
+# proj2 ledgers are compared through a merkle.py serve process of their own
+PROJ2 = Path(__file__).resolve().parent.parent / "proj2"
+
+# accounts per IN (...) list of a refresh query
+CHUNK = 500
+
+
+def decode_tree(frontier: str, count: int) -> MerkleTree:
+    """Returns the tree of a stored frontier (height:hex pairs) and leaf count"""
+    peaks = [(int(height), bytes.fromhex(peak)) for height, peak
+             in (node.split(":") for node in frontier.split(",") if node)]
+    return MerkleTree(peaks, count)
+
+
+def encode_frontier(tree: MerkleTree) -> str:
+    """Returns the stored form of the frontier of a tree"""
+    return ",".join(f"{height}:{peak.hex()}" for height, peak in tree._frontier)
+
+
+class MonthHash(Base):
+    """Frontier of the hash tree of one month of an account"""
+
+    __tablename__ = "month_hash"
+
+    _account_num = Column(Integer, ForeignKey("account._num"), primary_key=True)
+    _month = Column(String(7), primary_key=True)
+    _count = Column(Integer)
+    _frontier = Column(String)
+
+    def __init__(self, account_num: int, month: str) -> None:
+        self._account_num = account_num
+        self._month = month
+        self._count = 0
+        self._frontier = ""
+
+    def _get_tree(self) -> MerkleTree:
+        """Returns the stored tree (frontier encoded as height:hex pairs)"""
+        return decode_tree(self._frontier, self._count)
+
+    def _set_tree(self, tree: MerkleTree) -> None:
+        self._frontier = encode_frontier(tree)
+        self._count = tree.count
+
+    tree = property(_get_tree, _set_tree)
+
+
+def record(session, account_num: int, trans: Transaction) -> None:
+    """Adds a transaction to the tree of its month (same unit of work)"""
+    month = trans.date.strftime("%Y-%m")
+    row = session.get(MonthHash, (account_num, month))
+    if row is None:
+        row = MonthHash(account_num, month)
+        session.add(row)
+    tree = row.tree
+    tree.append(leaf_hash(canonical(trans.date, trans._amt, trans.is_exempt())))
+    row.tree = tree
+
+
+def rebuild(session, rows=None) -> None:
+    """Regenerates every month tree from the transaction table
+    (the caller commits)
+
+    Args:
+        session (Session): session bound to the bank database
+        rows (iterable, default=None): (account number, date, amount, exempt)
+            rows in insertion order; read from the transaction table if None
+    """
+    if rows is None:
+        rows = ((num, trans_date, from_cents(cents), exempt) for num, trans_date, cents, exempt
+                in session.execute(select(Transaction._account_num, Transaction._date,
+                                          Transaction._amt_cents, Transaction._exempt)
+                                   .order_by(Transaction._id)))
+    session.query(MonthHash).delete()
+    trees: dict = {}
+    for num, trans_date, amt, exempt in rows:
+        key = (num, trans_date.strftime("%Y-%m"))
+        trees.setdefault(key, MerkleTree()).append(leaf_hash(canonical(trans_date, amt, exempt)))
+    for (num, month), tree in trees.items():
+        row = MonthHash(num, month)
+        row.tree = tree
+        session.add(row)
+
+
+class LedgerNode(Base):
+    """Persisted node of the bank tree (level 0 holds the account roots)"""
+
+    __tablename__ = "ledger_node"
+
+    _level = Column(Integer, primary_key=True)
+    _prefix = Column(Integer, primary_key=True)
+    _hash = Column(LargeBinary)
+
+
+class LedgerDirty(Base):
+    """Account whose months changed since its root was derived
+    (written by the month_hash triggers only)"""
+
+    __tablename__ = "ledger_dirty"
+
+    _account_num = Column(Integer, primary_key=True)
+
+
+# record every change of a month tree, whichever code path writes it
+TRIGGERS = tuple(
+    f"CREATE TRIGGER IF NOT EXISTS month_hash_{event_name.lower()} "
+    f"AFTER {event_name} ON month_hash BEGIN "
+    f"INSERT OR IGNORE INTO ledger_dirty (_account_num) VALUES ({row}._account_num); END"
+    for event_name, row in (("INSERT", "NEW"), ("UPDATE", "NEW"), ("DELETE", "OLD")))
+
+for trigger in TRIGGERS:
+    event.listen(MonthHash.__table__, "after_create", DDL(trigger))
+
+
+def _chunks(nums: list):
+    for start in range(0, len(nums), CHUNK):
+        yield nums[start:start + CHUNK]
+
+
+def _store(session, level: int, nodes: dict) -> None:
+    session.execute(text("INSERT INTO ledger_node (_level, _prefix, _hash) "
+                         "VALUES (:level, :prefix, :hash) "
+                         "ON CONFLICT (_level, _prefix) DO UPDATE SET _hash = excluded._hash"),
+                    [{"level": level, "prefix": prefix, "hash": node}
+                     for prefix, node in nodes.items()])
+
+
+def refresh(session) -> int:
+    """Derives the persisted roots of the accounts whose months changed or
+    that were added since the last refresh, and of their ancestors up to
+    the bank root (the caller commits)
+
+    Returns:
+        int: number of accounts refreshed
+    """
+    from account import Account  # account imports this module
+
+    dirty = session.scalars(select(LedgerDirty._account_num)).all()
+    # account numbers only grow, so accounts above the highest root are new
+    highest = session.scalar(select(func.max(LedgerNode._prefix)).where(LedgerNode._level == 0))
+    added = session.scalars(select(Account._num).where(
+        Account._num > (-1 if highest is None else highest)))
+    changed = sorted(set(dirty).union(added))
+    if not changed:
+        return 0
+
+    months: dict = {check_number(num): {} for num in changed}
+    for chunk in _chunks(changed):
+        for row in session.scalars(select(MonthHash).where(MonthHash._account_num.in_(chunk))):
+            months[row._account_num][row._month] = row.tree.root
+    nodes = {num: keyed_hash(month_roots) for num, month_roots in months.items()}
+    _store(session, 0, nodes)
+
+    for level in range(1, DEPTH + 1):
+        parents = {}
+        for prefix in sorted({child >> FANOUT_BITS for child in nodes}):
+            first, last = child_range(prefix)
+            parents[prefix] = keyed_hash(dict(session.execute(
+                select(LedgerNode._prefix, LedgerNode._hash)
+                .where(LedgerNode._level == level - 1,
+                       LedgerNode._prefix.between(first, last))).all()))
+        _store(session, level, parents)
+        nodes = parents
+
+    for chunk in _chunks(dirty):
+        session.execute(delete(LedgerDirty).where(LedgerDirty._account_num.in_(chunk)))
+    return len(changed)
+
+
+class DatabaseLedger:
+    """Digests of the ledger in a database (see hashtree.answer)
+
+    the persisted roots are refreshed (and committed) when it is created
+    """
+
+    def __init__(self, session) -> None:
+        self._session = session
+        refresh(session)
+        session.commit()
+
+    def root(self) -> bytes:
+        node = self._session.get(LedgerNode, ROOT)
+        return node._hash if node is not None else EMPTY
+
+    def children(self, level: int, prefix: int) -> dict:
+        if level == 0:
+            return {row._month: row.tree.root for row in self._session.scalars(
+                select(MonthHash).where(MonthHash._account_num == prefix))}
+        first, last = child_range(prefix)
+        return dict(self._session.execute(
+            select(LedgerNode._prefix, LedgerNode._hash)
+            .where(LedgerNode._level == level - 1,
+                   LedgerNode._prefix.between(first, last))).all())
+
+    def leaves(self, num: int, month: str) -> list:
+        first = date.fromisoformat(f"{month}-01")
+        after = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+        rows = self._session.execute(
+            select(Transaction._date, Transaction._amt_cents, Transaction._exempt)
+            .where(Transaction._account_num == num,
+                   Transaction._date >= first, Transaction._date < after)
+            .order_by(Transaction._id))
+        return [canonical(trans_date, from_cents(cents), exempt)
+                for trans_date, cents, exempt in rows]
+
+
+def ledger_digest(session, level="bank", only=None) -> dict:
+    """Builds the digest of the ledger in a database from its persisted
+    roots (refreshed first; the caller commits)
+
+    Args:
+        session (Session): session bound to the bank database
+        level (str, default="bank"): "bank", "accounts" or "months"
+        only (set, default=None): account numbers to include below bank level
+
+    Returns:
+        dict: hex roots down to the requested level
+    """
+    refresh(session)
+    node = session.get(LedgerNode, ROOT)
+    result = {"root": (node._hash if node is not None else EMPTY).hex()}
+    if level == "bank":
+        return result
+
+    accounts = select(LedgerNode._prefix, LedgerNode._hash).where(LedgerNode._level == 0)
+    rows = select(MonthHash)
+    if only is not None:
+        accounts = accounts.where(LedgerNode._prefix.in_(only))
+        rows = rows.where(MonthHash._account_num.in_(only))
+    roots = dict(session.execute(accounts).all())
+    result["accounts"] = {str(num): root.hex() for num, root in roots.items()}
+    if level == "months":
+        months = {str(num): {} for num in roots}
+        for row in session.scalars(rows):
+            months[str(row._account_num)][row._month] = row.tree.root.hex()
+        result["months"] = months
+    return result
+
+
+def ledger_peer(source: str):
+    """Serves a ledger from its own process
+
+    Args:
+        source (str): "pickle:PATH" (proj2) or "db:URL" (proj3)
+
+    Returns:
+        Peer: client of the ledger (close it when done)
+    """
+    kind, _, location = source.partition(":")
+    if kind == "pickle":
+        command = [sys.executable, str(PROJ2 / "merkle.py"), "serve",
+                   str(Path(location).resolve())]
+    elif kind == "db":
+        command = [sys.executable, str(Path(__file__).resolve().parent / "verify.py"),
+                   "serve", "--database", location]
+    else:
+        raise ValueError(f"Unknown ledger source: {source}")
+    return Peer(command)
+
+
+def diff(left: str, right: str) -> list:
+    """Compares two ledgers (see hashtree.diff)
+
+    Args:
+        left (str): source of the first ledger (see ledger_peer)
+        right (str): source of the second ledger
+
+    Returns:
+        list: human-readable differences (empty if the ledgers match)
+    """
+    peers = [ledger_peer(left), ledger_peer(right)]
+    try:
+        return diff_ledgers(*peers, names=(left, right))
+    finally:
+        for peer in peers:
+            peer.close()
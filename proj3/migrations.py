@@ -0,0 +1,180 @@
+"""
+migrations module
+
+implements in-place upgrades of existing bank databases
+
+each migration is a function of a connection registered (in order) with
+the @migration decorator; PRAGMA user_version records how many of them
+have been applied, so upgrade() only runs the ones a database is missing
+and new databases are created with the current schema directly
+"""
+
+# SQL modules
+from sqlalchemy import text, Integer, Float, Boolean, Date
+from sqlalchemy.orm import Session
+
+# custom modules
+from db import Base
+from settings import ACCOUNT_LAYOUT, JOINED, SINGLE
+from transaction import to_cents
+import bank  # registers every mapped table with Base.metadata
+import merkle
+import rollup
+
+MIGRATIONS: list = []
+
+
+def migration(func):
+    """Registers a migration (applied in the order of registration)"""
+    MIGRATIONS.append(func)
+    return func
+
+
+@migration
+def build_month_hashes(conn) -> None:
+    """Fills the month_hash table for transactions added before it existed
+    (reads the Float amounts of the schema of the time)"""
+    rows = conn.execute(text('SELECT _account_num, _date, _amt, _exempt '
+                             'FROM "transaction" ORDER BY _id')
+                        .columns(_account_num=Integer, _date=Date, _amt=Float, _exempt=Boolean))
+    session = Session(bind=conn)
+    merkle.rebuild(session, rows.all())
+    session.flush()
+
+
+@migration
+def add_account_balance(conn) -> None:
+    """Adds the maintained balance column and backfills it with SUM()"""
+    conn.exec_driver_sql("ALTER TABLE account ADD COLUMN _balance FLOAT")
+    conn.exec_driver_sql('UPDATE account SET _balance = '
+                         '(SELECT COALESCE(SUM(_amt), 0) FROM "transaction" '
+                         'WHERE "transaction"._account_num = account._num)')
+
+
+@migration
+def index_transactions(conn) -> None:
+    """Adds the composite index used by the account rule queries"""
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_transaction_account_date "
+                         'ON "transaction" (_account_num, _date, _exempt)')
+
+
+@migration
+def store_amounts_in_cents(conn) -> None:
+    """Replaces the Float amount and balance columns with integer cents
+
+    amounts are rounded exactly as merkle.canonical rounds them, so the
+    month hashes built from the Float amounts stay valid
+    """
+    conn.exec_driver_sql('ALTER TABLE "transaction" ADD COLUMN _amt_cents INTEGER')
+    rows = conn.exec_driver_sql('SELECT _id, _amt FROM "transaction"').all()
+    conn.exec_driver_sql('UPDATE "transaction" SET _amt_cents = ? WHERE _id = ?',
+                         [(to_cents(repr(float(amt or 0))), trans_id) for trans_id, amt in rows])
+    conn.exec_driver_sql('ALTER TABLE "transaction" DROP COLUMN _amt')
+
+    conn.exec_driver_sql("ALTER TABLE account ADD COLUMN _balance_cents INTEGER")
+    conn.exec_driver_sql('UPDATE account SET _balance_cents = '
+                         '(SELECT COALESCE(SUM(_amt_cents), 0) FROM "transaction" '
+                         'WHERE "transaction"._account_num = account._num)')
+    conn.exec_driver_sql("ALTER TABLE account DROP COLUMN _balance")
+
+
+@migration
+def index_transaction_pages(conn) -> None:
+    """Adds the index that serves keyset pages of an account's transactions"""
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_transaction_account_page "
+                         'ON "transaction" (_account_num, _date, _id)')
+
+
+@migration
+def build_account_months(conn) -> None:
+    """Fills the account_month rollups for transactions added before it existed"""
+    session = Session(bind=conn)
+    rollup.rebuild(session)
+    session.flush()
+
+
+@migration
+def add_ledger_roots(conn) -> None:
+    """Adds the triggers that mark the accounts whose month trees change
+    (the ledger_node and ledger_dirty tables are created by create_all;
+    the roots of every account are derived by the first merkle.refresh)"""
+    for trigger in merkle.TRIGGERS:
+        conn.exec_driver_sql(trigger)
+
+
+@migration
+def add_newest_day_rollups(conn) -> None:
+    """Recreates the account_month rollups with the newest date of each
+    month and its non-exempt count (read by the day limit and sequence checks)"""
+    rollup.AccountMonth.__table__.drop(conn)
+    rollup.AccountMonth.__table__.create(conn)
+    session = Session(bind=conn)
+    rollup.rebuild(session)
+    session.flush()
+
+
+@migration
+def index_account_bank(conn) -> None:
+    """Adds the index that serves account counts and windows of a bank"""
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_account__bank_id "
+                         "ON account (_bank_id)")
+
+
+class LayoutError(Exception):
+    """Raised when a database uses another account layout than the models"""
+
+    def __init__(self, found: str) -> None:
+        super().__init__(f"the database uses the {found} account layout, not "
+                         f"{ACCOUNT_LAYOUT} (convert it with layout.py)")
+
+
+def _schema_state(conn) -> tuple:
+    """Returns the number of migrations applied to a database and its
+    account layout (None if it has no accounts) with a single query"""
+    version, account, joined = conn.exec_driver_sql(
+        "SELECT (SELECT user_version FROM pragma_user_version), "
+        "EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'account'), "
+        "EXISTS (SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'savingsaccount')"
+    ).one()
+    if not account:
+        return version, None
+    return version, JOINED if joined else SINGLE
+
+
+def account_layout(conn) -> str:
+    """Returns the account layout of a database (None if it has no accounts)"""
+    return _schema_state(conn)[1]
+
+
+def schema_version(conn) -> int:
+    """Returns the number of migrations applied to a database"""
+    return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def migrate(conn) -> None:
+    """Creates or upgrades the schema of a database within a transaction
+    (also run through AsyncConnection.run_sync by the async bank)
+
+    Raises:
+        LayoutError: the database uses the other account layout
+    """
+    version, found = _schema_state(conn)
+    if found not in (None, ACCOUNT_LAYOUT):
+        raise LayoutError(found)
+    if version == len(MIGRATIONS):
+        return  # current schema: skip create_all and its table checks
+    existing = version == 0 and found is not None
+
+    # new tables are created directly; new columns need migrations
+    Base.metadata.create_all(conn)
+    if existing or version:
+        for step in MIGRATIONS[version:]:
+            step(conn)
+
+    conn.exec_driver_sql(f"PRAGMA user_version = {len(MIGRATIONS)}")
+
+
+def upgrade(engine) -> None:
+    """Creates or upgrades the schema of the database behind an engine"""
+    with engine.begin() as conn:
+        migrate(conn)
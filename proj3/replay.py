@@ -0,0 +1,280 @@
+"""
+replay module
+
+implements a harness that replays a workload against a bank model
+and records latency percentiles and rejections per exception type
+
+models:
+    proj2: in-memory Bank/Account classes
+    proj3: SQLAlchemy Bank/Account classes backed by a database
+
+usage:
+    python replay.py --model proj3 --database sqlite:///replay.db --rate 500
+"""
+
+# library modules
+import sys
+import json
+import time
+import importlib
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
+from collections import Counter, defaultdict
+
+# custom modules
+from workload import WorkloadGenerator, OPEN, TRANSACTION, INTEREST, load
+
+# root directory containing the proj2 and proj3 packages
+PROJECTS = Path(__file__).resolve().parent.parent
+
+
+def _import_model(project: str):
+    """Imports the bank module of the given project
+
+    proj2 and proj3 share module names (bank, account, transaction),
+    so only one model can be imported by a single process
+    """
+    sys.path.insert(0, str(PROJECTS / project))
+    return importlib.import_module("bank")
+
+
+def _rule_errors() -> tuple:
+    """Returns the exceptions of the imported model's account rules
+    (the only errors replay counts as rejections)"""
+    account = importlib.import_module("account")
+    return (account.OverdrawError, account.TransactionLimitError,
+            account.TransactionSequenceError)
+
+
+def _cents(amount) -> str:
+    """Formats an amount rounded to cents like a proj3 Transaction"""
+    return str(Decimal(amount).quantize(Decimal("0.01"), rounding=ROUND_HALF_UP))
+
+
+class MemoryTarget:
+    """Drives the in-memory model from proj2"""
+
+    def __init__(self) -> None:
+        self._bank = _import_model("proj2").Bank()
+        self.rejections = _rule_errors()
+
+    def add_account(self, acct_type):
+        return self._bank.add_account(acct_type)
+
+    def add_transaction(self, acct, amt, date) -> None:
+        acct.add_transaction(amt, date=date)
+
+    def interest_and_fees(self, acct) -> None:
+        acct.interest_and_fees()
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(seconds)
+
+    def ledger(self) -> dict:
+        """Returns the (date, amount, exempt) rows of every account by number"""
+        return {acct.num: [(trans.date.isoformat(), _cents(trans._amt), trans.is_exempt())
+                           for trans in acct.transactions]
+                for acct in self._bank.accounts}
+
+    def close(self) -> None:
+        pass
+
+
+class DatabaseTarget:
+    """Drives the SQLAlchemy model from proj3"""
+
+    def __init__(self, database: str, batch_size=1, profile="default", shards=1) -> None:
+        from sqlalchemy.orm.session import sessionmaker
+
+        bank = _import_model("proj3")
+        self.rejections = _rule_errors()
+        from migrations import upgrade
+        from batch import GroupCommitSession
+        from db import create_bank_engine
+
+        if shards > 1:
+            if batch_size > 1:
+                raise ValueError("group commits cannot be combined with shards")
+            from shards import ShardSet, shard_urls
+            self._session = ShardSet(shard_urls(database, shards), profile).session()
+        else:
+            engine = create_bank_engine(database, profile)
+            upgrade(engine)
+            if batch_size > 1:
+                self._session = sessionmaker(bind=engine,
+                                             class_=GroupCommitSession,
+                                             batch_size=batch_size)()
+            else:
+                self._session = sessionmaker(bind=engine)()
+
+        self._grouped = batch_size > 1
+        self._bank = self._session.query(bank.Bank).first()
+        if self._bank is None:
+            self._bank = bank.Bank()
+            self._session.add(self._bank)
+            self._session.commit()
+
+    def add_account(self, acct_type):
+        return self._bank.add_account(acct_type, self._session)
+
+    def add_transaction(self, acct, amt, date) -> None:
+        acct.add_transaction(amt, self._session, date=date)
+
+    def interest_and_fees(self, acct) -> None:
+        acct.interest_and_fees(self._session)
+
+    def sleep(self, seconds: float) -> None:
+        """Waits for the next paced operation (committing a group commit
+        batch whose max_delay passes meanwhile)"""
+        if self._grouped:
+            self._session.idle(seconds)
+        else:
+            time.sleep(seconds)
+
+    def ledger(self) -> dict:
+        """Returns the (date, amount, exempt) rows of every account by number"""
+        return {acct.num: [(trans.date.isoformat(), _cents(trans._amt), trans.is_exempt())
+                           for page in acct.pages() for trans in page]
+                for acct in self._bank.accounts}
+
+    def close(self) -> None:
+        """Commits the last group commit batch and closes the session"""
+        if self._grouped:
+            self._session.sync()
+        self._session.close()
+
+
+class Recorder:
+    """Collects latencies and rejections for each kind of operation"""
+
+    def __init__(self) -> None:
+        self._latencies = defaultdict(list)
+        self._rejections = defaultdict(Counter)
+
+    def record(self, kind: str, latency: float, error: Exception = None) -> None:
+        self._latencies[kind].append(latency)
+        if error is not None:
+            self._rejections[kind][type(error).__name__] += 1
+
+    def _get_rejections(self) -> dict:
+        """Rejection counts per exception name for each kind of operation"""
+        return {kind: dict(counts) for kind, counts in self._rejections.items() if counts}
+
+    rejections = property(_get_rejections)
+
+    def report(self, elapsed: float) -> str:
+        """Formats latency percentiles (ms) and rejection counts"""
+        lines = [f"{'operation':<12}{'count':>8}{'p50':>9}{'p95':>9}"
+                 f"{'p99':>9}{'max':>9}  rejections"]
+        total = 0
+        for kind, latencies in self._latencies.items():
+            latencies.sort()
+            total += len(latencies)
+            rejections = ", ".join(f"{name}={count}" for name, count
+                                   in self._rejections[kind].most_common())
+            lines.append(f"{kind:<12}{len(latencies):>8}"
+                         + "".join(f"{percentile(latencies, p) * 1000:>9.3f}"
+                                   for p in (50, 95, 99, 100))
+                         + f"  {rejections or '-'}")
+        lines.append(f"{total} operations in {elapsed:.2f}s "
+                     f"({total / elapsed if elapsed else 0:,.0f} ops/s)")
+        return "\n".join(lines)
+
+
+def percentile(values: list, pct: float) -> float:
+    """Returns the nearest-rank percentile of a sorted list"""
+    if not values:
+        return 0.0
+    rank = max(int(round(pct / 100 * len(values))) - 1, 0)
+    return values[min(rank, len(values) - 1)]
+
+
+def replay(operations, target, rate=0.0) -> Recorder:
+    """Replays operations against a target
+
+    Args:
+        operations (iterable): operations from a workload
+        target (MemoryTarget | DatabaseTarget): model to drive; only the
+            errors of its account rules (target.rejections) are recorded,
+            any other exception propagates
+        rate (float, default=0.0): operations per second (0 for unpaced)
+
+    Returns:
+        Recorder: latencies and rejections of the replay
+    """
+    recorder = Recorder()
+    accounts: dict = {}
+    interval = 1 / rate if rate else 0
+    start = time.perf_counter()
+
+    for index, op in enumerate(operations):
+        # when paced, latency is measured from the scheduled start
+        # so that a slow operation also delays the ones behind it
+        scheduled = start + index * interval
+        if interval:
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                target.sleep(delay)
+        else:
+            scheduled = time.perf_counter()
+
+        error = None
+        try:
+            if op.kind == OPEN:
+                accounts[op.slot] = target.add_account(op.acct_type)
+                target.add_transaction(accounts[op.slot], op.amount, op.date.isoformat())
+            elif op.kind == TRANSACTION:
+                target.add_transaction(accounts[op.slot], op.amount, op.date.isoformat())
+            elif op.kind == INTEREST:
+                target.interest_and_fees(accounts[op.slot])
+        except target.rejections as err:
+            error = err
+
+        recorder.record(op.kind, time.perf_counter() - scheduled, error)
+
+    return recorder
+
+
+if __name__ == "__main__":
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Replay a banking workload against a bank model")
+    parser.add_argument("--model", choices=["proj2", "proj3"], default="proj2")
+    parser.add_argument("--database", default="sqlite://",
+                        help="database URL for the proj3 model (default: in memory)")
+    parser.add_argument("--batch-size", type=int, default=1,
+                        help="transactions per commit for the proj3 model (default: 1)")
+    parser.add_argument("--profile", default="default",
+                        help="storage profile for the proj3 model (see db.PROFILES)")
+    parser.add_argument("--shards", type=int, default=1,
+                        help="database files the proj3 accounts are spread over (see shards.py)")
+    parser.add_argument("--rate", type=float, default=0.0,
+                        help="operations per second (default: as fast as possible)")
+    parser.add_argument("--workload", help="file written by workload.py (default: generate)")
+    parser.add_argument("--ledger", help="file the rejections and ledgers are written to (JSON)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--months", type=int, default=12)
+    args = parser.parse_args()
+
+    if args.workload:
+        with open(args.workload, encoding="utf-8") as file:
+            ops = list(load(file))
+    else:
+        ops = list(WorkloadGenerator(seed=args.seed,
+                                     accounts=args.accounts,
+                                     months=args.months))
+
+    if args.model == "proj2":
+        bank_target = MemoryTarget()
+    else:
+        bank_target = DatabaseTarget(args.database, args.batch_size, args.profile,
+                                     args.shards)
+
+    began = time.perf_counter()
+    results = replay(ops, bank_target, args.rate)
+    if args.ledger:
+        with open(args.ledger, "w", encoding="utf-8") as out:
+            json.dump({"rejections": results.rejections, "accounts": bank_target.ledger()}, out)
+    bank_target.close()
+    print(results.report(time.perf_counter() - began))
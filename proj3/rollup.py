@@ -0,0 +1,163 @@
+"""
+rollup module
+
+implements the account_month table: per-account, per-month totals kept
+up to date in the same unit of work as each transaction insert
+
+a row holds the non-exempt and exempt transaction counts, the net amount
+and the closing balance of one month of an account, and the month's newest
+date with its non-exempt count, so the day and month limits, the sequence
+check and statements read rows of this table instead of scanning the
+account's transactions
+
+the rebuild and show commands are provided by statements.py
+"""
+
+# SQL modules
+from sqlalchemy import Column, Date, ForeignKey, Integer, String, select, text
+
+# custom modules
+from db import Base
+from transaction import Transaction, from_cents
+
+
+class AccountMonth(Base):
+    """Totals of one month of an account"""
+
+    __tablename__ = "account_month"
+
+    _account_num = Column(Integer, ForeignKey("account._num"), primary_key=True)
+    _month = Column(String(7), primary_key=True)
+    _non_exempt = Column(Integer)
+    _exempt = Column(Integer)
+    _net_cents = Column(Integer)
+    _closing_cents = Column(Integer)
+    # date of the month's newest transaction and its non-exempt transactions
+    _newest_date = Column(Date)
+    _newest_non_exempt = Column(Integer)
+
+    def __init__(self, account_num: int, month: str) -> None:
+        self._account_num = account_num
+        self._month = month
+        self._non_exempt = 0
+        self._exempt = 0
+        self._net_cents = 0
+        self._closing_cents = 0
+        self._newest_date = None
+        self._newest_non_exempt = 0
+
+    def __str__(self) -> str:
+        """Formats the month as a statement line"""
+        return (f"{self._month}: {self._non_exempt} transactions, "
+                f"{self._exempt} exempt, net ${self.net:,.2f}, "
+                f"closing balance ${self.closing_balance:,.2f}")
+
+    def _get_month(self) -> str:
+        """Getter for the month (YYYY-MM)"""
+        return self._month
+
+    month = property(_get_month)
+
+    def _get_non_exempt(self) -> int:
+        """Getter for the number of transactions subject to account limits"""
+        return self._non_exempt
+
+    non_exempt = property(_get_non_exempt)
+
+    def _get_net(self):
+        """Getter for the sum of the month's transactions"""
+        return from_cents(self._net_cents)
+
+    net = property(_get_net)
+
+    def _get_closing_balance(self):
+        """Getter for the balance after the month's last transaction"""
+        return from_cents(self._closing_cents)
+
+    closing_balance = property(_get_closing_balance)
+
+    def _get_newest_date(self):
+        """Getter for the date of the month's newest transaction"""
+        return self._newest_date
+
+    newest_date = property(_get_newest_date)
+
+    def same_day(self, day) -> int:
+        """Returns the number of non-exempt transactions of a date of the
+        month that is not before its newest date"""
+        return self._newest_non_exempt if day == self._newest_date else 0
+
+
+def month_of(day) -> str:
+    """Returns the rollup key (YYYY-MM) of a date"""
+    return day.strftime("%Y-%m")
+
+
+def record(session, account_num: int, trans: Transaction, balance_cents: int) -> None:
+    """Adds a transaction to the totals of its month (same unit of work)
+
+    Args:
+        session (Session): session the transaction is added with
+        account_num (int): number of the transaction's account
+        trans (Transaction): incoming transaction (newest of its account)
+        balance_cents (int): account balance including the transaction
+    """
+    month = month_of(trans.date)
+    row = session.get(AccountMonth, (account_num, month))
+    if row is None:
+        row = AccountMonth(account_num, month)
+        session.add(row)
+    if trans.date != row._newest_date:
+        row._newest_date = trans.date
+        row._newest_non_exempt = 0
+    if trans.is_exempt():
+        row._exempt += 1
+    else:
+        row._non_exempt += 1
+        row._newest_non_exempt += 1
+    row._net_cents += trans._amt_cents
+    # transactions arrive in date order, so the newest sets the closing balance
+    row._closing_cents = balance_cents
+
+
+def get_month(session, account_num: int, day):
+    """Returns the totals of the month of a date (None if it has no transactions)"""
+    return session.get(AccountMonth, (account_num, month_of(day)))
+
+
+def newest_month(session, account_num: int):
+    """Returns the totals of the newest month of an account (None if it has
+    no transactions), a single seek on the primary key"""
+    return session.scalars(select(AccountMonth)
+                           .where(AccountMonth._account_num == account_num)
+                           .order_by(AccountMonth._month.desc())
+                           .limit(1)).first()
+
+
+def statement(session, account_num: int) -> list:
+    """Returns the totals of every month of an account, oldest first"""
+    return session.scalars(select(AccountMonth)
+                           .where(AccountMonth._account_num == account_num)
+                           .order_by(AccountMonth._month)).all()
+
+
+def rebuild(session) -> None:
+    """Regenerates every rollup from the transaction table in one statement
+    (the caller commits)
+
+    transactions are grouped by account and month; closing balances are
+    running sums of the monthly net amounts
+    """
+    session.query(AccountMonth).delete()
+    session.execute(text(
+        "INSERT INTO account_month "
+        "(_account_num, _month, _non_exempt, _exempt, _net_cents, _closing_cents, "
+        "_newest_date, _newest_non_exempt) "
+        "SELECT _account_num, month, SUM(NOT _exempt), SUM(_exempt), SUM(_amt_cents), "
+        "SUM(SUM(_amt_cents)) OVER (PARTITION BY _account_num ORDER BY month), "
+        "MAX(_date), SUM(_date = newest AND NOT _exempt) "
+        "FROM (SELECT _account_num, strftime('%Y-%m', _date) AS month, _date, _exempt, "
+        "_amt_cents, MAX(_date) OVER (PARTITION BY _account_num, "
+        "strftime('%Y-%m', _date)) AS newest "
+        'FROM "transaction") '
+        "GROUP BY _account_num, month"))
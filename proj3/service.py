@@ -0,0 +1,474 @@
+"""
+service module
+
+implements a local HTTP/JSON service over the proj3 bank and a load-test
+client for it
+
+connections are handled by a fixed pool of threads; every thread gets its
+own session from a scoped_session (removed at the end of each request)
+and the engine's connection pool holds one connection per thread, so no
+request waits for a connection; requests that write take turns on a lock
+and start with BEGIN IMMEDIATE, so the balance they read cannot change
+before they commit, and are retried with backoff while SQLite reports the
+database busy (another process is writing)
+
+endpoints (amounts and balances are decimal strings):
+    GET  /accounts?after=NUM&limit=20    summary rows and account count
+    POST /accounts {"type": "savings"}   open an account
+    GET  /accounts/NUM                   number, type and balance
+    GET  /accounts/NUM/transactions?after=YYYY-MM-DD,ID&size=20
+    POST /accounts/NUM/transactions {"amount": "12.50", "date": "YYYY-MM-DD"}
+    POST /accounts/NUM/interest          interest and fees
+
+errors are returned as {"error": {"type": ..., "message": ...}} with 400
+(invalid request), 404 (unknown account or path) or 409 (rejected by an
+account rule: OverdrawError, TransactionLimitError or
+TransactionSequenceError, which also has "latest_date")
+
+usage:
+    python service.py serve [--database URL] [--port 8000] [--threads 8]
+    python service.py load [--url http://127.0.0.1:8000] [--clients 8] [--requests 2000]
+"""
+
+# library modules
+import re
+import json
+import time
+import random
+import logging
+import threading
+import http.client
+from datetime import date
+from decimal import Decimal, InvalidOperation, BasicContext, setcontext
+from collections import Counter
+from urllib.parse import urlsplit, parse_qs
+from argparse import ArgumentParser
+from http.server import HTTPServer, BaseHTTPRequestHandler
+from concurrent.futures import ThreadPoolExecutor
+
+# SQL modules
+from sqlalchemy import select, func
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import scoped_session, sessionmaker
+
+# custom modules
+from db import DATABASE, PROFILES, create_bank_engine
+from migrations import upgrade
+from bank import Bank
+from account import OverdrawError, TransactionLimitError, TransactionSequenceError
+from replay import percentile
+
+# attempts of a request while the database is busy, and the first backoff (s)
+RETRIES = 8
+RETRY_DELAY = 0.005
+
+# seconds an idle keep-alive connection holds its thread
+IDLE_TIMEOUT = 5
+
+# names of the account types in requests and responses
+TYPE_NAMES = {"savingsaccount": "savings", "checkingaccount": "checking"}
+
+RULE_MESSAGES = {
+    OverdrawError: "the transaction would overdraw the balance",
+    TransactionLimitError: "the account has reached a transaction limit",
+    TransactionSequenceError: "transactions must be dated from the latest date onward",
+}
+
+
+class RequestError(Exception):
+    """Invalid request or unknown resource, returned as a structured error"""
+
+    def __init__(self, status: int, message: str, error_type="RequestError") -> None:
+        super().__init__(message)
+        self.status = status
+        self.error_type = error_type
+
+
+def _is_busy(err: OperationalError) -> bool:
+    """Whether an error means another connection holds the database lock"""
+    message = str(err.orig).lower()
+    return "locked" in message or "busy" in message
+
+
+def _account_json(num: int, acct_type: str, balance: Decimal) -> dict:
+    return {"num": num, "type": TYPE_NAMES.get(acct_type, acct_type), "balance": str(balance)}
+
+
+class BankService:
+    """Bank operations run on the session of the calling thread
+
+    constructor args:
+        engine (Engine): engine of an upgraded bank database
+    """
+
+    def __init__(self, engine) -> None:
+        self._sessions = scoped_session(sessionmaker(bind=engine))
+        session = self._sessions()
+        bank_id = session.scalar(select(func.min(Bank._id)))
+        if bank_id is None:
+            bank = Bank()
+            session.add(bank)
+            session.commit()
+            bank_id = bank._id
+        self._bank_id = bank_id
+        self._sessions.remove()
+        self._retries = Counter()
+        # SQLite has a single writer: threads of this process queue for it
+        # here instead of polling in SQLite's busy handler
+        self._write_lock = threading.Lock()
+
+    def _get_retries(self) -> int:
+        """Getter for the number of retried attempts so far"""
+        return sum(self._retries.values())
+
+    retries = property(_get_retries)
+
+    def run(self, func, *args, write=False):
+        """Calls func(session, bank, *args) on this thread's session
+
+        Args:
+            func (callable): operation
+            args: extra arguments of func
+            write (bool, default=False): take the write lock first (the
+                operation commits its changes)
+
+        Returns:
+            the result of func
+        """
+        for attempt in range(RETRIES):
+            session = self._sessions()
+            try:
+                if write:
+                    with self._write_lock:
+                        session.connection().exec_driver_sql("BEGIN IMMEDIATE")
+                        return func(session, session.get(Bank, self._bank_id), *args)
+                return func(session, session.get(Bank, self._bank_id), *args)
+            except OperationalError as err:
+                session.rollback()
+                if not _is_busy(err) or attempt == RETRIES - 1:
+                    raise
+                self._retries[threading.current_thread().name] += 1
+                time.sleep(RETRY_DELAY * 2 ** attempt * random.random())
+            finally:
+                self._sessions.remove()
+
+    def close(self) -> None:
+        self._sessions.remove()
+
+
+def _find_account(bank, num: str):
+    acct = bank.get_account(num) if num.isdigit() else None
+    if acct is None:
+        raise RequestError(404, f"no account #{num}", "AccountNotFound")
+    return acct
+
+
+def list_accounts(session, bank, after, limit: int) -> dict:
+    return {"count": bank.account_count,
+            "accounts": [_account_json(*row)
+                         for row in bank.summary_window(limit, after=after)]}
+
+
+def open_account(session, bank, acct_type: str) -> dict:
+    acct = bank.add_account(acct_type, session)
+    if acct is None:
+        raise RequestError(400, f"unknown account type {acct_type!r}")
+    return _account_json(acct.num, acct._type, acct.balance)
+
+
+def get_account(session, bank, num: str) -> dict:
+    acct = _find_account(bank, num)
+    return _account_json(acct.num, acct._type, acct.balance)
+
+
+def list_transactions(session, bank, num: str, after, size: int) -> dict:
+    page = _find_account(bank, num).transaction_page(after=after, size=size)
+    return {"transactions": [{"id": trans._id, "date": trans.date.isoformat(),
+                              "amount": str(trans._amt), "exempt": trans.is_exempt()}
+                             for trans in page.transactions],
+            "has_next": page.has_next}
+
+
+def add_transaction(session, bank, num: str, amount: Decimal, day) -> dict:
+    acct = _find_account(bank, num)
+    acct.add_transaction(amount, session, date=day)
+    return _account_json(acct.num, acct._type, acct.balance)
+
+
+def interest_and_fees(session, bank, num: str) -> dict:
+    acct = _find_account(bank, num)
+    acct.interest_and_fees(session)
+    return _account_json(acct.num, acct._type, acct.balance)
+
+
+def _int(query: dict, name: str, default: int) -> int:
+    try:
+        return int(query.get(name, [default])[0])
+    except ValueError:
+        raise RequestError(400, f"{name} must be an integer") from None
+
+
+def _after(query: dict):
+    """Parses the after=YYYY-MM-DD,ID key of a transaction page"""
+    if "after" not in query:
+        return None
+    try:
+        day, trans_id = query["after"][0].split(",")
+        return (date.fromisoformat(day), int(trans_id))
+    except ValueError:
+        raise RequestError(400, "after must be YYYY-MM-DD,ID") from None
+
+
+def _transaction_args(body: dict) -> tuple:
+    try:
+        amount = Decimal(str(body["amount"]))
+        if not amount.is_finite():
+            raise InvalidOperation
+        day = body.get("date")
+        if day is not None:
+            date.fromisoformat(day)
+    except (KeyError, InvalidOperation):
+        raise RequestError(400, "amount must be a decimal number") from None
+    except (TypeError, ValueError):
+        raise RequestError(400, "date must be YYYY-MM-DD") from None
+    return amount, day
+
+
+class BankRequestHandler(BaseHTTPRequestHandler):
+    """Routes JSON requests to the BankService of the server"""
+
+    protocol_version = "HTTP/1.1"  # keep-alive connections
+    timeout = IDLE_TIMEOUT
+    # headers and body are separate writes: don't wait for the client's delayed ACK
+    disable_nagle_algorithm = True
+
+    def do_GET(self) -> None:
+        self._handle("GET")
+
+    def do_POST(self) -> None:
+        self._handle("POST")
+
+    def _route(self, method: str, path: str, query: dict):
+        """Returns (status, result) of a request"""
+        service = self.server.service
+        if path == "/accounts":
+            if method == "GET":
+                return 200, service.run(list_accounts, _int(query, "after", 0),
+                                        min(_int(query, "limit", 20), 1000))
+            return 201, service.run(open_account, self._body().get("type"), write=True)
+
+        match = re.fullmatch(r"/accounts/([^/]+)(/transactions|/interest)?", path)
+        if match is None:
+            raise RequestError(404, f"no resource {path}", "NotFound")
+        num, action = match.groups()
+        if action is None and method == "GET":
+            return 200, service.run(get_account, num)
+        if action == "/transactions" and method == "GET":
+            return 200, service.run(list_transactions, num, _after(query),
+                                    min(_int(query, "size", 20), 1000))
+        if action == "/transactions" and method == "POST":
+            return 201, service.run(add_transaction, num, *_transaction_args(self._body()),
+                                    write=True)
+        if action == "/interest" and method == "POST":
+            return 200, service.run(interest_and_fees, num, write=True)
+        raise RequestError(404, f"no resource {method} {path}", "NotFound")
+
+    def _body(self) -> dict:
+        try:
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or "{}")
+        except ValueError:
+            raise RequestError(400, "the body must be a JSON object") from None
+        if not isinstance(body, dict):
+            raise RequestError(400, "the body must be a JSON object")
+        return body
+
+    def _handle(self, method: str) -> None:
+        url = urlsplit(self.path)
+        try:
+            status, result = self._route(method, url.path, parse_qs(url.query))
+        except RequestError as err:
+            status, result = err.status, {"error": {"type": err.error_type,
+                                                    "message": str(err)}}
+        except tuple(RULE_MESSAGES) as err:
+            error = {"type": type(err).__name__, "message": RULE_MESSAGES[type(err)]}
+            if isinstance(err, TransactionSequenceError):
+                error["latest_date"] = err.latest_date.isoformat()
+            status, result = 409, {"error": error}
+        except OperationalError as err:
+            logging.debug(f"Request failed: {err}")
+            status, result = 503, {"error": {"type": "DatabaseBusy" if _is_busy(err)
+                                             else "DatabaseError", "message": str(err.orig)}}
+        except Exception as err:
+            logging.exception("Request failed")
+            status, result = 500, {"error": {"type": type(err).__name__, "message": str(err)}}
+        self._send(status, result)
+
+    def _send(self, status: int, result: dict) -> None:
+        body = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args) -> None:
+        logging.debug(f"{self.address_string()} {format % args}")
+
+
+class BankHTTPServer(HTTPServer):
+    """HTTP server handling each connection on a fixed pool of threads
+
+    constructor args:
+        address (tuple): (host, port) to listen on (port 0 picks a free port)
+        service (BankService): operations behind the endpoints
+        threads (int, default=8): handler threads
+    """
+
+    def __init__(self, address: tuple, service: BankService, threads=8) -> None:
+        super().__init__(address, BankRequestHandler)
+        self.service = service
+        # Decimal contexts are per thread: handlers use the CLI's context
+        self._pool = ThreadPoolExecutor(threads, thread_name_prefix="http",
+                                        initializer=setcontext, initargs=(BasicContext,))
+
+    def process_request(self, request, client_address) -> None:
+        self._pool.submit(self._process, request, client_address)
+
+    def _process(self, request, client_address) -> None:
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self) -> None:
+        super().server_close()
+        self._pool.shutdown()
+        self.service.close()
+
+
+def create_server(url=DATABASE, host="127.0.0.1", port=8000, threads=8,
+                  profile="durable") -> BankHTTPServer:
+    """Creates the service of a bank database (call serve_forever() to run it)
+
+    Args:
+        url (str, default=DATABASE): database URL
+        host (str, default="127.0.0.1"): address to listen on
+        port (int, default=8000): port to listen on (0 for any free port)
+        threads (int, default=8): handler threads
+        profile (str, default="durable"): storage profile (see settings.PROFILES)
+
+    Returns:
+        BankHTTPServer: server listening on the address
+    """
+    kwargs = {}
+    if PROFILES[profile].pool in (None, "queue"):
+        # one connection per handler thread, none opened beyond that
+        kwargs = {"pool_size": threads, "max_overflow": 0, "pool_timeout": 30}
+    engine = create_bank_engine(url, profile, **kwargs)
+    upgrade(engine)
+    return BankHTTPServer((host, port), BankService(engine), threads)
+
+
+def call(conn, method: str, path: str, body=None) -> tuple:
+    """Sends a request on a keep-alive connection and returns (status, JSON)"""
+    payload = json.dumps(body).encode() if body is not None else None
+    headers = {"Content-Type": "application/json"} if payload is not None else {}
+    conn.request(method, path, payload, headers)
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def load_test(url: str, clients: int, requests: int, accounts: int, write_ratio: float,
+              seed=0) -> None:
+    """Prints the throughput and latency percentiles of concurrent clients
+
+    every client opens a keep-alive connection and sends its share of the
+    requests: balance reads, deposits and withdrawals on random accounts
+    (write_ratio of them), which may be rejected by the account rules
+    """
+    parts = urlsplit(url)
+    setup = http.client.HTTPConnection(parts.hostname, parts.port)
+    nums = []
+    for index in range(accounts):
+        _, acct = call(setup, "POST", "/accounts",
+                       {"type": "savings" if index % 2 else "checking"})
+        call(setup, "POST", f"/accounts/{acct['num']}/transactions", {"amount": "1000"})
+        nums.append(acct["num"])
+    setup.close()
+
+    latencies: list = []
+    outcomes = Counter()
+    lock = threading.Lock()
+
+    def client(index: int) -> None:
+        rng = random.Random(seed * 1000 + index)
+        conn = http.client.HTTPConnection(parts.hostname, parts.port)
+        mine, counts = [], Counter()
+        for _ in range(requests // clients):
+            num = rng.choice(nums)
+            began = time.perf_counter()
+            if rng.random() < write_ratio:
+                amount = f"{rng.choice([-1, 1]) * rng.uniform(1, 50):.2f}"
+                status, result = call(conn, "POST", f"/accounts/{num}/transactions",
+                                      {"amount": amount})
+            else:
+                status, result = call(conn, "GET", f"/accounts/{num}")
+            mine.append(time.perf_counter() - began)
+            counts[result["error"]["type"] if "error" in result else status] += 1
+        conn.close()
+        with lock:
+            latencies.extend(mine)
+            outcomes.update(counts)
+
+    threads = [threading.Thread(target=client, args=(index,)) for index in range(clients)]
+    began = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    latencies.sort()
+    print(f"{len(latencies):,} requests from {clients} clients in {elapsed:.2f}s "
+          f"({len(latencies) / elapsed:,.0f} requests/s)")
+    print("latency ms: " + ", ".join(f"p{pct}={percentile(latencies, pct) * 1000:.1f}"
+                                     for pct in (50, 95, 99, 100)))
+    print("outcomes: " + ", ".join(f"{name}={count:,}" for name, count
+                                   in outcomes.most_common()))
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="HTTP/JSON service over a proj3 bank")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = subparsers.add_parser("serve", help="run the service")
+    serve_parser.add_argument("--database", default=DATABASE)
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8000)
+    serve_parser.add_argument("--threads", type=int, default=8)
+    serve_parser.add_argument("--profile", default="durable", help="see settings.PROFILES")
+
+    load_parser = subparsers.add_parser("load", help="load-test a running service")
+    load_parser.add_argument("--url", default="http://127.0.0.1:8000")
+    load_parser.add_argument("--clients", type=int, default=8)
+    load_parser.add_argument("--requests", type=int, default=2000)
+    load_parser.add_argument("--accounts", type=int, default=50)
+    load_parser.add_argument("--write-ratio", type=float, default=0.2)
+    load_parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "serve":
+        logging.basicConfig(level=logging.INFO, format="%(asctime)s|%(levelname)s|%(message)s")
+        server = create_server(args.database, args.host, args.port, args.threads, args.profile)
+        logging.info(f"serving {args.database} on http://{args.host}:{server.server_port}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    elif args.command == "load":
+        load_test(args.url, args.clients, args.requests, args.accounts, args.write_ratio,
+                  args.seed)
@@ -0,0 +1,72 @@
+"""
+settings module
+
+implements the database URLs, storage profiles, account layout and page
+size of the bank
+
+standard library only, so the CLI and GUI can parse their arguments and
+draw their first screen before SQLAlchemy is imported (db and account
+re-export these names)
+
+profiles:
+    default: SQLite defaults (rollback journal, full sync, pooled connections)
+    durable: WAL journal with full sync (no lost commits, concurrent readers)
+    balanced: WAL with normal sync (may lose the last commits on power loss,
+        never corrupts) plus a large page cache, memory mapping and
+        in-memory temp tables
+    bulk: no journal sync at all, for throwaway loads and benchmarks only
+
+account layouts (chosen with the PROJ3_ACCOUNT_LAYOUT environment variable
+before the models are imported; convert a database with layout.py):
+    joined: account table plus a savingsaccount and a checkingaccount table
+        holding the columns of each subtype (joined-table inheritance)
+    single: every column in the account table (single-table inheritance),
+        so accounts are loaded and inserted without joins or extra rows
+"""
+
+# library modules
+import os
+from collections import namedtuple
+
+# default database URLs
+DATABASE = "sqlite:///bank.db"
+ASYNC_DATABASE = "sqlite+aiosqlite:///bank.db"
+
+# mapping of the account class hierarchy (see account layouts above)
+JOINED = "joined"
+SINGLE = "single"
+ACCOUNT_LAYOUTS = (JOINED, SINGLE)
+
+
+def check_layout(layout: str) -> str:
+    """Returns an account layout name
+
+    Raises:
+        ValueError: the name is not one of ACCOUNT_LAYOUTS
+    """
+    if layout not in ACCOUNT_LAYOUTS:
+        raise ValueError(f"PROJ3_ACCOUNT_LAYOUT must be {JOINED!r} or {SINGLE!r}, "
+                         f"not {layout!r}")
+    return layout
+
+
+ACCOUNT_LAYOUT = check_layout(os.environ.get("PROJ3_ACCOUNT_LAYOUT", JOINED))
+
+# number of transactions on a page of a listing
+PAGE_SIZE = 20
+
+# settings of a profile (None leaves the SQLite or SQLAlchemy default)
+Profile = namedtuple("Profile",
+                     ["journal_mode", "synchronous", "cache_size", "mmap_size",
+                      "temp_store", "busy_timeout", "pool"],
+                     defaults=[None] * 7)
+
+PROFILES = {
+    "default": Profile(),
+    "durable": Profile(journal_mode="WAL", synchronous="FULL", busy_timeout=5000),
+    "balanced": Profile(journal_mode="WAL", synchronous="NORMAL", cache_size=-65536,
+                        mmap_size=268435456, temp_store="MEMORY", busy_timeout=5000),
+    "bulk": Profile(journal_mode="WAL", synchronous="OFF", cache_size=-262144,
+                    mmap_size=268435456, temp_store="MEMORY", busy_timeout=5000,
+                    pool="singleton"),
+}
@@ -0,0 +1,350 @@
+"""
+shards module
+
+implements horizontal sharding of the proj3 bank across SQLite files
+
+accounts are partitioned by account number over several database files
+(shard of account num = (num - 1) % shards); an account's subtype row,
+transactions, month hashes and month rollups live in its shard, and
+every shard holds a copy of the bank rows, so each file is a complete,
+upgradeable bank database on its own
+
+a ShardSet opens the shards and makes sharded sessions (SQLAlchemy's
+ShardedSession): new rows are written to the shard of their account,
+primary-key lookups go to one shard, and queries are routed to the
+shards of the account numbers they compare with "=" (combined with
+AND; any other query runs on every shard); Bank asks the ShardSet of a
+sharded session for what spans shards (account numbers, counts and the
+summary), which is queried on all shards in parallel and merged
+
+writers of accounts in different shards take different SQLite write
+locks, so several processes can commit at the same time
+
+usage:
+    shards = ShardSet(shard_urls("sqlite:///bank.db", 4))
+    session = shards.session()
+    bank = session.query(Bank).first()
+
+    python shards.py bench [--shards 1 2 4] [--processes 4] [--writes 500]
+"""
+
+# library modules
+import time
+import heapq
+import queue
+import tempfile
+import threading
+import multiprocessing
+from pathlib import Path
+from itertools import islice
+from argparse import ArgumentParser
+from datetime import date, timedelta
+from concurrent.futures import ThreadPoolExecutor
+
+# SQL modules
+from sqlalchemy import select, func, insert
+from sqlalchemy.sql import visitors, operators
+from sqlalchemy.sql.elements import BindParameter
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.ext.horizontal_shard import ShardedSession
+
+# custom modules
+from db import create_bank_engine
+from migrations import upgrade
+from bank import Bank, AccountSummary, summary_query, window_query
+from account import Account
+
+# columns holding the account number a row belongs to
+SHARD_KEYS = ("_num", "_account_num")
+
+# shard of the bank rows loaded by sessions (every shard has a copy)
+BANK_SHARD = "0"
+
+# seconds a summary producer waits on a full queue before checking
+# whether the consumer stopped reading
+PUT_TIMEOUT = 0.1
+
+
+def shard_urls(url: str, count: int) -> list:
+    """Returns the URLs of count shards of a database URL
+    (sqlite:///bank.db becomes sqlite:///bank-0.db, sqlite:///bank-1.db, ...)"""
+    base, dot, extension = url.rpartition(".")
+    if not dot or "/" in extension:
+        return [f"{url}-{index}" for index in range(count)]
+    return [f"{base}-{index}.{extension}" for index in range(count)]
+
+
+def _shard_key_values(statement) -> set:
+    """Returns the account numbers a statement's WHERE clause compares
+    a shard key column with using "=" (empty if it does not)"""
+    where = getattr(statement, "whereclause", None)
+    values = set()
+    if where is None:
+        return values
+
+    def visit_binary(binary) -> None:
+        if binary.operator is not operators.eq:
+            return
+        for column, value in ((binary.left, binary.right), (binary.right, binary.left)):
+            if (getattr(column, "key", None) in SHARD_KEYS
+                    and isinstance(value, BindParameter) and value.effective_value is not None):
+                values.add(value.effective_value)
+
+    visitors.traverse(where, {}, {"binary": visit_binary})
+    return values
+
+
+class ShardSet:
+    """Shard databases of a bank and the sessions routing between them
+
+    constructor args:
+        urls (list): database URL of each shard (see shard_urls)
+        profile (str, default="default"): storage profile (see settings.PROFILES)
+    """
+
+    def __init__(self, urls: list, profile="default") -> None:
+        self._engines = {str(index): create_bank_engine(url, profile)
+                         for index, url in enumerate(urls)}
+        self._ids = list(self._engines)
+        for engine in self._engines.values():
+            upgrade(engine)
+        self._copy_banks()
+
+        self._executor = ThreadPoolExecutor(len(self._ids), thread_name_prefix="shard")
+        self._sessions = sessionmaker(class_=ShardedSession, shards=self._engines,
+                                      shard_chooser=self._shard_chooser,
+                                      identity_chooser=self._identity_chooser,
+                                      execute_chooser=self._execute_chooser,
+                                      info={"shards": self})
+
+    def _copy_banks(self) -> None:
+        """Makes sure every shard has the bank rows of BANK_SHARD (creating a bank if none)"""
+        with self._engines[BANK_SHARD].begin() as conn:
+            ids = set(conn.scalars(select(Bank.__table__.c._id)))
+            if not ids:
+                ids = {conn.execute(insert(Bank.__table__)).inserted_primary_key[0]}
+        for shard_id in self._ids:
+            with self._engines[shard_id].begin() as conn:
+                missing = ids - set(conn.scalars(select(Bank.__table__.c._id)))
+                if missing:
+                    conn.execute(insert(Bank.__table__), [{"_id": bank_id} for bank_id in missing])
+
+    def session(self) -> ShardedSession:
+        """Returns a new sharded session"""
+        return self._sessions()
+
+    def _get_session_factory(self):
+        """Getter for the sessionmaker of the sharded sessions"""
+        return self._sessions
+
+    session_factory = property(_get_session_factory)
+
+    def _get_count(self) -> int:
+        """Getter for the number of shards"""
+        return len(self._ids)
+
+    count = property(_get_count)
+
+    def shard_of(self, num) -> str:
+        """Returns the id of the shard holding an account number"""
+        return self._ids[(int(num) - 1) % len(self._ids)]
+
+    def _shard_chooser(self, mapper, instance, clause=None) -> str:
+        """Shard a new or changed row is written to"""
+        if isinstance(instance, Bank):
+            return BANK_SHARD
+        if isinstance(instance, Account):
+            return self.shard_of(instance._num)
+        num = instance._account_num
+        if num is None:
+            num = instance.account._num  # transaction not flushed yet
+        return self.shard_of(num)
+
+    def _identity_chooser(self, mapper, primary_key, *, lazy_loaded_from, **kwargs) -> list:
+        """Shards searched for a primary key"""
+        if lazy_loaded_from is not None:
+            return [lazy_loaded_from.identity_token]
+        if issubclass(mapper.class_, Bank):
+            return [BANK_SHARD]
+        for column, value in zip(mapper.primary_key, primary_key):
+            if column.key in SHARD_KEYS:
+                return [self.shard_of(value)]
+        return self._ids
+
+    def _execute_chooser(self, context) -> list:
+        """Shards a query is run on"""
+        state = context.lazy_loaded_from
+        if state is not None and not issubclass(state.class_, Bank):
+            return [state.identity_token]
+        nums = _shard_key_values(context.statement)
+        if nums:
+            return sorted({self.shard_of(num) for num in nums})
+        return self._ids
+
+    def _parallel(self, func) -> list:
+        """Calls func(engine) for every shard in parallel and returns the results"""
+        return list(self._executor.map(func, self._engines.values()))
+
+    def next_account_number(self) -> int:
+        """Returns one more than the highest account number of all shards"""
+        def highest(engine) -> int:
+            with engine.connect() as conn:
+                return conn.scalar(select(func.max(Account.__table__.c._num))) or 0
+        return max(self._parallel(highest)) + 1
+
+    def account_count(self, bank_id: int) -> int:
+        """Returns the number of accounts of a bank in all shards"""
+        def count(engine) -> int:
+            with engine.connect() as conn:
+                return conn.scalar(select(func.count()).select_from(Account.__table__)
+                                   .where(Account.__table__.c._bank_id == bank_id))
+        return sum(self._parallel(count))
+
+    def summary_window(self, bank_id: int, limit: int, after=None, before=None) -> list:
+        """Returns a window of the summary rows of all shards merged in
+        account number order (see bank.window_query): every shard seeks
+        past the key and returns at most limit rows"""
+        query = window_query(bank_id, limit, after, before)
+
+        def window(engine) -> list:
+            with engine.connect() as conn:
+                return conn.execute(query).all()
+
+        rows = list(islice(heapq.merge(*self._parallel(window), key=lambda row: row[0],
+                                       reverse=before is not None), limit))
+        if before is not None:
+            rows.reverse()
+        return [AccountSummary.from_row(row) for row in rows]
+
+    def account_range(self, bank_id: int) -> tuple:
+        """Returns the lowest and highest account number of a bank in all
+        shards ((None, None) if it has no accounts)"""
+        table = Account.__table__
+
+        def extremes(engine) -> tuple:
+            with engine.connect() as conn:
+                return conn.execute(select(func.min(table.c._num), func.max(table.c._num))
+                                    .where(table.c._bank_id == bank_id)).one()
+
+        ranges = [found for found in self._parallel(extremes) if found[0] is not None]
+        if not ranges:
+            return None, None
+        return min(low for low, _ in ranges), max(high for _, high in ranges)
+
+    def summary(self, bank_id: int, batch_size=1000):
+        """Yields the summary rows of all shards in account number order
+
+        every shard streams its rows batch_size at a time on its own
+        thread into a small queue, and the queues are merged by number
+        """
+        stop = threading.Event()
+        queues = [queue.Queue(maxsize=2) for _ in self._ids]
+        for engine, out in zip(self._engines.values(), queues):
+            self._executor.submit(self._stream, engine, summary_query(bank_id), batch_size,
+                                  out, stop)
+        try:
+            rows = heapq.merge(*(self._drain(out) for out in queues), key=lambda row: row[0])
+            for row in rows:
+                yield AccountSummary.from_row(row)
+        finally:
+            stop.set()
+
+    @staticmethod
+    def _stream(engine, query, batch_size: int, out: queue.Queue, stop: threading.Event) -> None:
+        """Producer of summary: puts batches of rows, then None (or the error)"""
+        def put(item) -> bool:
+            while not stop.is_set():
+                try:
+                    out.put(item, timeout=PUT_TIMEOUT)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        try:
+            with engine.connect() as conn:
+                result = conn.execution_options(yield_per=batch_size).execute(query)
+                for rows in result.partitions():
+                    if not put(rows):
+                        return
+        except Exception as err:
+            put(err)
+        put(None)
+
+    @staticmethod
+    def _drain(out: queue.Queue):
+        """Consumer side of _stream: yields the rows of one shard"""
+        while True:
+            item = out.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield from item
+
+    def close(self) -> None:
+        """Stops the threads and closes the connections of every shard"""
+        self._executor.shutdown()
+        for engine in self._engines.values():
+            engine.dispose()
+
+
+def _bench_writer(urls: list, profile: str, nums: list, writes: int, barrier) -> None:
+    """Benchmark process: commits deposits to its accounts one at a time"""
+    shards = ShardSet(urls, profile)
+    session = shards.session()
+    bank = session.query(Bank).first()
+    accounts = [bank.get_account(num) for num in nums]
+    barrier.wait()  # every process is ready: start together
+    for write in range(writes):
+        day = date(2000, 1, 1) + timedelta(days=write // len(accounts))
+        accounts[write % len(accounts)].add_transaction("1.00", session, date=day.isoformat())
+    session.close()
+    shards.close()
+
+
+def bench(shard_counts: list, processes: int, writes: int, accounts: int, profile: str) -> None:
+    """Prints the commit throughput of several writer processes for each
+    number of shards (process p owns the accounts with (num - 1) % processes == p)"""
+    context = multiprocessing.get_context("spawn")
+    print(f"{'shards':>8}{'processes':>11}{'writes/s':>12}")
+    for count in shard_counts:
+        with tempfile.TemporaryDirectory() as directory:
+            urls = shard_urls(f"sqlite:///{Path(directory) / 'bench.db'}", count)
+            shards = ShardSet(urls, profile)
+            session = shards.session()
+            bank = session.query(Bank).first()
+            nums = [bank.add_account("checking", session).num
+                    for _ in range(accounts * processes)]
+            session.close()
+            shards.close()
+
+            barrier = context.Barrier(processes + 1)
+            workers = [context.Process(target=_bench_writer,
+                                       args=(urls, profile, nums[index::processes], writes,
+                                             barrier))
+                       for index in range(processes)]
+            for worker in workers:
+                worker.start()
+            barrier.wait()
+            began = time.perf_counter()
+            for worker in workers:
+                worker.join()
+            elapsed = time.perf_counter() - began
+            print(f"{count:>8}{processes:>11}{processes * writes / elapsed:>12,.0f}")
+
+
+if __name__ == "__main__":
+    parser = ArgumentParser(description="Sharded proj3 bank databases")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    bench_parser = subparsers.add_parser("bench", help="write throughput of concurrent processes")
+    bench_parser.add_argument("--shards", type=int, nargs="+", default=[1, 2, 4])
+    bench_parser.add_argument("--processes", type=int, default=4)
+    bench_parser.add_argument("--writes", type=int, default=500, help="commits per process")
+    bench_parser.add_argument("--accounts", type=int, default=4, help="accounts per process")
+    bench_parser.add_argument("--profile", default="durable", help="see settings.PROFILES")
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.shards, args.processes, args.writes, args.accounts, args.profile)
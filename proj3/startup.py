@@ -0,0 +1,131 @@
+"""
+startup module
+
+implements the deferred startup of the proj3 CLI and GUI
+
+a Startup imports SQLAlchemy and the models, opens the engine and
+upgrades the schema on a background thread, while the CLI prints its
+menu or the GUI draws its window; the first command that needs the
+database waits for it (usually it is ready long before)
+
+usage:
+    startup = Startup(DATABASE, "default")
+    ...  # draw the first screen
+    session = startup.session()
+    ...
+    startup.close()  # on shutdown
+"""
+
+# library modules
+import sys
+import time
+import threading
+
+
+class Startup:
+    """Opens a bank database on a background thread
+
+    constructor args:
+        url (str): database URL
+        profile (str, default="default"): storage profile (see settings.PROFILES)
+        instrument (str, default=None): report the SQL of each command to
+            this file ("-" for stdout), see instrument module
+        watch_changes (bool, default=False): create a ChangeFeed for the sessions
+    """
+
+    def __init__(self, url: str, profile="default", instrument=None, watch_changes=False) -> None:
+        self._url = url
+        self._profile = profile
+        self._instrument = instrument
+        self._watch_changes = watch_changes
+
+        self._engine = None
+        self._session_factory = None
+        self._feed = None
+        self._instrumentation = None
+        self._output = None
+        self._error: Exception = None
+
+        self._started = time.perf_counter()
+        self._elapsed: float = None
+        self._done = threading.Event()
+        threading.Thread(target=self._open, name="startup", daemon=True).start()
+
+    def _open(self) -> None:
+        try:
+            from sqlalchemy.orm.session import sessionmaker
+            from db import create_bank_engine
+            from migrations import upgrade
+
+            self._engine = create_bank_engine(self._url, self._profile)
+            upgrade(self._engine)
+            self._session_factory = sessionmaker(bind=self._engine)
+
+            if self._watch_changes:
+                from changes import ChangeFeed
+                self._feed = ChangeFeed(self._session_factory)
+
+            if self._instrument:
+                from instrument import Instrumentation
+                if self._instrument != "-":
+                    self._output = open(self._instrument, "a", encoding="utf-8")
+                self._instrumentation = Instrumentation(self._engine, self._session_factory,
+                                                        self._output or sys.stdout)
+        except Exception as err:
+            self._error = err
+        finally:
+            self._elapsed = time.perf_counter() - self._started
+            self._done.set()
+
+    def wait(self) -> None:
+        """Waits until the database is open
+
+        Raises:
+            Exception: the error that stopped the database from opening
+        """
+        self._done.wait()
+        if self._error is not None:
+            raise self._error
+
+    def close(self) -> None:
+        """Stops the instrumentation, closes its report file and the
+        engine (waits until the database is open or failed to open)"""
+        self._done.wait()
+        if self._instrumentation is not None:
+            self._instrumentation.close()
+        if self._output is not None:
+            self._output.close()
+        if self._engine is not None:
+            self._engine.dispose()
+
+    def session(self):
+        """Returns a new session (waits until the database is open)"""
+        return self._get_session_factory()()
+
+    def _get_session_factory(self):
+        """Getter for the session factory (waits until the database is open)"""
+        self.wait()
+        return self._session_factory
+
+    session_factory = property(_get_session_factory)
+
+    def _get_feed(self):
+        """Getter for the ChangeFeed (None unless watch_changes)"""
+        self.wait()
+        return self._feed
+
+    feed = property(_get_feed)
+
+    def _get_instrumentation(self):
+        """Getter for the Instrumentation (None unless instrument)"""
+        self.wait()
+        return self._instrumentation
+
+    instrumentation = property(_get_instrumentation)
+
+    def _get_elapsed(self) -> float:
+        """Getter for the seconds the database took to open (waits)"""
+        self.wait()
+        return self._elapsed
+
+    elapsed = property(_get_elapsed)
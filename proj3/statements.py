@@ -0,0 +1,54 @@
+"""
+statements module
+
+implements the command line for monthly account rollups (see rollup module)
+
+usage:
+    python statements.py show ACCOUNT [--database URL]
+    python statements.py rebuild [--database URL]
+"""
+
+# library modules
+import time
+from argparse import ArgumentParser
+
+# SQL modules
+from sqlalchemy import create_engine
+from sqlalchemy.orm.session import sessionmaker
+
+# custom modules
+from db import DATABASE
+from migrations import upgrade
+from rollup import rebuild, statement
+
+
+def parse() -> dict:
+    """Parse the CLI arguments"""
+    parser = ArgumentParser(description="Show and maintain monthly account rollups")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    show_parser = subparsers.add_parser("show", help="print the monthly statement of an account")
+    show_parser.add_argument("account", type=int)
+    show_parser.add_argument("--database", default=DATABASE)
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="regenerate the rollups in bulk")
+    rebuild_parser.add_argument("--database", default=DATABASE)
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse()
+
+    engine = create_engine(args.database)
+    upgrade(engine)
+    session = sessionmaker(bind=engine)()
+
+    if args.command == "rebuild":
+        began = time.perf_counter()
+        rebuild(session)
+        session.commit()
+        print(f"rebuilt rollups in {time.perf_counter() - began:.2f}s")
+    else:
+        for month in statement(session, args.account):
+            print(month)
@@ -0,0 +1,1351 @@
+"""
+testing module for the bank modules 'bank.py', 'account.py' and 'migrations.py'
+"""
+
+# library modules
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import asyncio
+import sqlite3
+import threading
+import subprocess
+import http.client
+from pathlib import Path
+from decimal import Decimal
+from datetime import date
+from collections import Counter
+
+# testing modules
+import pytest
+
+# SQL modules
+from sqlalchemy import create_engine, select, func, event, text
+from sqlalchemy.orm.session import sessionmaker
+
+# under-test modules
+from db import Base, PROFILES, create_bank_engine
+from settings import check_layout
+from migrations import upgrade, MIGRATIONS, LayoutError
+import merkle
+from hashtree import LocalPeer, diff as ledger_diff
+import rollup
+from bank import Bank, window_query
+from account import Account, OverdrawError, TransactionLimitError, TransactionSequenceError
+from transaction import Transaction, to_cents, from_cents
+from batch import GroupCommitSession
+from loader import bulk_load
+from instrument import Instrumentation
+from changes import ChangeFeed
+from worker import DatabaseWorker, Cancelled
+from startup import Startup
+from shards import ShardSet, shard_urls
+from workload import WorkloadGenerator, Operation, OPEN, TRANSACTION
+from replay import DatabaseTarget, replay
+from close import month_end_close, interest_cents
+from export import export, read_columns
+from layout import convert
+from service import BankService, create_server, call, add_transaction
+import harness
+
+
+@pytest.fixture
+def engine():
+    engine = create_engine("sqlite://")
+    upgrade(engine)
+    return engine
+
+
+@pytest.fixture
+def session(engine):
+    return sessionmaker(bind=engine)()
+
+
+@pytest.fixture
+def bank(session):
+    bank = Bank()
+    session.add(bank)
+    session.commit()
+    return bank
+
+
+def summed_balance(session, acct) -> Decimal:
+    """Balance computed from the transaction rows"""
+    return from_cents(session.scalar(select(func.sum(Transaction._amt_cents))
+                                     .where(Transaction._account_num == acct.num)))
+
+
+class TestBalance:
+
+    def test_new_account_balance(self, bank, session):
+        acct = bank.add_account("savings", session)
+        assert acct.balance == 0
+
+    def test_balance_after_transactions(self, bank, session):
+        acct = bank.add_account("checking", session)
+        acct.add_transaction("100.25", session, date="2023-01-01")
+        acct.add_transaction("-40.10", session, date="2023-01-02")
+        assert f"{acct.balance:.2f}" == "60.15"
+        assert acct.balance == summed_balance(session, acct)
+
+    def test_balance_includes_interest_and_fees(self, bank, session):
+        acct = bank.add_account("checking", session)
+        acct.add_transaction("50", session, date="2023-01-05")
+        acct.interest_and_fees(session)
+        assert f"{acct.balance:.2f}" == "40.06"
+        assert acct.balance == summed_balance(session, acct)
+
+    def test_balance_does_not_load_transactions(self, bank, session):
+        acct = bank.add_account("checking", session)
+        acct.add_transaction("50", session, date="2023-01-05")
+        session.expire_all()
+        acct.balance
+        assert "_transactions" not in acct.__dict__
+
+
+# schema of the first release (Float amounts, no balance or hash tables)
+LEGACY_SCHEMA = [
+    "CREATE TABLE bank (_id INTEGER PRIMARY KEY)",
+    "CREATE TABLE account (_num INTEGER PRIMARY KEY, _interest_rate FLOAT, "
+    "_interest_triggered INTEGER, _bank_id INTEGER REFERENCES bank (_id), _type VARCHAR(10))",
+    "CREATE TABLE savingsaccount (_num INTEGER PRIMARY KEY REFERENCES account (_num), "
+    "_day_lim INTEGER, _month_lim INTEGER)",
+    'CREATE TABLE "transaction" (_id INTEGER PRIMARY KEY, _amt FLOAT, _date DATE, '
+    "_exempt BOOLEAN, _account_num INTEGER REFERENCES account (_num))",
+    "INSERT INTO bank VALUES (1)",
+    "INSERT INTO account VALUES (1, 0.029, 0, 1, 'savingsaccount')",
+    "INSERT INTO savingsaccount VALUES (1, 2, 5)",
+    """INSERT INTO "transaction" VALUES (1, 75.5, '2023-01-05', 0, 1)""",
+    """INSERT INTO "transaction" VALUES (2, 0.1, '2023-01-06', 0, 1)""",
+    """INSERT INTO "transaction" VALUES (3, 2.1924500000000003, '2023-01-31', 1, 1)""",
+]
+
+
+class TestMigrations:
+
+    @pytest.fixture
+    def legacy_engine(self):
+        engine = create_engine("sqlite://")
+        with engine.begin() as conn:
+            for statement in LEGACY_SCHEMA:
+                conn.exec_driver_sql(statement)
+        return engine
+
+    def test_upgrade_converts_amounts_to_cents(self, legacy_engine):
+        upgrade(legacy_engine)
+        with legacy_engine.connect() as conn:
+            cents = conn.exec_driver_sql('SELECT _amt_cents FROM "transaction" ORDER BY _id')
+            assert [row[0] for row in cents] == [7550, 10, 219]
+
+    def test_upgrade_backfills_balance(self, legacy_engine):
+        upgrade(legacy_engine)
+        session = sessionmaker(bind=legacy_engine)()
+        assert session.get(Account, 1).balance == Decimal("77.79")
+
+    def test_upgrade_keeps_month_hashes(self, legacy_engine):
+        upgrade(legacy_engine)
+        session = sessionmaker(bind=legacy_engine)()
+        migrated = merkle.ledger_digest(session, "months")
+        merkle.rebuild(session)
+        assert merkle.ledger_digest(session, "months") == migrated
+
+    def test_upgrade_sets_version(self, legacy_engine):
+        upgrade(legacy_engine)
+        with legacy_engine.connect() as conn:
+            assert conn.exec_driver_sql("PRAGMA user_version").scalar() == len(MIGRATIONS)
+
+
+    def test_upgrade_skips_current_schema(self, engine):
+        statements = []
+        event.listen(engine, "before_cursor_execute",
+                     lambda *args: statements.append(args[2]))
+        upgrade(engine)
+        assert len(statements) == 1 and "user_version" in statements[0]
+
+    def test_upgrade_builds_rollups(self, legacy_engine):
+        upgrade(legacy_engine)
+        session = sessionmaker(bind=legacy_engine)()
+        [month] = session.get(Account, 1).statement()
+        assert (month.month, month.non_exempt, month._exempt) == ("2023-01", 2, 1)
+        assert month.closing_balance == Decimal("77.79")
+
+
+class TestCents:
+
+    def test_to_cents_rounds_half_away_from_zero(self):
+        assert [to_cents(amt) for amt in ("0.125", "-0.125", "10", "1.004")] == [13, -13, 1000, 100]
+
+    def test_large_amounts_are_exact(self):
+        assert from_cents(to_cents("123456789012.34")) == Decimal("123456789012.34")
+
+    def test_amounts_are_stored_as_cents(self, bank, session):
+        acct = bank.add_account("checking", session)
+        acct.add_transaction("0.10", session, date="2023-01-01")
+        acct.add_transaction("0.20", session, date="2023-01-01")
+        assert acct.balance == Decimal("0.30")
+        assert session.scalar(select(Transaction._amt_cents)) == 10
+
+    def test_interest_is_rounded_to_cents(self, bank, session):
+        acct = bank.add_account("savings", session)
+        acct.add_transaction("123.45", session, date="2023-01-05")
+        acct.interest_and_fees(session)
+        assert acct.balance == summed_balance(session, acct) == Decimal("127.03")
+
+
+class TestAccountLookup:
+
+    def test_get_account(self, bank, session):
+        acct = bank.add_account("savings", session)
+        assert bank.get_account(str(acct.num)) is acct
+
+    def test_get_missing_account(self, bank, session):
+        bank.add_account("savings", session)
+        assert bank.get_account(42) is None
+
+    def test_get_account_does_not_load_accounts(self, bank, session):
+        acct = bank.add_account("checking", session)
+        session.expire_all()
+        assert bank.get_account(acct.num).num == acct.num
+        assert "_accounts" not in bank.__dict__
+
+    def test_account_numbers_follow_highest(self, bank, session):
+        first = bank.add_account("savings", session)
+        second = bank.add_account("checking", session)
+        assert (first.num, second.num) == (1, 2)
+
+
+class TestSummary:
+
+    def test_summary_matches_accounts(self, bank, session):
+        for acct_type, amt in (("savings", "10.50"), ("checking", "2000"), ("savings", "0.01")):
+            bank.add_account(acct_type, session).add_transaction(amt, session, date="2023-01-01")
+        assert [str(row) for row in bank.summary()] == [str(acct) for acct in bank.accounts]
+
+    def test_summary_is_one_query(self, engine, bank, session):
+        for _ in range(3):
+            bank.add_account("checking", session)
+        session.expunge_all()
+        session.add(bank)
+        session.refresh(bank)
+
+        statements = []
+        event.listen(engine, "before_cursor_execute",
+                     lambda *args: statements.append(args[2]))
+        rows = list(bank.summary(batch_size=2))
+        assert len(rows) == 3 and len(statements) == 1
+        assert not any(isinstance(obj, Account) for obj in session.identity_map.values())
+
+    def test_summary_window(self, bank, session):
+        for _ in range(5):
+            bank.add_account("checking", session)
+        assert bank.account_count == 5
+        assert [row.num for row in bank.summary_window(3)] == [1, 2, 3]
+        assert [row.num for row in bank.summary_window(3, after=1)] == [2, 3, 4]
+        assert [row.num for row in bank.summary_window(3, after=4)] == [5]
+        assert [row.num for row in bank.summary_window(3, before=5)] == [2, 3, 4]
+        assert bank.account_range() == (1, 5)
+
+    def test_summary_window_seeks(self, engine, bank, session):
+        for _ in range(3):
+            bank.add_account("checking", session)
+        with engine.connect() as conn:
+            for after, before in ((2, None), (None, 3)):
+                query = window_query(bank._id, 2, after, before).compile(
+                    engine, compile_kwargs={"literal_binds": True})
+                plan = str(conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {query}").all())
+                assert "SCAN" not in plan and "TEMP B-TREE" not in plan
+
+
+class TestChangeFeed:
+
+    @pytest.fixture
+    def factory(self, engine):
+        return sessionmaker(bind=engine)
+
+    @pytest.fixture
+    def changes(self, factory) -> list:
+        changes = []
+        ChangeFeed(factory).subscribe(changes.append)
+        return changes
+
+    def test_new_account_and_transactions(self, factory, changes):
+        session = factory()
+        bank = Bank()
+        session.add(bank)
+        session.commit()
+        acct = bank.add_account("checking", session)
+        other = bank.add_account("savings", session)
+        assert [set(change.created) for change in changes] == [{acct.num}, {other.num}]
+
+        acct.add_transaction("20", session, date="2023-01-02")
+        assert changes[-1].accounts == {acct.num} and not changes[-1].created
+
+    def test_rollback_is_not_announced(self, factory, changes):
+        session = factory()
+        bank = Bank()
+        session.add(bank)
+        session.commit()
+        acct = bank.add_account("checking", session)
+        count = len(changes)
+        acct._add_pending("20", session, date="2023-01-02")
+        session.flush()
+        session.rollback()
+        session.commit()
+        assert len(changes) == count
+
+    def test_group_commit_announces_on_sync(self, engine):
+        factory = sessionmaker(bind=engine, class_=GroupCommitSession, batch_size=10)
+        changes = []
+        ChangeFeed(factory).subscribe(changes.append)
+        session = factory()
+        bank = Bank()
+        session.add(bank)
+        session.commit()
+        acct = bank.add_account("checking", session)
+        acct.add_transaction("20", session, date="2023-01-02")
+        assert changes == []
+        session.sync()
+        assert changes[0].accounts == {acct.num} and changes[0].created == {acct.num}
+
+
+class TestDatabaseWorker:
+
+    @pytest.fixture
+    def worker(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'bank.db'}")
+        upgrade(engine)
+        worker = DatabaseWorker(sessionmaker(bind=engine))
+        yield worker
+        worker.close()
+
+    def run(self, worker, func, *args, **callbacks) -> list:
+        """Submits a job, waits for it and returns the delivered callbacks"""
+        delivered = []
+        for name in ("on_done", "on_error", "on_progress"):
+            callbacks.setdefault(name, lambda *result, name=name: delivered.append((name, result)))
+        worker.submit(func, *args, **callbacks)
+        worker.close()
+        worker.poll()
+        return delivered
+
+    def test_results_are_delivered_by_poll(self, worker):
+        def add_bank(session, job):
+            session.add(Bank())
+            session.commit()
+            return session.scalar(select(func.count()).select_from(Bank))
+
+        assert self.run(worker, add_bank) == [("on_done", (1,))]
+
+    def test_interest_matches_main_thread(self, worker):
+        # 12.50 * 0.0012 = 0.015 rounds up in 9 digits but not in 28
+        def add_interest(session, job):
+            bank = Bank()
+            session.add(bank)
+            session.commit()
+            acct = bank.add_account("checking", session)
+            acct.add_transaction("12.50", session, date="2023-01-02")
+            acct.interest_and_fees(session)
+            return [trans._amt_cents for trans in acct.transactions]
+
+        main = Bank()
+        main_session = sessionmaker(bind=create_engine("sqlite://"))()
+        upgrade(main_session.get_bind())
+        main_session.add(main)
+        acct = main.add_account("checking", main_session)
+        acct.add_transaction("12.50", main_session, date="2023-01-02")
+        acct.interest_and_fees(main_session)
+        expected = [trans._amt_cents for trans in acct.transactions]
+
+        assert expected == [1250, 2, -1000]
+        assert self.run(worker, add_interest) == [("on_done", (expected,))]
+
+    def test_errors_roll_back(self, worker):
+        def failing(session, job):
+            session.add(Bank())
+            session.flush()
+            raise ValueError("failed")
+
+        def count(session, job):
+            return session.scalar(select(func.count()).select_from(Bank))
+
+        delivered = []
+        worker.submit(failing, on_error=delivered.append)
+        worker.submit(count, on_done=delivered.append)
+        worker.close()
+        worker.poll()
+        assert isinstance(delivered[0], ValueError) and delivered[1] == 0
+
+    def test_cancel_stops_at_progress(self, worker):
+        def long_job(session, job):
+            for done in range(100):
+                if done == 10:
+                    job.cancel()
+                job.progress(done, 100)
+            return "finished"
+
+        delivered = self.run(worker, long_job)
+        assert delivered[0] == ("on_progress", (0, 100))
+        assert delivered[-1][0] == "on_error" and isinstance(delivered[-1][1][0], Cancelled)
+
+
+class TestStartup:
+
+    def test_opens_database_in_background(self, tmp_path):
+        startup = Startup(f"sqlite:///{tmp_path / 'bank.db'}", watch_changes=True)
+        session = startup.session()
+        session.add(Bank())
+        session.commit()
+        assert session.scalar(select(func.count()).select_from(Bank)) == 1
+        assert isinstance(startup.feed, ChangeFeed) and startup.instrumentation is None
+
+    def test_close_closes_report_file(self, tmp_path):
+        startup = Startup(f"sqlite:///{tmp_path / 'bank.db'}",
+                          instrument=str(tmp_path / "sql.log"))
+        with startup.instrumentation.command("open"):
+            startup.session().add(Bank())
+        output = startup._output
+        startup.close()
+        assert output.closed and "command: open" in (tmp_path / "sql.log").read_text()
+        assert not event.contains(Base, "load", startup.instrumentation._load)
+
+    def test_errors_are_raised_on_wait(self, tmp_path):
+        startup = Startup(f"sqlite:///{tmp_path / 'bank.db'}", profile="missing")
+        with pytest.raises(KeyError):
+            startup.session()
+
+
+class TestShards:
+
+    @pytest.fixture
+    def shards(self, tmp_path):
+        shards = ShardSet(shard_urls(f"sqlite:///{tmp_path / 'bank.db'}", 3))
+        yield shards
+        shards.close()
+
+    def count_rows(self, shards, table) -> list:
+        counts = []
+        for index in range(shards.count):
+            with shards._engines[str(index)].connect() as conn:
+                counts.append(conn.scalar(select(func.count()).select_from(table)))
+        return counts
+
+    def test_accounts_are_partitioned_by_number(self, shards):
+        session = shards.session()
+        bank = session.query(Bank).first()
+        for day in range(1, 8):
+            acct = bank.add_account("checking", session)
+            acct.add_transaction("100", session, date=f"2023-01-0{day}")
+        bank.get_account(2).add_transaction("-40", session, date="2023-01-09")
+
+        assert self.count_rows(shards, Account.__table__) == [3, 2, 2]
+        assert self.count_rows(shards, Transaction.__table__) == [3, 3, 2]
+        assert self.count_rows(shards, rollup.AccountMonth.__table__) == [3, 2, 2]
+        assert bank.get_account(2).balance == Decimal("60")
+
+    def test_summary_merges_shards(self, shards):
+        session = shards.session()
+        bank = session.query(Bank).first()
+        for acct_type in ("savings", "checking") * 4:
+            bank.add_account(acct_type, session)
+        assert [row.num for row in bank.summary(batch_size=2)] == list(range(1, 9))
+        assert [row.num for row in bank.summary_window(3, after=2)] == [3, 4, 5]
+        assert [row.num for row in bank.summary_window(3, before=3)] == [1, 2]
+        assert [row.num for row in bank.summary_window(3, before=9)] == [6, 7, 8]
+        assert bank.account_range() == (1, 8)
+        assert bank.account_count == 8
+        assert shard_urls("sqlite:///bank.db", 2) == ["sqlite:///bank-0.db", "sqlite:///bank-1.db"]
+
+
+class TestRollups:
+
+    def rollups(self, session) -> list:
+        return [(row._account_num, row.month, row.non_exempt, row._exempt,
+                 row._net_cents, row._closing_cents, row.newest_date, row._newest_non_exempt)
+                for row in session.scalars(select(rollup.AccountMonth)
+                                           .order_by(rollup.AccountMonth._account_num,
+                                                     rollup.AccountMonth._month))]
+
+    def test_rollup_maintained_with_inserts(self, bank, session):
+        acct = bank.add_account("checking", session)
+        acct.add_transaction("50", session, date="2023-01-05")
+        acct.add_transaction("-20", session, date="2023-01-09")
+        acct.interest_and_fees(session)
+        acct.add_transaction("5", session, date="2023-02-01")
+        assert [str(month) for month in acct.statement()] == [
+            "2023-01: 2 transactions, 2 exempt, net $20.04, closing balance $20.04",
+            "2023-02: 1 transactions, 0 exempt, net $5.00, closing balance $25.04"]
+
+    def test_rebuild_matches_maintained_rollups(self, bank, session):
+        for acct_type in ("savings", "checking"):
+            acct = bank.add_account(acct_type, session)
+            for month in range(1, 4):
+                acct.add_transaction("200", session, date=f"2023-{month:02}-03")
+                acct.add_transaction("-30", session, date=f"2023-{month:02}-10")
+                acct.interest_and_fees(session)
+        maintained = self.rollups(session)
+        rollup.rebuild(session)
+        session.commit()
+        assert self.rollups(session) == maintained
+
+    def test_month_limit_reads_rollup(self, bank, session):
+        acct = bank.add_account("savings", session)
+        acct.add_transaction("10", session, date="2023-01-01")
+        rollup.get_month(session, acct.num, acct.newest_date)._non_exempt = 5
+        with pytest.raises(TransactionLimitError):
+            acct.add_transaction("10", session, date="2023-01-02")
+
+    def test_day_limit_reads_rollup(self, engine, bank, session):
+        acct = bank.add_account("savings", session)
+        acct.add_transaction("10", session, date="2023-01-03")
+        acct.add_transaction("10", session, date="2023-01-03")
+        statements = []
+        event.listen(engine, "before_cursor_execute",
+                     lambda *args: statements.append(args[2]))
+        with pytest.raises(TransactionLimitError):
+            acct.add_transaction("10", session, date="2023-01-03")
+        acct.add_transaction("10", session, date="2023-01-04")
+        assert not any('"transaction"' in statement for statement in statements
+                       if statement.lstrip().startswith("SELECT"))
+        month = rollup.get_month(session, acct.num, acct.newest_date)
+        assert (str(month.newest_date), month._newest_non_exempt) == ("2023-01-04", 1)
+
+    def test_earlier_day_counts_transactions(self, bank, session):
+        acct = bank.add_account("savings", session)
+        acct.add_transaction("10", session, date="2023-01-03")
+        acct.add_transaction("10", session, date="2023-01-03")
+        acct.add_transaction("10", session, date="2023-01-05")
+        # the limit error is raised before the sequence error, as before
+        with pytest.raises(TransactionLimitError):
+            acct.add_transaction("10", session, date="2023-01-03")
+        with pytest.raises(TransactionSequenceError):
+            acct.add_transaction("10", session, date="2023-01-04")
+
+
+class TestPagination:
+
+    @pytest.fixture
+    def acct(self, bank, session):
+        acct = bank.add_account("checking", session)
+        for day in range(1, 26):
+            acct.add_transaction(str(day), session, date=f"2023-01-{day:02}")
+        acct.add_transaction("100", session, date="2023-01-25")
+        return acct
+
+    def test_first_page(self, acct):
+        page = acct.transaction_page(size=10)
+        assert [trans.date.day for trans in page.transactions] == list(range(1, 11))
+        assert (page.has_prev, page.has_next) == (False, True)
+
+    def test_next_and_prev_pages(self, acct):
+        first = acct.transaction_page(size=10)
+        second = acct.transaction_page(after=first.transactions[-1].key, size=10)
+        assert second.transactions[0].date.day == 11
+        back = acct.transaction_page(before=second.transactions[0].key, size=10)
+        assert back.transactions == first.transactions
+        assert (back.has_prev, back.has_next) == (False, True)
+
+    def test_pages_cover_history_in_order(self, acct):
+        listed = [trans for page in acct.pages(size=7) for trans in page]
+        assert [str(trans) for trans in listed] == [str(trans) for trans in acct.transactions]
+        assert [page for page in acct.pages(size=7)][-1][-1]._amt == Decimal(100)
+
+    def test_page_query_uses_index(self, engine, acct):
+        with engine.connect() as conn:
+            plan = conn.exec_driver_sql(
+                'EXPLAIN QUERY PLAN SELECT * FROM "transaction" WHERE _account_num = 1 '
+                "AND (_date, _id) > ('2023-01-05', 5) ORDER BY _date, _id LIMIT 21").all()
+        assert "ix_transaction_account_page" in str(plan)
+        assert "TEMP B-TREE" not in str(plan)
+
+
+class TestProfiles:
+
+    def pragma(self, engine, name):
+        with engine.connect() as conn:
+            return conn.exec_driver_sql(f"PRAGMA {name}").scalar()
+
+    def test_default_profile_keeps_sqlite_defaults(self, tmp_path):
+        engine = create_bank_engine(f"sqlite:///{tmp_path / 'bank.db'}")
+        assert self.pragma(engine, "journal_mode") == "delete"
+        assert self.pragma(engine, "synchronous") == 2
+
+    def test_balanced_profile(self, tmp_path):
+        engine = create_bank_engine(f"sqlite:///{tmp_path / 'bank.db'}", "balanced")
+        assert self.pragma(engine, "journal_mode") == "wal"
+        assert self.pragma(engine, "synchronous") == 1
+        assert self.pragma(engine, "cache_size") == PROFILES["balanced"].cache_size
+        assert self.pragma(engine, "busy_timeout") == 5000
+
+    def test_bank_works_with_every_profile(self, tmp_path):
+        for profile in PROFILES:
+            engine = create_bank_engine(f"sqlite:///{tmp_path / profile}.db", profile)
+            upgrade(engine)
+            session = sessionmaker(bind=engine)()
+            bank = Bank()
+            session.add(bank)
+            session.commit()
+            acct = bank.add_account("savings", session)
+            acct.add_transaction("10", session, date="2023-01-01")
+            assert acct.balance == Decimal("10.00")
+            session.close()
+            engine.dispose()
+
+
+class TestInstrumentation:
+
+    @pytest.fixture
+    def instrumented(self, engine):
+        factory = sessionmaker(bind=engine)
+        output = io.StringIO()
+        instrumentation = Instrumentation(engine, factory, output)
+        session = factory()
+        bank = Bank()
+        session.add(bank)
+        session.commit()
+        yield instrumentation, session, bank, output
+        instrumentation.close()
+
+    def test_counts_statements_per_command(self, instrumented):
+        instrumentation, session, bank, output = instrumented
+        acct = bank.add_account("checking", session)
+        with instrumentation.command("add transaction") as stats:
+            acct.add_transaction("10", session, date="2023-01-01")
+        assert stats.statements > 0 and stats._commits == 1
+        assert stats._rows_written >= 3  # transaction, month hash and rollup
+        assert "command: add transaction" in output.getvalue()
+
+    def test_commands_are_per_thread(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'bank.db'}")
+        upgrade(engine)
+        factory = sessionmaker(bind=engine)
+        instrumentation = Instrumentation(engine, factory, io.StringIO())
+        other_stats = []
+
+        def other_thread():
+            other = factory()
+            other.add(Bank())
+            other.commit()  # outside any command of this thread
+            with instrumentation.command("other") as stats:
+                other.add(Bank())
+                other.commit()
+            other.close()
+            other_stats.append(stats)
+
+        with instrumentation.command("idle") as stats:
+            thread = threading.Thread(target=other_thread)
+            thread.start()
+            thread.join()
+        instrumentation.close()
+        assert stats.statements == 0 and stats._commits == 0
+        assert other_stats[0].statements > 0 and other_stats[0]._commits == 1
+
+    def test_close_removes_listeners(self, instrumented):
+        instrumentation, session, bank, output = instrumented
+        instrumentation.close()
+        assert not event.contains(Base, "load", instrumentation._load)
+        with instrumentation.command("after close") as stats:
+            bank.add_account("checking", session).add_transaction("10", session,
+                                                                  date="2023-01-01")
+        assert stats.statements == 0 and stats._commits == 0
+
+    def test_summary_is_one_statement(self, instrumented):
+        instrumentation, session, bank, _ = instrumented
+        bank.add_account("checking", session)
+        session.refresh(bank)
+        with instrumentation.command("summary") as stats:
+            list(bank.summary())
+        assert stats.statements == 1 and not stats.n_plus_one()
+
+    def test_flags_n_plus_one(self, instrumented):
+        instrumentation, session, bank, output = instrumented
+        for _ in range(6):
+            bank.add_account("savings", session)
+        session.expire_all()
+        with instrumentation.command("naive summary") as stats:
+            for acct in bank.accounts:
+                acct.transactions
+        assert stats.n_plus_one()[0][0] == 6
+        assert stats._lazy_loads["Account._transactions"] == 6
+        assert "possible N+1: 6x SELECT" in output.getvalue()
+
+
+class TestGroupCommit:
+
+    @pytest.fixture
+    def batch_engine(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'bank.db'}")
+        upgrade(engine)
+        return engine
+
+    @pytest.fixture
+    def batch_session(self, batch_engine):
+        return sessionmaker(bind=batch_engine, class_=GroupCommitSession, batch_size=10)()
+
+    @pytest.fixture
+    def batch_bank(self, batch_session):
+        bank = Bank()
+        batch_session.add(bank)
+        batch_session.commit()
+        return bank
+
+    def count_transactions(self, engine) -> int:
+        with engine.connect() as conn:
+            return conn.scalar(select(func.count()).select_from(Transaction))
+
+    def test_commit_is_deferred(self, batch_engine, batch_session, batch_bank):
+        acct = batch_bank.add_account("checking", batch_session)
+        acct.add_transaction("20", batch_session, date="2023-01-02")
+        assert batch_session.pending == 3
+        assert self.count_transactions(batch_engine) == 0
+
+    def test_sync_commits_batch(self, batch_engine, batch_session, batch_bank):
+        acct = batch_bank.add_account("checking", batch_session)
+        acct.add_transaction("20", batch_session, date="2023-01-02")
+        batch_session.sync()
+        assert batch_session.pending == 0
+        assert self.count_transactions(batch_engine) == 1
+
+    def test_full_batch_commits(self, batch_engine, batch_session, batch_bank):
+        acct = batch_bank.add_account("checking", batch_session)
+        for day in range(1, 9):
+            acct.add_transaction("20", batch_session, date=f"2023-01-{day:02}")
+        assert self.count_transactions(batch_engine) == 8
+
+    def test_limits_see_pending_transactions(self, batch_session, batch_bank):
+        acct = batch_bank.add_account("savings", batch_session)
+        acct.add_transaction("20", batch_session, date="2023-01-02")
+        acct.add_transaction("20", batch_session, date="2023-01-02")
+        with pytest.raises(TransactionLimitError):
+            acct.add_transaction("20", batch_session, date="2023-01-02")
+
+    @pytest.fixture
+    def delayed(self, batch_engine):
+        """Sessions with a small max_delay, over a committed bank"""
+        Session = sessionmaker(bind=batch_engine, class_=GroupCommitSession,
+                               batch_size=100, max_delay=0.05)
+        with Session() as session:
+            session.add(Bank())
+            session.sync()
+        return Session
+
+    def test_sync_if_due(self, batch_engine, delayed):
+        session = delayed()
+        acct = session.query(Bank).first().add_account("checking", session)
+        acct.add_transaction("20", session, date="2023-01-02")
+        assert not session.sync_if_due() and session.deadline is not None
+        session.idle(0.1)
+        assert session.deadline is None and self.count_transactions(batch_engine) == 1
+        session.close()
+
+    def test_idle_worker_commits_batch(self, batch_engine, delayed):
+        def open_account(session, job):
+            acct = session.query(Bank).first().add_account("checking", session)
+            acct.add_transaction("20", session, date="2023-01-02")
+
+        worker = DatabaseWorker(delayed)
+        worker.submit(open_account)
+        time.sleep(0.5)  # no further job, so only the worker's wait commits the batch
+        assert self.count_transactions(batch_engine) == 1
+        worker.close()
+        worker.poll()
+
+    def test_close_discards_unsynced_batch(self, batch_engine, delayed):
+        with pytest.raises(ValueError):
+            with delayed() as session:
+                acct = session.query(Bank).first().add_account("checking", session)
+                acct.add_transaction("20", session, date="2023-01-02")
+                raise ValueError("failed halfway")
+        session = delayed()
+        acct = session.query(Bank).first().add_account("checking", session)
+        acct.add_transaction("20", session, date="2023-01-02")
+        session.close()
+        assert self.count_transactions(batch_engine) == 0
+
+    def test_worker_close_keeps_finished_jobs(self, batch_engine, delayed):
+        def open_account(session, job):
+            acct = session.query(Bank).first().add_account("checking", session)
+            acct.add_transaction("20", session, date="2023-01-02")
+
+        Session = sessionmaker(bind=batch_engine, class_=GroupCommitSession,
+                               batch_size=100, max_delay=60)
+        worker = DatabaseWorker(Session)
+        worker.submit(open_account)
+        worker.close()
+        worker.poll()
+        assert self.count_transactions(batch_engine) == 1
+
+    def test_overdraft_sees_pending_transactions(self, batch_session, batch_bank):
+        acct = batch_bank.add_account("checking", batch_session)
+        acct.add_transaction("20", batch_session, date="2023-01-02")
+        acct.add_transaction("-15", batch_session, date="2023-01-03")
+        with pytest.raises(OverdrawError):
+            acct.add_transaction("-10", batch_session, date="2023-01-04")
+
+
+class TestAccountRules:
+
+    def test_savings_month_limit(self, bank, session):
+        acct = bank.add_account("savings", session)
+        for day in range(1, 6):
+            acct.add_transaction("10", session, date=f"2023-01-{day:02}")
+        with pytest.raises(TransactionLimitError):
+            acct.add_transaction("10", session, date="2023-01-20")
+        acct.add_transaction("10", session, date="2023-02-01")
+
+    def test_limits_ignore_exempt_transactions(self, bank, session):
+        acct = bank.add_account("savings", session)
+        acct.add_transaction("10", session, date="2023-01-31")
+        acct.interest_and_fees(session)
+        acct.add_transaction("10", session, date="2023-01-31")
+        with pytest.raises(TransactionLimitError):
+            acct.add_transaction("10", session, date="2023-01-31")
+
+    def test_sequence_uses_newest_date(self, bank, session):
+        acct = bank.add_account("checking", session)
+        acct.add_transaction("10", session, date="2023-03-05")
+        with pytest.raises(TransactionSequenceError) as err:
+            acct.add_transaction("10", session, date="2023-03-04")
+        assert str(err.value.latest_date) == "2023-03-05"
+
+    def test_rule_queries_use_index(self, engine):
+        with engine.connect() as conn:
+            plan = conn.exec_driver_sql(
+                'EXPLAIN QUERY PLAN SELECT count(*) FROM "transaction" '
+                "WHERE _account_num = 1 AND _date >= '2023-01-01' "
+                "AND _date < '2023-02-01' AND _exempt = 0").all()
+        assert "ix_transaction_account_date" in str(plan)
+
+
+class TestReplay:
+
+    def ledger(self, tmp_path, model: str) -> dict:
+        """Replays a seeded workload against a model in its own process
+        (proj2 and proj3 share module names) and returns its ledger file"""
+        out = tmp_path / f"{model}.json"
+        subprocess.run([sys.executable, str(Path(__file__).resolve().parent / "replay.py"),
+                        "--model", model, "--seed", "0", "--accounts", "10", "--months", "3",
+                        "--ledger", str(out)], capture_output=True, check=True)
+        return json.loads(out.read_text())
+
+    def test_models_agree(self, tmp_path):
+        # proj2 rejects withdrawing the whole balance (proj3 allows it); this
+        # workload has no such withdrawal, so the models must match exactly
+        memory, database = self.ledger(tmp_path, "proj2"), self.ledger(tmp_path, "proj3")
+        assert set(database["rejections"]["transaction"]) == {
+            "OverdrawError", "TransactionLimitError", "TransactionSequenceError"}
+        assert memory["rejections"] == database["rejections"]
+        assert memory["accounts"] == database["accounts"]
+
+    def test_other_errors_propagate(self):
+        target = DatabaseTarget("sqlite://")
+        operations = [Operation(TRANSACTION, 0, "10.00", date(2023, 1, 2))]  # never opened
+        with pytest.raises(KeyError):
+            replay(operations, target)
+        target.close()
+
+
+class TestLedgerHashes:
+
+    # bank root of the ledger built by pinned_ledger (also pinned by the
+    # proj2 tests, so both models keep hashing ledgers identically)
+    PINNED_ROOT = "c698efa5361b5d34a096d5a4c2c02a939ac568c0d4de5feb4cfcc070cd805b8b"
+
+    class RecordingPeer:
+        """LocalPeer that keeps the requests it answered"""
+
+        def __init__(self, session) -> None:
+            self.peer = LocalPeer(merkle.DatabaseLedger(session))
+            self.requests = []
+
+        def request(self, **fields) -> dict:
+            self.requests.append(fields)
+            return self.peer.request(**fields)
+
+    @pytest.fixture
+    def sessions(self, tmp_path):
+        """Sessions of two databases with the same seeded ledger"""
+        target = DatabaseTarget(f"sqlite:///{tmp_path / 'left'}.db")
+        replay(WorkloadGenerator(seed=0, accounts=10, months=3), target)
+        target.close()
+        shutil.copy(tmp_path / "left.db", tmp_path / "right.db")
+        return [sessionmaker(bind=create_engine(f"sqlite:///{tmp_path / name}.db"))()
+                for name in ("left", "right")]
+
+    def diff(self, left, right) -> list:
+        return ledger_diff(LocalPeer(merkle.DatabaseLedger(left)),
+                           LocalPeer(merkle.DatabaseLedger(right)))
+
+    def test_pinned_root(self, session):
+        bank = Bank()
+        session.add(bank)
+        session.commit()
+        acct = bank.add_account("checking", session)
+        acct.add_transaction("100", session, date="2023-01-02")
+        acct.add_transaction("-20.5", session, date="2023-01-15")
+        acct.interest_and_fees(session)
+        bank.add_account("savings", session).add_transaction("50", session, date="2023-02-01")
+        assert merkle.DatabaseLedger(session).root().hex() == self.PINNED_ROOT
+
+    def test_hashtree_matches_proj2(self):
+        # each project keeps its own copy of the module (their other modules
+        # share names), so the copies must not drift apart
+        here = Path(__file__).resolve().parent
+        assert ((here / "hashtree.py").read_text()
+                == (here.parent / "proj2" / "hashtree.py").read_text())
+
+    def test_equal_ledgers(self, sessions):
+        assert self.diff(*sessions) == []
+
+    def test_changed_leaf(self, sessions):
+        left, right = sessions
+        right.execute(text('UPDATE "transaction" SET _amt_cents = _amt_cents + 1 WHERE _id = 17'))
+        merkle.rebuild(right)
+        right.commit()
+        num, day, cents = right.execute(text('SELECT _account_num, _date, _amt_cents '
+                                             'FROM "transaction" WHERE _id = 17')).one()
+
+        peers = self.RecordingPeer(left), self.RecordingPeer(right)
+        [change] = ledger_diff(*peers)
+        assert change.startswith(f"account {num} {day[:7]} transaction ")
+        assert change.endswith(f"{day}|{from_cents(cents - 1)}|0 != {day}|{from_cents(cents)}|0")
+        # only the differing month's leaves were requested
+        assert peers[0].requests[-1] == {"leaves": [[num, day[:7]]]}
+
+    def test_extra_and_missing_months(self, sessions):
+        left, right = sessions
+        acct = right.get(Account, 3)
+        acct.add_transaction("5", right, date="2022-05-02")
+        right.execute(text('DELETE FROM "transaction" WHERE _account_num = 4 '
+                           "AND _date >= '2022-03-01'"))
+        merkle.rebuild(right)
+        right.commit()
+
+        changes = self.diff(left, right)
+        assert "account 3 2022-05 transaction 0: missing != 2022-05-02|5.00|0" in changes
+        march = [change for change in changes if change.startswith("account 4 2022-03")]
+        assert march and all(change.endswith("!= missing") for change in march)
+        assert {change.split()[1] for change in changes} == {"3", "4"}
+
+    def test_account_only_in_one_ledger(self, sessions):
+        left, right = sessions
+        right.query(Bank).first().add_account("savings", right)
+        assert self.diff(left, right) == ["account 11 only in right"]
+
+    def test_refresh_is_incremental(self, sessions):
+        left, _ = sessions
+        merkle.refresh(left)
+        assert merkle.refresh(left) == 0
+        left.get(Account, 2).add_transaction("5", left, date="2022-04-02")
+        assert merkle.refresh(left) == 1
+
+    def test_verify_pickle_against_database(self, tmp_path):
+        # the proj2 ledger is pickled by a process that imports proj2
+        script = ("import sys, pickle, replay\n"
+                  "target = replay.MemoryTarget()\n"
+                  "replay.replay(replay.WorkloadGenerator(seed=0, accounts=10, months=3), target)\n"
+                  "pickle.dump(target._bank, open(sys.argv[1], 'wb'))\n")
+        here = Path(__file__).resolve().parent
+        subprocess.run([sys.executable, "-c", script, str(tmp_path / "bank.pickle")],
+                       cwd=here, check=True)
+        target = DatabaseTarget(f"sqlite:///{tmp_path / 'bank.db'}")
+        replay(WorkloadGenerator(seed=0, accounts=10, months=3), target)
+        target.close()
+
+        verify = [sys.executable, str(here / "verify.py"), "diff",
+                  f"pickle:{tmp_path / 'bank.pickle'}", f"db:sqlite:///{tmp_path / 'bank.db'}"]
+        assert subprocess.run(verify, capture_output=True, text=True).stdout == "ledgers match\n"
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'bank.db'}")
+        with engine.begin() as conn:
+            conn.exec_driver_sql('DELETE FROM "transaction" WHERE _id = 5')
+        subprocess.run([sys.executable, str(here / "verify.py"), "rebuild",
+                        "--database", f"sqlite:///{tmp_path / 'bank.db'}"], check=True)
+        result = subprocess.run(verify, capture_output=True, text=True)
+        assert result.returncode == 1 and "transaction" in result.stdout
+
+
+class TestBulkLoader:
+
+    def tables(self, engine) -> dict:
+        with engine.connect() as conn:
+            return {table: conn.exec_driver_sql(f"SELECT * FROM {table} ORDER BY 1, 2").all()
+                    for table in ("account", "savingsaccount", "checkingaccount",
+                                  "account_month", "month_hash")}
+
+    def test_load_matches_orm(self, tmp_path):
+        operations = list(WorkloadGenerator(seed=3, accounts=12, months=4))
+        # a backdated savings deposit: over the day limit of its own day
+        slot = max(op.slot for op in operations) + 1
+        operations += [Operation(OPEN, slot, "50", date(2024, 1, 3), "savings"),
+                       Operation(TRANSACTION, slot, "10", date(2024, 1, 3)),
+                       Operation(TRANSACTION, slot, "10", date(2024, 1, 10)),
+                       Operation(TRANSACTION, slot, "10", date(2024, 1, 3)),
+                       Operation(TRANSACTION, slot, "10", date(2024, 1, 9))]
+
+        target = DatabaseTarget(f"sqlite:///{tmp_path / 'orm.db'}")
+        recorder = replay(operations, target)
+        target.close()
+
+        engine = create_engine(f"sqlite:///{tmp_path / 'bulk.db'}")
+        upgrade(engine)
+        loader = bulk_load(engine, operations, batch_size=100)
+
+        assert self.tables(engine) == self.tables(create_engine(f"sqlite:///{tmp_path / 'orm.db'}"))
+        rejections = Counter()
+        for counts in recorder.rejections.values():
+            rejections.update(counts)
+        assert loader.rejections == dict(rejections)
+        assert rejections["TransactionLimitError"] and rejections["TransactionSequenceError"]
+
+    def test_load_restores_indexes(self, engine):
+        bulk_load(engine, WorkloadGenerator(seed=1, accounts=2, months=1))
+        with engine.connect() as conn:
+            names = {row[0] for row in conn.exec_driver_sql(
+                "SELECT name FROM sqlite_master WHERE type = 'index'")}
+        assert {"ix_transaction_account_date", "ix_transaction_account_page"} <= names
+
+
+class TestMonthEndClose:
+
+    @pytest.fixture
+    def engines(self, tmp_path):
+        """Two copies of a bank where only the first account was closed this month"""
+        operations = [op for op in WorkloadGenerator(seed=5, accounts=40, months=2)
+                      if op.kind != "interest" or op.slot == 0]
+        engines = []
+        for name in ("orm", "set"):
+            engine = create_engine(f"sqlite:///{tmp_path / name}.db")
+            upgrade(engine)
+            bulk_load(engine, operations)
+            with sessionmaker(bind=engine)() as session:
+                bank = session.query(Bank).first()
+                bank.add_account("checking", session)  # no transactions
+            engines.append(engine)
+        return engines
+
+    def tables(self, engine) -> dict:
+        with engine.connect() as conn:
+            tables = {table: conn.exec_driver_sql(f"SELECT * FROM {table} ORDER BY 1, 2").all()
+                      for table in ("account", "account_month", "month_hash")}
+            tables["transaction"] = conn.exec_driver_sql(
+                'SELECT _account_num, _date, _amt_cents, _exempt FROM "transaction" '
+                "ORDER BY _account_num, _id").all()
+        return tables
+
+    def test_close_matches_orm(self, engines):
+        orm, set_based = engines
+        with sessionmaker(bind=orm)() as session:
+            for acct in session.query(Bank).first().accounts:
+                try:
+                    acct.interest_and_fees(session)
+                except TransactionSequenceError:
+                    session.rollback()
+
+        result = month_end_close(set_based)
+
+        assert self.tables(set_based) == self.tables(orm)
+        assert result.accounts == 40 and result.fees > 0
+        with sessionmaker(bind=set_based)() as session:
+            assert merkle.ledger_digest(session) == merkle.ledger_digest(sessionmaker(bind=orm)())
+
+    def test_close_twice_closes_nothing(self, engines):
+        month_end_close(engines[0])
+        before = self.tables(engines[0])
+        assert month_end_close(engines[0]).accounts == 0
+        assert self.tables(engines[0]) == before
+
+    def test_interest_rounding(self):
+        # Account._interest multiplies in the 9-digit context before rounding to cents
+        assert interest_cents(12345, 0.029) == to_cents(Decimal("123.45") * Decimal(0.029))
+        assert interest_cents(-500, 0.0012) == to_cents(Decimal("-5.00") * Decimal(0.0012))
+
+
+class TestExport:
+
+    @pytest.fixture
+    def loaded(self, engine):
+        bulk_load(engine, WorkloadGenerator(seed=2, accounts=6, months=2))
+        return engine
+
+    def rows(self, engine, after=0) -> list:
+        with engine.connect() as conn:
+            return conn.exec_driver_sql(
+                'SELECT _id, _account_num, _date, _amt_cents, _exempt FROM "transaction" '
+                "WHERE _id > ? ORDER BY _date, _id", (after,)).all()
+
+    def test_csv(self, loaded):
+        out = io.BytesIO()
+        result = export(loaded, out, "csv", batch_size=7)
+        lines = out.getvalue().decode().splitlines()
+        assert lines[0] == "id,account,date,amount,exempt"
+        expected = [f"{tid},{num},{day},{from_cents(cents)},{exempt}"
+                    for tid, num, day, cents, exempt in self.rows(loaded)]
+        assert lines[1:] == expected and result.rows == len(expected)
+
+    def test_columns_in_account_order(self, loaded):
+        out = io.BytesIO()
+        export(loaded, out, "columns", order="account", batch_size=7)
+        out.seek(0)
+        blocks = list(read_columns(out))
+        assert max(len(block["id"]) for block in blocks) == 7
+        rows = [(tid, num, date.fromordinal(day).isoformat(), cents, exempt)
+                for block in blocks
+                for tid, num, day, cents, exempt in zip(*block.values())]
+        assert rows == sorted(self.rows(loaded), key=lambda row: (row[1], row[2], row[0]))
+
+    def test_incremental(self, loaded, session):
+        first = export(loaded, io.BytesIO())
+        acct = session.query(Bank).first().accounts[0]
+        acct.add_transaction("5", session, date="2030-01-01")
+
+        out = io.BytesIO()
+        second = export(loaded, out, after=first.watermark)
+        assert second.rows == 1 and second.watermark == first.watermark + 1
+        assert out.getvalue().decode().splitlines()[1].endswith(",2030-01-01,5.00,0")
+        assert export(loaded, io.BytesIO(), after=second.watermark).rows == 0
+
+
+class TestAccountLayouts:
+
+    def tables(self, engine) -> dict:
+        with engine.connect() as conn:
+            names = conn.exec_driver_sql("SELECT name FROM sqlite_master WHERE type = 'table' "
+                                         "ORDER BY name").scalars().all()
+            return {name: (conn.exec_driver_sql(f'PRAGMA table_info("{name}")').all(),
+                           conn.exec_driver_sql(f'SELECT * FROM "{name}" ORDER BY 1').all())
+                    for name in names}
+
+    def test_round_trip(self, tmp_path):
+        engine = create_engine(f"sqlite:///{tmp_path / 'bank.db'}")
+        upgrade(engine)
+        bulk_load(engine, WorkloadGenerator(seed=4, accounts=10, months=1))
+        joined = self.tables(engine)
+
+        with engine.begin() as conn:
+            assert convert(conn, "single")
+            assert not convert(conn, "single")
+        single = self.tables(engine)
+        assert "savingsaccount" not in single and "checkingaccount" not in single
+        assert len(single["account"][1]) == 10
+        with pytest.raises(LayoutError):
+            upgrade(engine)
+
+        with engine.begin() as conn:
+            assert convert(conn, "joined")
+        assert self.tables(engine) == joined
+
+    def test_unknown_layout_is_rejected(self):
+        with pytest.raises(ValueError, match="'joined' or 'single', not 'Single'"):
+            check_layout("Single")
+        result = subprocess.run([sys.executable, "-c", "import account"],
+                                cwd=Path(__file__).resolve().parent,
+                                env=dict(os.environ, PROJ3_ACCOUNT_LAYOUT="join"),
+                                capture_output=True, text=True)
+        assert result.returncode != 0
+        assert "PROJ3_ACCOUNT_LAYOUT must be 'joined' or 'single', not 'join'" in result.stderr
+
+    def test_single_layout_matches_joined(self, tmp_path):
+        # a process maps one layout, so the single layout runs in a subprocess
+        args = ["--model", "proj3", "--seed", "6", "--accounts", "8", "--months", "3"]
+        script = str(Path(__file__).resolve().parent / "replay.py")
+        for layout in ("joined", "single"):
+            subprocess.run([sys.executable, script, *args,
+                            "--database", f"sqlite:///{tmp_path / layout}.db"],
+                           env=dict(os.environ, PROJ3_ACCOUNT_LAYOUT=layout),
+                           capture_output=True, check=True)
+
+        single = create_engine(f"sqlite:///{tmp_path / 'single'}.db")
+        with single.begin() as conn:
+            assert convert(conn, "joined")
+        joined = self.tables(create_engine(f"sqlite:///{tmp_path / 'joined'}.db"))
+        assert self.tables(single) == joined
+
+
+class TestService:
+
+    @pytest.fixture
+    def server(self, tmp_path):
+        server = create_server(f"sqlite:///{tmp_path / 'bank.db'}", port=0, threads=4)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        yield server
+        server.shutdown()
+        server.server_close()
+
+    @pytest.fixture
+    def conn(self, server):
+        conn = http.client.HTTPConnection("127.0.0.1", server.server_port)
+        yield conn
+        conn.close()
+
+    def test_accounts_and_transactions(self, conn):
+        status, acct = call(conn, "POST", "/accounts", {"type": "savings"})
+        assert status == 201 and acct == {"num": 1, "type": "savings", "balance": "0.00"}
+        status, acct = call(conn, "POST", "/accounts/1/transactions",
+                            {"amount": "12.50", "date": "2030-01-02"})
+        assert status == 201 and acct["balance"] == "12.50"
+
+        assert call(conn, "GET", "/accounts/1") == (200, acct)
+        assert call(conn, "GET", "/accounts")[1] == {"count": 1, "accounts": [acct]}
+        status, page = call(conn, "GET", "/accounts/1/transactions")
+        assert page["transactions"] == [{"id": 1, "date": "2030-01-02", "amount": "12.50",
+                                         "exempt": False}]
+
+    def test_interest_matches_cli(self, conn):
+        # 12.50 * 0.0012 = 0.015 rounds up in the 9 digits of the CLI's context
+        call(conn, "POST", "/accounts", {"type": "checking"})
+        call(conn, "POST", "/accounts/1/transactions", {"amount": "12.50", "date": "2030-01-02"})
+        assert call(conn, "POST", "/accounts/1/interest") == (
+            200, {"num": 1, "type": "checking", "balance": "2.52"})
+        status, page = call(conn, "GET", "/accounts/1/transactions")
+        assert [trans["amount"] for trans in page["transactions"]] == ["12.50", "0.02", "-10.00"]
+
+    def test_structured_errors(self, conn):
+        call(conn, "POST", "/accounts", {"type": "checking"})
+        call(conn, "POST", "/accounts/1/transactions", {"amount": "100", "date": "2030-01-02"})
+
+        status, result = call(conn, "POST", "/accounts/1/transactions", {"amount": "-500"})
+        assert status == 409 and result["error"]["type"] == "OverdrawError"
+        assert call(conn, "POST", "/accounts/1/interest")[0] == 200
+        status, result = call(conn, "POST", "/accounts/1/interest")
+        assert status == 409 and result["error"] == {
+            "type": "TransactionSequenceError", "latest_date": "2030-01-31",
+            "message": "transactions must be dated from the latest date onward"}
+
+        assert call(conn, "GET", "/accounts/7")[0] == 404
+        assert call(conn, "POST", "/accounts/1/transactions", {"amount": "ten"})[0] == 400
+        assert call(conn, "POST", "/accounts", {"type": "bond"})[0] == 400
+
+    def test_concurrent_deposits(self, server, conn):
+        call(conn, "POST", "/accounts", {"type": "checking"})
+
+        def deposit() -> None:
+            client = http.client.HTTPConnection("127.0.0.1", server.server_port)
+            for _ in range(10):
+                assert call(client, "POST", "/accounts/1/transactions", {"amount": "1.25"})[0] == 201
+            client.close()
+
+        threads = [threading.Thread(target=deposit) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert call(conn, "GET", "/accounts/1")[1]["balance"] == "50.00"
+
+    def test_retries_while_busy(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'bank.db'}"
+        engine = create_engine(url, connect_args={"timeout": 0})  # busy errors at once
+        upgrade(engine)
+        service = BankService(engine)
+        service.run(lambda session, bank: bank.add_account("checking", session), write=True)
+
+        # another process holds the write lock for a moment
+        other = sqlite3.connect(tmp_path / "bank.db", isolation_level=None,
+                                check_same_thread=False)
+        other.execute("BEGIN IMMEDIATE")
+        threading.Timer(0.05, other.rollback).start()
+
+        result = service.run(add_transaction, "1", Decimal("5"), None, write=True)
+        assert result["balance"] == "5.00" and service.retries > 0
+        other.close()
+
+
+class TestHarness:
+
+    @pytest.fixture
+    def url(self, tmp_path):
+        url = f"sqlite:///{tmp_path / 'bench.db'}"
+        harness.seed_database(url, 20, 10, 0.5)
+        return url
+
+    def run(self, url):
+        bench = harness.Harness(url, samples=5)
+        results = bench.run()
+        bench.close()
+        return results
+
+    def test_seeded_paths_pass(self, url):
+        results = self.run(url)
+        assert {result.name for result in results} <= set(harness.CHECKS)
+        assert len(results) >= 6
+        assert harness.failures(results) == []
+        # every added transaction is dated in a new month, so runs repeat
+        assert harness.failures(self.run(url)) == []
+
+    def test_missing_index_fails(self, url):
+        engine = create_engine(url)
+        with engine.begin() as conn:
+            conn.exec_driver_sql("DROP INDEX ix_transaction_account_date")
+            conn.exec_driver_sql("DROP INDEX ix_transaction_account_page")
+        failed = harness.failures(self.run(url))
+        assert "transaction_page: query plan 'SCAN transaction'" in failed
+
+    def test_statement_threshold(self, url, monkeypatch):
+        monkeypatch.setitem(harness.CHECKS, "balance", harness.Check(0, ()))
+        assert harness.failures(self.run(url)) == [
+            "balance: 1 statements per call (at most 0)"]
+
+
+class TestAsyncBank:
+
+    @pytest.fixture
+    def run(self, tmp_path):
+        """Runs a coroutine function against an AsyncBank on a new database"""
+        pytest.importorskip("greenlet")
+        pytest.importorskip("aiosqlite")
+        from async_bank import AsyncBank
+
+        def run(func):
+            async def main():
+                bank = await AsyncBank.open(f"sqlite+aiosqlite:///{tmp_path / 'bank.db'}")
+                try:
+                    return await func(bank)
+                finally:
+                    await bank.close()
+            return asyncio.run(main())
+        return run
+
+    def test_operations(self, run):
+        async def scenario(bank):
+            num = await bank.add_account("checking")
+            await bank.add_transaction(num, "50", date="2023-01-05")
+            await bank.interest_and_fees(num)
+            return await bank.get_account(num), [row async for row in bank.summary()]
+        acct, rows = run(scenario)
+        assert str(acct) == "Checking#000000001,\tbalance: $40.06"
+        assert rows == [acct]
+
+    def test_rules_raise(self, run):
+        async def scenario(bank):
+            num = await bank.add_account("savings")
+            await bank.add_transaction(num, "50", date="2023-01-05")
+            with pytest.raises(OverdrawError):
+                await bank.add_transaction(num, "-60", date="2023-01-05")
+            await bank.add_transaction(num, "5", date="2023-01-05")
+            with pytest.raises(TransactionLimitError):
+                await bank.add_transaction(num, "5", date="2023-01-05")
+            with pytest.raises(KeyError):
+                await bank.add_transaction(num + 1, "5")
+        run(scenario)
+
+    def test_concurrent_clients(self, run):
+        async def client(bank, acct_type):
+            num = await bank.add_account(acct_type)
+            for day in range(1, 4):
+                await bank.add_transaction(num, "10", date=f"2023-01-{day:02}")
+            return num
+
+        async def scenario(bank):
+            nums = await asyncio.gather(*(client(bank, acct_type) for acct_type
+                                          in ("checking", "savings") * 10))
+            page = await bank.transaction_page(nums[0], size=2)
+            return nums, [row async for row in bank.summary()], page
+
+        nums, rows, page = run(scenario)
+        assert sorted(nums) == list(range(1, 21))
+        assert all(row.balance == Decimal("30.00") for row in rows)
+        assert [str(trans) for trans in page.transactions] == ["2023-01-01, $10.00",
+                                                               "2023-01-02, $10.00"]
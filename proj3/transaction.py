@@ -6,28 +6,68 @@ implements Transaction class to store transaction information
 
 # library modules
 from datetime import datetime, date
-from decimal import setcontext, BasicContext, Decimal
+from decimal import setcontext, BasicContext, Context, Decimal, ROUND_HALF_UP
 
 # SQL modules
-from sqlalchemy import Column, ForeignKey, Integer, Float, Boolean, Date
+from sqlalchemy import Column, ForeignKey, Integer, Boolean, Date, Index
+from sqlalchemy.ext.hybrid import hybrid_property
 
 # custom modules
 from db import Base
 
-# set Decimal context for rounding
+# set Decimal context for rounding (of the importing thread only: Decimal
+# contexts are per thread, so interest passes INTEREST explicitly)
 setcontext(BasicContext)
 
+# context of interest arithmetic in every thread (9 digits, as in proj2)
+INTEREST = BasicContext.copy()
+
+# exact context for cents conversions (BasicContext keeps only 9 digits)
+CENTS = Context(prec=28, rounding=ROUND_HALF_UP)
+
+
+def interest(balance: Decimal, rate: float) -> Decimal:
+    """Returns the interest of a balance at a rate, computed in the
+    INTEREST context whichever thread calls it (worker and service
+    threads do not inherit the main thread's context)"""
+    return INTEREST.multiply(balance, Decimal(rate))
+
+
+def to_cents(amount) -> int:
+    """Converts a dollar amount to whole cents (half away from zero)
+
+    Args:
+        amount (str, Decimal or int): dollar amount
+
+    Returns:
+        int: amount in cents
+    """
+    return int(Decimal(amount).scaleb(2, CENTS).to_integral_value(context=CENTS))
+
+
+def from_cents(cents: int) -> Decimal:
+    """Converts whole cents to an exact Decimal dollar amount"""
+    return Decimal(cents or 0).scaleb(-2, CENTS)
+
+
 class Transaction(Base):
     """Represents an individual transaction"""
 
     __tablename__ = "transaction"
 
     _id = Column(Integer, primary_key=True)
-    _amt = Column(Float)
+    _amt_cents = Column(Integer)
     _date = Column(Date)
     _exempt = Column(Boolean)
     _account_num = Column(Integer, ForeignKey("account._num"))
 
+    # serves the per-account date range and exempt filters of account rules
+    # and the (date, id) order of transaction pages
+    __table_args__ = (
+        Index("ix_transaction_account_date", "_account_num", "_date", "_exempt"),
+        Index("ix_transaction_account_page", "_account_num", "_date", "_id"),
+    )
+
     def __init__(self, amt, date=None, exempt=False) -> None:
         """
         Args:
@@ -45,6 +85,21 @@ class Transaction(Base):
     def __str__(self) -> str:
         return f"{self._date}, ${self._amt:,.2f}"
 
+    @hybrid_property
+    def _amt(self) -> Decimal:
+        """Dollar amount of the transaction (stored as integer cents)"""
+        return from_cents(self._amt_cents)
+
+    @_amt.setter
+    def _amt(self, amount) -> None:
+        self._amt_cents = to_cents(amount)
+
+    @_amt.expression
+    def _amt(cls):
+        """Dollar amount in SQL (for filters and ordering; sum _amt_cents
+        for exact aggregates)"""
+        return cls._amt_cents / 100.0
+
     def is_exempt(self) -> bool:
         """Check if transaction is exempt from limits"""
         return self._exempt
@@ -55,6 +110,12 @@ class Transaction(Base):
 
     date = property(_get_date)
 
+    def _get_key(self) -> tuple:
+        """Getter for the (date, id) position of a transaction in listings"""
+        return (self._date, self._id)
+
+    key = property(_get_key)
+
     def same_year(self, other):
         """Check if two transactions occur in same year"""
         return self.date.year == other.date.year
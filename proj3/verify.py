@@ -0,0 +1,72 @@
+"""
+verify module
+
+implements the command line for ledger hash trees (see merkle module)
+
+usage:
+    python verify.py digest [--database URL] [--level bank|accounts|months] [--accounts 1,2]
+    python verify.py diff pickle:../proj2/bank.pickle db:sqlite:///bank.db
+    python verify.py serve [--database URL]
+    python verify.py rebuild [--database URL]
+"""
+
+# library modules
+import sys
+import json
+from argparse import ArgumentParser
+
+# SQL modules
+from sqlalchemy import create_engine
+from sqlalchemy.orm.session import sessionmaker
+
+# custom modules
+from db import DATABASE
+from migrations import upgrade
+from merkle import DatabaseLedger, diff, ledger_digest, rebuild, serve
+
+
+def parse() -> dict:
+    """Parse the CLI arguments"""
+    parser = ArgumentParser(description="Maintain and compare ledger hash trees")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    digest_parser = subparsers.add_parser("digest", help="print the digest of a database")
+    digest_parser.add_argument("--database", default=DATABASE)
+    digest_parser.add_argument("--level", choices=["bank", "accounts", "months"], default="bank")
+    digest_parser.add_argument("--accounts", help="comma-separated account numbers")
+
+    serve_parser = subparsers.add_parser("serve", help="answer digest requests on stdin "
+                                                       "(used by diff)")
+    serve_parser.add_argument("--database", default=DATABASE)
+
+    rebuild_parser = subparsers.add_parser("rebuild", help="regenerate the month trees")
+    rebuild_parser.add_argument("--database", default=DATABASE)
+
+    diff_parser = subparsers.add_parser("diff", help="compare two ledgers")
+    diff_parser.add_argument("left", help="pickle:PATH or db:URL")
+    diff_parser.add_argument("right", help="pickle:PATH or db:URL")
+
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse()
+
+    if args.command == "diff":
+        differences = diff(args.left, args.right)
+        print("\n".join(differences) if differences else "ledgers match")
+        sys.exit(1 if differences else 0)
+
+    engine = create_engine(args.database)
+    upgrade(engine)
+    session = sessionmaker(bind=engine)()
+
+    if args.command == "rebuild":
+        rebuild(session)
+        session.commit()
+    elif args.command == "serve":
+        serve(DatabaseLedger(session))
+    else:
+        selected = {int(num) for num in args.accounts.split(",")} if args.accounts else None
+        print(json.dumps(ledger_digest(session, args.level, selected)))
+        session.commit()  # keep the refreshed roots
@@ -0,0 +1,202 @@
+"""
+worker module
+
+implements a background database worker for the proj3 GUI
+
+a DatabaseWorker thread owns its own session and runs submitted jobs one
+at a time, in order (while idle, it commits the pending batch of a
+GroupCommitSession once its max_delay has passed); results, errors and
+progress reports are queued back and delivered by poll(), which the GUI
+calls from its own thread
+(e.g. every few milliseconds with after()), so no query or commit ever
+runs on the GUI thread and no GUI call ever runs on the worker thread
+
+usage:
+    worker = DatabaseWorker(Session)
+    worker.submit(lambda session, job: session.scalar(query), on_done=print)
+    window.after(POLL_MS, poll)  # poll() calls worker.poll() and reschedules
+"""
+
+# library modules
+import time
+import queue
+import logging
+import threading
+
+# milliseconds between two polls of the GUI thread
+POLL_MS = 20
+
+# seconds between two progress reports of a job
+PROGRESS_INTERVAL = 0.1
+
+
+class Cancelled(Exception):
+    """Raised inside a job at a progress report after it was cancelled"""
+
+
+def _reraise(err: Exception) -> None:
+    """Default error callback: raises on the polling thread"""
+    raise err
+
+
+class Job:
+    """A function submitted to a DatabaseWorker
+
+    the function is called as func(session, job, *args); long functions
+    call job.progress(done, total) now and then, which reports progress
+    and is where a cancelled job stops (by raising Cancelled, so its
+    database transaction is rolled back)
+
+    constructor args:
+        worker (DatabaseWorker): worker the job is submitted to
+        func (callable): function run on the worker thread
+        args (tuple): extra arguments of func
+        on_done (callable): called with the result of func
+        on_error (callable): called with the exception raised by func
+        on_progress (callable): called with (done, total) progress reports
+    """
+
+    def __init__(self, worker, func, args, on_done, on_error, on_progress) -> None:
+        self._worker = worker
+        self._func = func
+        self._args = args
+        self._on_done = on_done
+        self._on_error = on_error
+        self._on_progress = on_progress
+        self._cancelled = threading.Event()
+        self._reported = 0.0
+
+    def cancel(self) -> None:
+        """Asks the job to stop at its next progress report (or not to start)"""
+        self._cancelled.set()
+
+    def _get_cancelled(self) -> bool:
+        """Getter for whether the job was cancelled"""
+        return self._cancelled.is_set()
+
+    cancelled = property(_get_cancelled)
+
+    def progress(self, done: int, total: int) -> None:
+        """Reports progress (at most every PROGRESS_INTERVAL seconds)
+
+        Raises:
+            Cancelled: the job was cancelled
+        """
+        if self.cancelled:
+            raise Cancelled
+        now = time.monotonic()
+        if self._on_progress is not None and (now - self._reported >= PROGRESS_INTERVAL
+                                              or done >= total):
+            self._reported = now
+            self._worker.post(self._on_progress, done, total)
+
+    def _run(self, session) -> None:
+        """Runs the job on the worker thread and posts its outcome"""
+        if self.cancelled:
+            self._worker.post(self._on_error, Cancelled())
+            return
+        try:
+            result = self._func(session, self, *self._args)
+        except Exception as err:
+            session.rollback()
+            if not isinstance(err, Cancelled):
+                logging.debug(f"Job failed with {type(err).__name__}: {repr(str(err))}")
+            self._worker.post(self._on_error, err)
+        else:
+            if self._on_done is not None:
+                self._worker.post(self._on_done, result)
+
+
+class DatabaseWorker:
+    """Thread running database jobs on its own session
+
+    constructor args:
+        session_factory (sessionmaker): factory of the worker's session
+    """
+
+    def __init__(self, session_factory) -> None:
+        self._session_factory = session_factory
+        self._jobs = queue.Queue()
+        self._results = queue.Queue()
+        self._thread = threading.Thread(target=self._serve, name="database-worker",
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, func, *args, on_done=None, on_error=None, on_progress=None) -> Job:
+        """Queues func(session, job, *args) to run on the worker thread
+
+        Args:
+            func (callable): function to run
+            args: extra arguments of func
+            on_done (callable, default=None): called with the result
+            on_error (callable, default=None): called with the exception
+                (by default the exception is raised again by poll())
+            on_progress (callable, default=None): called with (done, total)
+
+        Returns:
+            Job: the queued job (can be cancelled)
+        """
+        job = Job(self, func, args, on_done, on_error or _reraise, on_progress)
+        self._jobs.put(job)
+        return job
+
+    def post(self, callback, *args) -> None:
+        """Queues a callback for the polling thread (safe from any thread)"""
+        self._results.put((callback, args))
+
+    def poll(self) -> None:
+        """Runs the callbacks queued so far (call from the GUI thread)"""
+        while True:
+            try:
+                callback, args = self._results.get_nowait()
+            except queue.Empty:
+                return
+            callback(*args)
+
+    def close(self) -> None:
+        """Finishes the queued jobs and stops the worker thread"""
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _serve(self) -> None:
+        try:
+            session = self._session_factory()
+        except Exception as err:
+            # e.g. the database could not be opened: fail on the polling thread
+            self.post(_reraise, err)
+            return
+        try:
+            while True:
+                try:
+                    job = self._jobs.get(timeout=_until_deadline(session))
+                except queue.Empty:
+                    self._sync(session)
+                    continue
+                if job is None:
+                    # closing keeps the finished jobs of a group commit batch
+                    if hasattr(session, "sync"):
+                        self._sync(session, due_only=False)
+                    return
+                job._run(session)
+        finally:
+            session.close()
+
+    def _sync(self, session, due_only=True) -> None:
+        """Commits the pending batch of a GroupCommitSession (if it is due,
+        see batch module); a failed commit is rolled back and raised on the
+        polling thread"""
+        try:
+            if due_only:
+                session.sync_if_due()
+            else:
+                session.sync()
+        except Exception as err:
+            session.rollback()
+            self.post(_reraise, err)
+
+
+def _until_deadline(session) -> float:
+    """Seconds until the pending batch of a GroupCommitSession must be
+    committed (None, i.e. wait for the next job, for other sessions)"""
+    deadline = getattr(session, "deadline", None)
+    return None if deadline is None else max(deadline - time.monotonic(), 0)
@@ -0,0 +1,185 @@
+"""
+workload module
+
+implements a seeded generator of synthetic banking workloads
+
+operations target the Bank/Account interface shared by proj2 and proj3:
+    open: open an account and make its initial deposit
+    transaction: add a (possibly rejected) transaction to an account
+    interest: trigger interest and fees for an account
+
+accounts are referred to by slot (the order in which they were opened)
+so a workload can be replayed against a bank that already has accounts
+"""
+
+# library modules
+import json
+import random
+from calendar import monthrange
+from collections import namedtuple
+from datetime import date
+
+# operation kinds
+OPEN = "open"
+TRANSACTION = "transaction"
+INTEREST = "interest"
+
+# account types (match the strings accepted by Bank.add_account)
+SAVINGS = "savings"
+CHECKING = "checking"
+
+Operation = namedtuple("Operation", ["kind", "slot", "amount", "date", "acct_type"],
+                       defaults=[None])
+
+
+class WorkloadGenerator:
+    """Generates a reproducible stream of operations for a bank
+
+    constructor args:
+        seed (int): seed for the random number generator
+        accounts (int): number of accounts opened in the first month
+        months (int): number of months of activity
+        savings_ratio (float): fraction of accounts that are savings accounts
+        monthly_rate (float): mean number of transactions per account per month
+        burst (float): multiplier for activity in the last days of a month
+        overdraft_rate (float): fraction of withdrawals sized to overdraw
+        limit_rate (float): fraction of savings days with a burst of transactions
+        backdate_rate (float): fraction of transactions dated before the newest
+        start (date): first day of the workload
+    """
+
+    def __init__(self, seed=0, accounts=100, months=12, savings_ratio=0.5,
+                 monthly_rate=8.0, burst=3.0, overdraft_rate=0.05,
+                 limit_rate=0.05, backdate_rate=0.01, start=date(2022, 1, 1)) -> None:
+        self._rng = random.Random(seed)
+        self._accounts = accounts
+        self._months = months
+        self._savings_ratio = savings_ratio
+        self._monthly_rate = monthly_rate
+        self._burst = burst
+        self._overdraft_rate = overdraft_rate
+        self._limit_rate = limit_rate
+        self._backdate_rate = backdate_rate
+        self._start = start
+
+        # approximate balance per slot (used to size withdrawals)
+        self._balances: list = []
+        self._types: list = []
+
+    def __iter__(self):
+        return self.operations()
+
+    def operations(self):
+        """Yields the operations of the workload in chronological order"""
+        year, month = self._start.year, self._start.month
+        for _ in range(self._months):
+            yield from self._month(year, month)
+            year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+    def _month(self, year: int, month: int):
+        """Yields the operations for a single month"""
+        last_day = monthrange(year, month)[1]
+        first_day = 1
+        events = []
+
+        # all accounts are opened on the first day of the workload
+        if not self._types:
+            first_day = self._start.day
+            for slot in range(self._accounts):
+                acct_type = SAVINGS if self._rng.random() < self._savings_ratio else CHECKING
+                self._types.append(acct_type)
+                amount = self._amount(500)
+                self._balances.append(amount)
+                events.append((first_day, 0, Operation(OPEN, slot, f"{amount:.2f}",
+                                                       self._start, acct_type)))
+
+        # weight the last three days of the month by the burst factor
+        days = list(range(first_day, last_day + 1))
+        weights = [self._burst if day > last_day - 3 else 1 for day in days]
+
+        for slot, acct_type in enumerate(self._types):
+            count = self._poisson(self._monthly_rate)
+            for day in self._rng.choices(days, weights, k=count):
+                events.append((day, 1, self._transaction(slot, date(year, month, day))))
+
+            # savings accounts occasionally hit the daily limit
+            if acct_type == SAVINGS and self._rng.random() < self._limit_rate:
+                day = self._rng.choice(days)
+                for _ in range(3):
+                    events.append((day, 1, self._transaction(slot, date(year, month, day))))
+
+        events.sort(key=lambda event: event[:2])
+
+        # occasionally move a transaction before its predecessors
+        for index, (day, order, op) in enumerate(events):
+            if op.kind == TRANSACTION and day > first_day and self._rng.random() < self._backdate_rate:
+                events[index] = (day, order, op._replace(date=op.date.replace(day=first_day)))
+
+        for _, _, op in events:
+            yield op
+
+        # month-end interest and fees (occasionally requested twice)
+        month_end = date(year, month, last_day)
+        for slot in range(len(self._types)):
+            yield Operation(INTEREST, slot, None, month_end)
+            if self._rng.random() < self._backdate_rate:
+                yield Operation(INTEREST, slot, None, month_end)
+
+    def _transaction(self, slot: int, when: date) -> Operation:
+        """Creates a deposit or withdrawal for the account in the given slot"""
+        balance = self._balances[slot]
+        if self._rng.random() < 0.5 or balance <= 0:
+            amount = self._amount(200)
+        elif self._rng.random() < self._overdraft_rate:
+            amount = -(balance + self._amount(100))
+        else:
+            amount = -min(balance, self._amount(150))
+        self._balances[slot] = max(balance + amount, 0)
+        return Operation(TRANSACTION, slot, f"{amount:.2f}", when)
+
+    def _amount(self, mean: float) -> float:
+        """Returns a positive dollar amount around the given mean"""
+        return round(self._rng.lognormvariate(0, 0.75) * mean, 2)
+
+    def _poisson(self, mean: float) -> int:
+        """Returns a Poisson-distributed count with the given mean"""
+        count, total = 0, self._rng.expovariate(1)
+        while total < mean:
+            count += 1
+            total += self._rng.expovariate(1)
+        return count
+
+
+def dump(operations, file) -> None:
+    """Writes operations to a file, one JSON object per line"""
+    for op in operations:
+        record = op._asdict()
+        record["date"] = op.date.isoformat()
+        file.write(json.dumps(record) + "\n")
+
+
+def load(file):
+    """Yields operations from a file written by dump()"""
+    for line in file:
+        record = json.loads(line)
+        record["date"] = date.fromisoformat(record["date"])
+        yield Operation(**record)
+
+
+if __name__ == "__main__":
+    import sys
+    from argparse import ArgumentParser
+
+    parser = ArgumentParser(description="Generate a synthetic banking workload")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--accounts", type=int, default=100)
+    parser.add_argument("--months", type=int, default=12)
+    parser.add_argument("--savings-ratio", type=float, default=0.5)
+    parser.add_argument("--monthly-rate", type=float, default=8.0)
+    args = parser.parse_args()
+
+    dump(WorkloadGenerator(seed=args.seed,
+                           accounts=args.accounts,
+                           months=args.months,
+                           savings_ratio=args.savings_ratio,
+                           monthly_rate=args.monthly_rate), sys.stdout)